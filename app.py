@@ -1,25 +1,37 @@
+import atexit
+import copy
+import fcntl
+import glob
+import gzip
+import hashlib
 import hmac
 import html
+import http.client
+import importlib.util
 import json
+import mimetypes
 import os
 import subprocess
 import threading
 import time
+import unicodedata
 import uuid
 import ipaddress
 import socket
-from collections import deque
-from datetime import datetime, timedelta
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from urllib.parse import urlparse, parse_qs, quote
-from flask import Flask, request, jsonify, send_from_directory, send_file, render_template_string, abort, after_this_request, make_response, redirect, Response
+from urllib.parse import urlparse, parse_qs, parse_qsl, quote, urlencode
+from flask import Flask, request, jsonify, send_file, abort, make_response, redirect, Response
 import sys
 import zipfile
 import base64
+import bisect
+import heapq
 import re
 import urllib.request
 import urllib.error
-import tempfile
 import shutil
 import sqlite3
 import smtplib
@@ -41,30 +53,51 @@ os.makedirs(APPLE_MUSIC_TRACKS_DIR, exist_ok=True)
 _data_dir = Path(os.environ.get("YT_UI_STATE_DIR") or Path(__file__).parent)
 _data_dir.mkdir(parents=True, exist_ok=True)
 
-HISTORY_PATH = _data_dir / "history.json"
-JOBS_PATH    = _data_dir / "jobs.json"
+HISTORY_PATH = _data_dir / "history.json"  # legacy; migrated into HISTORY_DB on first start
+HISTORY_DB   = _data_dir / "history.db"
+JOBS_PATH    = _data_dir / "jobs.json"  # legacy; migrated into JOBS_DB on first start
+JOBS_DB      = _data_dir / "jobs.db"
 PAUSE_PATH   = _data_dir / "pause.json"
 LOG_DIR      = _data_dir / "job-logs"
 LOG_DIR.mkdir(exist_ok=True)
 
 # First-party page-view analytics. Server-side counts only — no cookies, no IP
 # storage — so it stays compatible with the "no user-tracking" privacy policy.
+# Requests only push (path, ts) onto an in-memory buffer; a writer thread flushes
+# it every PAGEVIEW_FLUSH_SECONDS in one transaction that appends the raw rows
+# (kept for the "recent" list) and bumps a (day, path) -> count rollup that the
+# dashboard aggregates from.
 ANALYTICS_DB = _data_dir / "analytics.db"
 _analytics_lock = threading.Lock()
 _TRACKED_PAGES = {"/", "/desktop/buy", "/desktop/redeem", "/trial", "/review", "/privacy", "/terms", "/troubleshooting"}
 PAGEVIEW_RETENTION_DAYS = 90
+PAGEVIEW_FLUSH_SECONDS = float(os.environ.get("YT_UI_PAGEVIEW_FLUSH_SECONDS", "2"))
+PAGEVIEW_BUFFER_MAX = 100_000  # past this (writer stuck), the oldest unflushed views are dropped
 
 def _analytics_conn():
     return sqlite3.connect(ANALYTICS_DB, timeout=5)
 
 def _init_analytics_db():
     with _analytics_lock, _analytics_conn() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
         conn.execute(
             "CREATE TABLE IF NOT EXISTS pageviews ("
             "id INTEGER PRIMARY KEY AUTOINCREMENT, "
             "path TEXT NOT NULL, created_at INTEGER NOT NULL)"
         )
         conn.execute("CREATE INDEX IF NOT EXISTS idx_pageviews_created ON pageviews(created_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pageview_daily ("
+            "day INTEGER NOT NULL, path TEXT NOT NULL, count INTEGER NOT NULL, "
+            "PRIMARY KEY (day, path)) WITHOUT ROWID"
+        )
+        # One-time backfill for databases that predate the rollup table.
+        if conn.execute("SELECT 1 FROM pageview_daily LIMIT 1").fetchone() is None:
+            conn.execute(
+                "INSERT INTO pageview_daily (day, path, count) "
+                "SELECT created_at - (created_at % 86400), path, COUNT(*) "
+                "FROM pageviews GROUP BY 1, 2"
+            )
 
 _init_analytics_db()
 
@@ -149,6 +182,7 @@ def set_review_status(review_id: int, status: str) -> bool:
     try:
         with _reviews_lock, _reviews_conn() as conn:
             conn.execute("UPDATE reviews SET status = ? WHERE id = ?", (status, review_id))
+        _invalidate_landing()
         return True
     except Exception:
         return False
@@ -159,7 +193,7 @@ def _stars(rating) -> str:
 
 def _render_reviews_html(reviews: list) -> str:
     """Build the approved-review cards as pre-escaped HTML (user-generated content,
-    so escape here and inject with |safe — autoescaping is on for render_template_string)."""
+    so escape here and inject with |safe — autoescaping is on for page templates)."""
     cards = []
     for rv in reviews:
         name = html.escape((rv.get("name") or "").strip() or "Anonymous")
@@ -174,26 +208,50 @@ def _render_reviews_html(reviews: list) -> str:
         )
     return "".join(cards)
 
+_pageview_buffer = deque(maxlen=PAGEVIEW_BUFFER_MAX)
+
 def _record_pageview(path: str):
+    _pageview_buffer.append((path, int(time.time())))
+
+def _flush_pageviews():
+    """Write everything buffered so far in one transaction."""
+    batch = []
+    try:
+        while True:
+            batch.append(_pageview_buffer.popleft())
+    except IndexError:
+        pass
+    if not batch:
+        return
+    rollup = Counter((path, ts - ts % 86400) for path, ts in batch)
     try:
         with _analytics_lock, _analytics_conn() as conn:
-            conn.execute(
-                "INSERT INTO pageviews (path, created_at) VALUES (?, ?)",
-                (path, int(time.time())),
+            conn.executemany("INSERT INTO pageviews (path, created_at) VALUES (?, ?)", batch)
+            conn.executemany(
+                "INSERT INTO pageview_daily (day, path, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(day, path) DO UPDATE SET count = count + excluded.count",
+                [(day, path, n) for (path, day), n in rollup.items()],
             )
     except Exception:
         pass
 
+def _pageview_writer():
+    while True:
+        time.sleep(PAGEVIEW_FLUSH_SECONDS)
+        _flush_pageviews()
+
 def _prune_pageviews():
     try:
         cutoff = int(time.time()) - PAGEVIEW_RETENTION_DAYS * 86400
         with _analytics_lock, _analytics_conn() as conn:
             conn.execute("DELETE FROM pageviews WHERE created_at < ?", (cutoff,))
+            conn.execute("DELETE FROM pageview_daily WHERE day < ?", (cutoff - cutoff % 86400,))
     except Exception:
         pass
 
 def _pageview_analytics() -> dict:
-    """Aggregate page-view counts for the admin dashboard."""
+    """Aggregate page-view counts for the admin dashboard from the daily rollups."""
+    _flush_pageviews()
     now = int(time.time())
     today_start = now - (now % 86400)          # UTC midnight today
     week_start = today_start - 6 * 86400       # last 7 days, inclusive
@@ -203,15 +261,13 @@ def _pageview_analytics() -> dict:
         conn = _analytics_conn()
         try:
             cur = conn.cursor()
-            out["total"] = cur.execute("SELECT COUNT(*) FROM pageviews").fetchone()[0]
-            out["today"] = cur.execute("SELECT COUNT(*) FROM pageviews WHERE created_at >= ?", (today_start,)).fetchone()[0]
-            out["week"] = cur.execute("SELECT COUNT(*) FROM pageviews WHERE created_at >= ?", (week_start,)).fetchone()[0]
-            out["month"] = cur.execute("SELECT COUNT(*) FROM pageviews WHERE created_at >= ?", (month_start,)).fetchone()[0]
-            rows = cur.execute(
-                "SELECT created_at - (created_at % 86400) AS day, COUNT(*) "
-                "FROM pageviews WHERE created_at >= ? GROUP BY day", (month_start,)
-            ).fetchall()
-            day_counts = {int(d): c for d, c in rows}
+            day_counts = {int(d): c for d, c in cur.execute(
+                "SELECT day, SUM(count) FROM pageview_daily GROUP BY day"
+            ).fetchall()}
+            out["total"] = sum(day_counts.values())
+            out["today"] = sum(c for d, c in day_counts.items() if d >= today_start)
+            out["week"] = sum(c for d, c in day_counts.items() if d >= week_start)
+            out["month"] = sum(c for d, c in day_counts.items() if d >= month_start)
             for i in range(29, -1, -1):
                 d = today_start - i * 86400
                 out["daily"].append({
@@ -221,7 +277,7 @@ def _pageview_analytics() -> dict:
             out["by_path"] = [
                 {"path": p, "count": c}
                 for p, c in cur.execute(
-                    "SELECT path, COUNT(*) AS c FROM pageviews WHERE created_at >= ? "
+                    "SELECT path, SUM(count) AS c FROM pageview_daily WHERE day >= ? "
                     "GROUP BY path ORDER BY c DESC", (month_start,)
                 ).fetchall()
             ]
@@ -240,24 +296,35 @@ def _pageview_analytics() -> dict:
 MAX_CONCURRENT_JOBS = int(os.environ.get("YT_UI_MAX_CONCURRENT", "3"))
 JOB_TTL_SECONDS = int(os.environ.get("YT_UI_JOB_TTL_SECONDS", str(60 * 60)))
 FILE_TTL_DAYS = float(os.environ.get("YT_UI_FILE_TTL_DAYS", "0"))  # 0 = disabled
+HISTORY_RETENTION_DAYS = float(os.environ.get("YT_UI_HISTORY_RETENTION_DAYS", "90"))  # 0 = keep forever
+HISTORY_MAX_ROWS = int(os.environ.get("YT_UI_HISTORY_MAX_ROWS", "50000"))  # 0 = no row cap
 VERSION = "1.3"
 COOKIES_PATH = os.environ.get("YT_UI_COOKIES") or ""
 COOKIES_PASSWORD = os.environ.get("YT_UI_COOKIES_PASSWORD") or ""
 MAX_QUEUE_DEPTH = int(os.environ.get("YT_UI_MAX_QUEUE", "10"))
 PER_IP_CONCURRENT = int(os.environ.get("YT_UI_PER_IP_CONCURRENT", "2"))
 PER_IP_HOURLY = int(os.environ.get("YT_UI_PER_IP_HOURLY", "20"))
+PER_IP_BURST = int(os.environ.get("YT_UI_PER_IP_BURST", str(max(1, PER_IP_HOURLY // 2))))
 MAX_PLAYLIST_TRACKS = int(os.environ.get("YT_UI_MAX_PLAYLIST_TRACKS", "50"))
 DISK_CAP_GB = float(os.environ.get("YT_UI_DISK_CAP_GB", "20"))
 GLOBAL_RATE_PER_MIN = int(os.environ.get("YT_UI_GLOBAL_RATE_PER_MIN", "120"))
+# Process role: "all" runs web + download workers in one process (in-memory
+# queue); "web" and "worker" split them over the shared queue in jobs.db — see
+# "Shared job queue" below.
+ROLE = os.environ.get("YT_UI_ROLE", "all").strip().lower()
+SHARED_QUEUE = ROLE in ("web", "worker")
+LEASE_SECONDS = float(os.environ.get("YT_UI_LEASE_SECONDS", "30"))
+SHARED_POLL_SECONDS = float(os.environ.get("YT_UI_SHARED_POLL_SECONDS", "1"))
+SHARED_MAX_ATTEMPTS = int(os.environ.get("YT_UI_SHARED_MAX_ATTEMPTS", "3"))
+# A "resolving" row this old at startup was left by a web process that died.
+SHARED_RESOLVE_STALE_SECONDS = 600
 SMTP_USER = os.environ.get("YT_UI_SMTP_USER", "")
 SMTP_PASS = os.environ.get("YT_UI_SMTP_PASS", "")
 ALERT_EMAIL = os.environ.get("YT_UI_ALERT_EMAIL", "")
 PROXY_URL = os.environ.get("YT_UI_PROXY", "")
 _ip_jobs_active: dict = {}
-_ip_recent: dict = {}
+_ip_last_seen: dict = {}  # ip -> time of its last admitted job or release
 _ip_lock = threading.Lock()
-_global_rate: dict = {}
-_global_rate_lock = threading.Lock()
 _last_cookie_alert: float = 0
 _cookie_alert_lock = threading.Lock()
 SPOTIFY_CLIENT_ID = os.environ.get("SPOTIFY_CLIENT_ID", "")
@@ -348,19 +415,7 @@ def _is_token_valid(token: str) -> bool:
         if exp and exp > now:
             return True
     try:
-        body = json.dumps({"token": token}).encode()
-        req = urllib.request.Request(
-            f"{PAYMENT_APP_URL}/payment/api/access/internal/token/check",
-            data=body,
-            headers={
-                "Content-Type": "application/json",
-                "x-internal-secret": TOKEN_INTERNAL_SECRET,
-                "x-forwarded-proto": "https",
-            },
-            method="POST",
-        )
-        with urllib.request.urlopen(req, timeout=3) as resp:
-            result = json.loads(resp.read())
+        result = _token_check(token)
     except Exception:
         return False
     if result.get("valid"):
@@ -373,52 +428,29 @@ def _consume_token(token: str) -> dict:
     if not token or not TOKEN_INTERNAL_SECRET:
         return {}
     try:
-        body = json.dumps({"token": token}).encode()
-        req = urllib.request.Request(
-            f"{PAYMENT_APP_URL}/payment/api/access/internal/token/use",
-            data=body,
-            headers={
-                "Content-Type": "application/json",
-                "x-internal-secret": TOKEN_INTERNAL_SECRET,
-                "x-forwarded-proto": "https",
-            },
-            method="POST",
-        )
-        with urllib.request.urlopen(req, timeout=3) as resp:
-            result = json.loads(resp.read())
+        result = _token_api("use", token)
     except Exception:
         return {}
     # Invalidate cached 'check' result so subsequent checks reflect new remaining.
     with _valid_token_cache_lock:
         _valid_token_cache.pop(token, None)
-    return result if isinstance(result, dict) else {}
+    _invalid_token_cache.pop(token)
+    return result
 
 def _check_token_status(token: str) -> dict:
     """Call the payment-app check endpoint and return the full JSON (valid, remaining, product, reason).
 
     Unlike _is_token_valid this exposes 'product' and 'reason', which the desktop
-    redeem flow needs. Not cached — the redeem page polls this to clear the
-    Stripe-redirect/webhook race, so it must see fresh state every call.
+    redeem flow needs. Valid answers are never cached — the redeem page polls this
+    to clear the Stripe-redirect/webhook race — and "not valid (yet)" answers only
+    for TOKEN_NEGATIVE_TTL, so activation shows up within a few polls.
     """
     if not token or not TOKEN_INTERNAL_SECRET:
         return {}
     try:
-        body = json.dumps({"token": token}).encode()
-        req = urllib.request.Request(
-            f"{PAYMENT_APP_URL}/payment/api/access/internal/token/check",
-            data=body,
-            headers={
-                "Content-Type": "application/json",
-                "x-internal-secret": TOKEN_INTERNAL_SECRET,
-                "x-forwarded-proto": "https",
-            },
-            method="POST",
-        )
-        with urllib.request.urlopen(req, timeout=3) as resp:
-            result = json.loads(resp.read())
+        return _token_check(token)
     except Exception:
         return {}
-    return result if isinstance(result, dict) else {}
 
 # Desktop installer builds — manifest maps each OS slot to a filename in a
 # builds dir. The paid app uses DESKTOP_BUILDS_DIR; the free trial uses
@@ -530,12 +562,321 @@ def _record_trial_signup_fallback(email: str):
 YT_DLP_BIN = shutil.which("yt-dlp") or "yt-dlp"
 FFMPEG_BIN = shutil.which("ffmpeg") or "ffmpeg"
 
-jobs = {}  # job_id -> {"status": "...", "log": "...", "file": "...", timestamps}
+class _JobWatchers:
+    """Wake-ups for /events streams. A stream watches the job ids it shows; each
+    watched id keeps a change counter, and notify(job_id) bumps it and wakes only
+    the streams waiting on that id. For ids nobody watches notify is one dict
+    lookup. QUEUE_KEY is notified on every status change, which is what moves
+    queue positions."""
+
+    QUEUE_KEY = "*queue*"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ticks = {}    # watched job id -> [change count, watcher count]
+        self._waiting = {}  # job id -> conditions of streams blocked in wait()
+
+    def watch(self, job_id: str):
+        with self._lock:
+            self._ticks.setdefault(job_id, [0, 0])[1] += 1
+
+    def unwatch(self, job_id: str):
+        with self._lock:
+            entry = self._ticks.get(job_id)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._ticks[job_id]
+
+    def notify(self, job_id):
+        if job_id not in self._ticks:
+            return
+        with self._lock:
+            entry = self._ticks.get(job_id)
+            if entry is not None:
+                entry[0] += 1
+                for cond in self._waiting.get(job_id, ()):
+                    cond.notify()
+
+    def _seen(self, job_ids) -> tuple:
+        return tuple(self._ticks[j][0] if j in self._ticks else 0 for j in job_ids)
+
+    def ticks(self, job_ids) -> tuple:
+        with self._lock:
+            return self._seen(job_ids)
+
+    def wait(self, job_ids, seen: tuple, timeout: float):
+        """Block until one of job_ids (all watched by the caller) changed since
+        seen = ticks(job_ids) was taken, or timeout passes."""
+        cond = threading.Condition(self._lock)
+        deadline = time.time() + timeout
+        with self._lock:
+            for j in job_ids:
+                self._waiting.setdefault(j, set()).add(cond)
+            try:
+                while self._seen(job_ids) == seen:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    cond.wait(remaining)
+            finally:
+                for j in job_ids:
+                    waiting = self._waiting.get(j)
+                    if waiting is not None:
+                        waiting.discard(cond)
+                        if not waiting:
+                            del self._waiting[j]
+
+
+_job_watchers = _JobWatchers()
+
+
+class _JobRecord(dict):
+    """A job's fields. Remembers which keys changed since the last save_jobs()
+    so only those are written. Mutating a nested value in place (e.g. appending
+    to a list) isn't seen; assign a new value instead."""
+
+    def __init__(self, data=(), owner=None, job_id=None):
+        super().__init__(data)
+        self.owner = owner
+        self.job_id = job_id
+        self.version = 0  # bumped on every change; /events uses it to skip idle ticks
+        self.dirty = set(self)
+        self._mark()
+
+    def _mark(self):
+        self.version += 1
+        if self.dirty and self.owner is not None:
+            self.owner.dirty_ids.add(self.job_id)
+        _job_watchers.notify(self.job_id)
+
+    def __setitem__(self, key, value):
+        if key == "status" and self.owner is not None:
+            self.owner._count(self.get("status"), -1)
+            self.owner._count(value, 1)
+            _job_watchers.notify(_JobWatchers.QUEUE_KEY)
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+        self._mark()
+        if key == "finished_at" and value and self.owner is not None:
+            self.owner._finished(self.job_id, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.dirty.add(key)
+        self._mark()
+
+    def pop(self, key, *default):
+        if key in self:
+            self.dirty.add(key)
+            self._mark()
+        return super().pop(key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def refresh(self, data: dict):
+        """Take the state another process saved, without marking it dirty. Fields
+        changed here and not saved yet keep the local value."""
+        changed = False
+        for key in [k for k in self if k not in data and k not in self.dirty and k not in _JOB_UNSAVED_FIELDS]:
+            super().__delitem__(key)
+            changed = True
+        for key, value in data.items():
+            if key in self.dirty or (key in self and self[key] == value):
+                continue
+            if key == "status" and self.owner is not None:
+                self.owner._count(self.get("status"), -1)
+                self.owner._count(value, 1)
+                _job_watchers.notify(_JobWatchers.QUEUE_KEY)
+            super().__setitem__(key, value)
+            changed = True
+            if key == "finished_at" and value and self.owner is not None:
+                self.owner._finished(self.job_id, value)
+        if changed:
+            self.version += 1
+            _job_watchers.notify(self.job_id)
+
+
+class _JobTable(dict):
+    """job_id -> _JobRecord. Tracks which jobs were changed or removed since the
+    last save_jobs(), keeps a per-status job count (count("running")), and calls
+    on_finished(job_id, finished_at) whenever a job gets a finish time."""
+
+    def __init__(self):
+        super().__init__()
+        self.dirty_ids = set()
+        self.deleted_ids = set()
+        self.status_counts = {}
+        self.on_finished = None
+
+    def _finished(self, job_id, finished_at):
+        if self.on_finished is not None:
+            self.on_finished(job_id, finished_at)
+
+    def _count(self, status, delta: int):
+        if status is not None:
+            self.status_counts[status] = self.status_counts.get(status, 0) + delta
+
+    def count(self, status: str) -> int:
+        return self.status_counts.get(status, 0)
+
+    def __setitem__(self, job_id, data):
+        old = self.get(job_id)
+        if old is not None:
+            self._count(old.get("status"), -1)
+        rec = _JobRecord(data, self, job_id)
+        self._count(rec.get("status"), 1)
+        super().__setitem__(job_id, rec)
+        self.deleted_ids.discard(job_id)
+        if rec.get("finished_at"):
+            self._finished(job_id, rec["finished_at"])
+
+    def __delitem__(self, job_id):
+        self._count(self[job_id].get("status"), -1)
+        super().__delitem__(job_id)
+        self.deleted_ids.add(job_id)
+        _job_watchers.notify(job_id)
+
+    def pop(self, job_id, *default):
+        if job_id in self:
+            self._count(self[job_id].get("status"), -1)
+            self.deleted_ids.add(job_id)
+            out = super().pop(job_id)
+            _job_watchers.notify(job_id)
+            return out
+        return super().pop(job_id, *default)
+
+    def load(self, job_id, data):
+        """Insert a record read back from the store, without marking it dirty."""
+        rec = _JobRecord(data, None, job_id)
+        rec.dirty.clear()
+        rec.owner = self
+        self._count(rec.get("status"), 1)
+        super().__setitem__(job_id, rec)
+        if rec.get("finished_at"):
+            self._finished(job_id, rec["finished_at"])
+
+    def detach(self, job_id):
+        """Stop counting and saving a job (its lease moved to another worker)."""
+        rec = self.get(job_id)
+        if rec is not None and rec.owner is self:
+            self._count(rec.get("status"), -1)
+            rec.owner = None
+        self.dirty_ids.discard(job_id)
+
+    def forget(self, job_id):
+        """Drop a job from memory without deleting it from the store."""
+        rec = super().pop(job_id, None)
+        if rec is not None and rec.owner is self:
+            self._count(rec.get("status"), -1)
+        self.dirty_ids.discard(job_id)
+
+
+class _JobQueue:
+    """FIFO of queued job ids that can tell how many jobs are ahead of one without
+    scanning. Every id gets a sequence number on entry (append: one past the
+    largest handed out, appendleft: one before the head), so a position is the
+    distance from the head minus the ids cancelled out of the middle in between,
+    which are kept in a small sorted list of holes."""
+
+    def __init__(self):
+        self._items = deque()
+        self._seq = {}
+        self._next = 0
+        self._holes = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __contains__(self, job_id):
+        return job_id in self._seq
+
+    def append(self, job_id):
+        self._seq[job_id] = self._next
+        self._next += 1
+        self._items.append(job_id)
+
+    def appendleft(self, job_id):
+        if not self._items:
+            return self.append(job_id)
+        self._seq[job_id] = self._seq[self._items[0]] - 1
+        self._items.appendleft(job_id)
+
+    def popleft(self):
+        job_id = self._items.popleft()
+        del self._seq[job_id]
+        self._trim()
+        return job_id
+
+    def remove(self, job_id):
+        self._items.remove(job_id)
+        bisect.insort(self._holes, self._seq.pop(job_id))
+        self._trim()
+
+    def position(self, job_id):
+        seq = self._seq.get(job_id)
+        if seq is None:
+            return None
+        return seq - self._seq[self._items[0]] - bisect.bisect_left(self._holes, seq)
+
+    def _trim(self):
+        # Only holes after the head matter; drop the ones the head has moved past.
+        if not self._items:
+            self._holes.clear()
+            return
+        del self._holes[:bisect.bisect_left(self._holes, self._seq[self._items[0]])]
+
+
+jobs = _JobTable()  # job_id -> {"status": "...", "log": "...", "file": "...", timestamps}
 jobs_lock = threading.RLock()
-job_sema = threading.Semaphore(MAX_CONCURRENT_JOBS)
+
+# A job's "log" is either a plain string (status messages) or, once output
+# starts streaming, a _JobLog ring buffer of the last LOG_TAIL_LINES lines.
+# Appends are O(1) under jobs_lock; the text is only joined when read, via
+# _log_text (also under jobs_lock, since a deque can't be iterated while it's
+# being appended to). The full output is in the per-job log file.
+LOG_TAIL_LINES = 120
+
+
+class _JobLog(deque):
+    def __init__(self, text: str = ""):
+        super().__init__(text.splitlines(), maxlen=LOG_TAIL_LINES)
+        self.appended = len(self)  # lines ever added, so readers can ask for just the new ones
+
+    def __str__(self):
+        return "\n".join(self)
+
+
+def _log_append(job: dict, text: str):
+    buf = job.get("log")
+    if not isinstance(buf, _JobLog):
+        buf = job["log"] = _JobLog(buf or "")
+    lines = text.splitlines() or [""]
+    buf.extend(lines)
+    buf.appended += len(lines)
+    _job_watchers.notify(getattr(job, "job_id", None))
+
+
+def _log_text(job: dict) -> str:
+    return str(job.get("log") or "")
 history_lock = threading.Lock()
-job_queue = deque()
+job_queue = _JobQueue()
 queue_cv = threading.Condition()
+# Run slots are counted under queue_cv: a pool worker only takes a job when one
+# is free, and run_job's finally hands it back with a notify, so nothing polls.
+_slots_in_use = 0
+_job_slots = set()  # job ids holding the run slot they were started with
+_wait_samples = deque(maxlen=200)  # recent queue waits (created_at -> started_at), seconds
 
 
 def _client_ip() -> str:
@@ -545,33 +886,243 @@ def _client_ip() -> str:
     return request.remote_addr or "unknown"
 
 
-def _disk_usage_gb(path: str) -> float:
-    total = 0
-    for root, _dirs, files in os.walk(path):
+# DOWNLOAD_DIR usage is tracked incrementally so the disk-cap check doesn't walk
+# the tree: run_job adds a finished job's outputs, file deletions subtract, and
+# cleanup_worker reconciles against a real walk every DISK_RECONCILE_SECONDS to
+# correct drift (partial files, manual deletes, files landing mid-walk). Sizes
+# are kept per path, so a file listed by several jobs (followers, a re-download
+# of the same video, a failed job's partial outputs) only counts once. Startup
+# reconciles synchronously, so the cap holds before the first job is admitted.
+# With the shared queue the sizes are mirrored into jobs.db (disk_files), since
+# download workers write the files and web processes enforce the cap.
+DISK_RECONCILE_SECONDS = max(60, int(os.environ.get("YT_UI_DISK_RECONCILE_SECONDS", "900")))
+_disk_lock = threading.Lock()
+_disk_sizes = {}  # path -> size in bytes as last counted
+_disk_bytes = 0
+_disk_reconciled_at = 0.0
+
+
+def _disk_track_paths(paths):
+    """Count newly written files towards DOWNLOAD_DIR usage, each path once."""
+    global _disk_bytes
+    sizes = {}
+    for p in paths:
+        if p:
+            try:
+                sizes[p] = os.path.getsize(p)
+            except OSError:
+                pass
+    with _disk_lock:
+        for p, size in sizes.items():
+            _disk_bytes += size - _disk_sizes.get(p, 0)
+            _disk_sizes[p] = size
+    _disk_shared_write(upserts=sizes.items())
+
+
+def _remove_download(path: str) -> bool:
+    """Delete a file under DOWNLOAD_DIR and take it off the usage count."""
+    global _disk_bytes
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    with _disk_lock:
+        _disk_bytes = max(0, _disk_bytes - _disk_sizes.pop(path, 0))
+    _disk_shared_write(deletes=[path])
+    return True
+
+
+def _disk_reconcile():
+    global _disk_sizes, _disk_bytes, _disk_reconciled_at
+    sizes = {}
+    for root, _dirs, files in os.walk(DOWNLOAD_DIR):
         for name in files:
             fp = os.path.join(root, name)
             try:
-                total += os.path.getsize(fp)
+                sizes[fp] = os.path.getsize(fp)
             except OSError:
                 pass
-    return total / (1024 ** 3)
+    with _disk_lock:
+        _disk_sizes = sizes
+        _disk_bytes = sum(sizes.values())
+        _disk_reconciled_at = time.time()
+    _disk_shared_write(upserts=sizes.items(), replace=True)
+
+
+def _disk_shared_write(upserts=(), deletes=(), replace=False):
+    """Shared queue only: apply size changes to the disk_files table."""
+    if not SHARED_QUEUE:
+        return
+    try:
+        conn = _queue_conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if replace:
+                conn.execute("DELETE FROM disk_files")
+            conn.executemany(
+                "INSERT INTO disk_files (path, size) VALUES (?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET size = excluded.size", list(upserts),
+            )
+            conn.executemany("DELETE FROM disk_files WHERE path = ?", [(p,) for p in deletes])
+            conn.execute("COMMIT")
+        finally:
+            conn.close()  # rolls back anything left uncommitted
+    except Exception:
+        pass
+
+
+def _disk_used_gb() -> float:
+    if SHARED_QUEUE:
+        try:
+            conn = _queue_conn()
+            try:
+                return conn.execute("SELECT COALESCE(SUM(size), 0) FROM disk_files").fetchone()[0] / (1024 ** 3)
+            finally:
+                conn.close()
+        except Exception:
+            pass  # fall back to this process's own count
+    with _disk_lock:
+        return _disk_bytes / (1024 ** 3)
+
+
+# ---- Rate limiting ----
+# GCRA (generic cell rate algorithm): each key keeps one number, its theoretical
+# arrival time (TAT). A limit of `rate` per `period` spaces requests by
+# T = period / rate and tolerates a burst of `rate`; a request is refused while
+# TAT - now > T * (rate - 1). That averages `rate` per period but lets a fresh
+# key take up to 2 * rate in its first period, so a limiter given a `burst`
+# instead spaces requests by T = period / (rate - burst + 1): `burst` at once,
+# then the rest of `rate` spread over the period, and never more than `rate` in
+# any window of `period` seconds. The per-IP hourly limit works that way
+# (PER_IP_BURST at once, PER_IP_HOURLY in any hour), like the fixed hourly
+# window it replaced. Keys whose TAT has passed carry no information
+# and are dropped. With YT_UI_RATE_BACKEND=sqlite the TATs live in a shared
+# ratelimit.db so limits hold across gunicorn workers; the default keeps them in
+# a dict in this process.
+RATE_BACKEND = os.environ.get("YT_UI_RATE_BACKEND", "memory").strip().lower()
+RATE_DB = _data_dir / "ratelimit.db"
+
+
+class _MemoryRateStore:
+    def __init__(self):
+        self._tat = {}
+        self._lock = threading.Lock()
+
+    def update(self, key: str, fn):
+        """Atomically apply fn(stored_tat or None) -> (new_tat or None, result)."""
+        with self._lock:
+            new_tat, result = fn(self._tat.get(key))
+            if new_tat is not None:
+                self._tat[key] = new_tat
+            return result
+
+    def get(self, key: str):
+        with self._lock:
+            return self._tat.get(key)
+
+    def prune(self, now: float):
+        with self._lock:
+            for key in [k for k, tat in self._tat.items() if tat <= now]:
+                del self._tat[key]
+
+
+class _SQLiteRateStore:
+    def __init__(self, path):
+        self.path = path
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_tat (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID"
+            )
+
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def update(self, key: str, fn):
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # serialises the read-modify-write across processes
+            row = conn.execute("SELECT tat FROM rate_tat WHERE key = ?", (key,)).fetchone()
+            new_tat, result = fn(row[0] if row else None)
+            if new_tat is not None:
+                conn.execute(
+                    "INSERT INTO rate_tat (key, tat) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tat = excluded.tat", (key, new_tat),
+                )
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get(self, key: str):
+        conn = self._conn()
+        try:
+            row = conn.execute("SELECT tat FROM rate_tat WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def prune(self, now: float):
+        conn = self._conn()
+        try:
+            conn.execute("DELETE FROM rate_tat WHERE tat <= ?", (now,))
+        finally:
+            conn.close()
+
+
+class _GCRALimiter:
+    def __init__(self, store, name: str, rate: int, period: float, burst: int = None):
+        self.store = store
+        self.name = name
+        rate = max(1, rate)
+        if burst is None:
+            self.interval = period / rate
+            self.tolerance = self.interval * (rate - 1)
+        else:
+            burst = min(max(1, burst), rate)
+            self.interval = period / (rate - burst + 1)
+            self.tolerance = self.interval * (burst - 1)
+
+    def allow(self, key: str):
+        """Take one request for key. Returns (allowed, retry_after_seconds)."""
+        now = time.time()
+
+        def step(tat):
+            tat = max(tat or now, now)
+            wait = tat - now - self.tolerance
+            if wait > 0:
+                return None, (False, wait)
+            return tat + self.interval, (True, 0.0)
+
+        try:
+            return self.store.update(f"{self.name}:{key}", step)
+        except Exception:
+            return True, 0.0  # never turn traffic away because the limiter store failed
+
+
+_rate_store = _SQLiteRateStore(RATE_DB) if RATE_BACKEND == "sqlite" else _MemoryRateStore()
+_global_limiter = _GCRALimiter(_rate_store, "g", GLOBAL_RATE_PER_MIN, 60)
+_hourly_limiter = _GCRALimiter(_rate_store, "h", PER_IP_HOURLY, 3600, burst=PER_IP_BURST)
 
 
 def _check_ip_limits(ip: str):
     """Returns (error_message, status_code) tuple or (None, None) if OK.
-    On success, increments the active counter and records the request timestamp."""
-    now = time.time()
-    hour_ago = now - 3600
+    On success, increments the active counter and takes one from the hourly limit."""
+    shared_active = _shared_ip_active(ip) if ROLE == "web" else 0
     with _ip_lock:
-        recent = _ip_recent.setdefault(ip, deque())
-        while recent and recent[0] < hour_ago:
-            recent.popleft()
-        if len(recent) >= PER_IP_HOURLY:
-            return (f"Hourly request limit reached ({PER_IP_HOURLY}/hr). Try again later.", 429)
-        if _ip_jobs_active.get(ip, 0) >= PER_IP_CONCURRENT:
+        if _ip_jobs_active.get(ip, 0) + shared_active >= PER_IP_CONCURRENT:
             return (f"Too many active jobs for your IP (max {PER_IP_CONCURRENT}). Wait for one to finish.", 429)
+        allowed, _ = _hourly_limiter.allow(ip)
+        if not allowed:
+            return (f"Hourly request limit reached ({PER_IP_HOURLY}/hr). Try again later.", 429)
         _ip_jobs_active[ip] = _ip_jobs_active.get(ip, 0) + 1
-        recent.append(now)
+        _ip_last_seen[ip] = time.time()
     return (None, None)
 
 
@@ -582,8 +1133,10 @@ def _release_ip(ip: str):
         current = _ip_jobs_active.get(ip, 0)
         if current <= 1:
             _ip_jobs_active.pop(ip, None)
+            _ip_last_seen.pop(ip, None)
         else:
             _ip_jobs_active[ip] = current - 1
+            _ip_last_seen[ip] = time.time()
 
 
 _COOKIE_ERROR_PATTERNS = [
@@ -1010,7 +1563,7 @@ ADMIN_HTML = """
 
     function statusBadge(s) {
       const cls = {done:'badge-done',error:'badge-error',cancelled:'badge-cancelled',
-                   running:'badge-running',queued:'badge-queued'}[s] || 'badge-cancelled';
+                   running:'badge-running',queued:'badge-queued',resolving:'badge-queued'}[s] || 'badge-cancelled';
       return '<span class="badge ' + cls + '">' + s + '</span>';
     }
 
@@ -3015,10 +3568,41 @@ async function start() {
   currentJob = data.job_id;
   _pollFailCount = 0;
   document.getElementById('cancelBtn').style.display = 'inline-block';
-  poll();
+  watchJob();
 }
 
 let _pollFailCount = 0;
+let _jobStream = null;
+
+// Follow the job over /events (SSE): "update" carries only the fields that
+// changed, "log" only the new log lines. If the stream is refused or drops,
+// fall back to polling /status.
+function watchJob() {
+  if (!window.EventSource) { poll(); return; }
+  const jobId = currentJob;
+  const state = {};
+  const es = new EventSource('/events/' + jobId);
+  _jobStream = es;
+  const stop = function () {
+    es.close();
+    if (_jobStream === es) _jobStream = null;
+  };
+  es.addEventListener('update', function (e) {
+    if (jobId !== currentJob) { stop(); return; }
+    Object.assign(state, JSON.parse(e.data));
+    if (renderJob(state)) stop();
+  });
+  es.addEventListener('log', function (e) {
+    if (jobId !== currentJob) { stop(); return; }
+    const lines = (state.log ? state.log.split('\n') : []).concat(JSON.parse(e.data).lines || []);
+    state.log = lines.slice(-120).join('\n');
+    renderJob(state);
+  });
+  es.onerror = function () {
+    stop();
+    if (jobId === currentJob) poll();
+  };
+}
 
 async function poll() {
   if (!currentJob) return;
@@ -3042,14 +3626,19 @@ async function poll() {
     setTimeout(poll, backoff);
     return;
   }
-  const phase = data.phase || (data.status === 'queued' ? 'Queued' : (data.status === 'running' ? 'Working…' : (data.status || '')));
+  if (!renderJob(data)) setTimeout(poll, 700);
+}
+
+// Draw a job's status; returns true once the job has finished.
+function renderJob(data) {
+  const phase = data.phase || (data.status === 'queued' ? 'Queued' : (data.status === 'resolving' ? 'Checking link' : (data.status === 'running' ? 'Working…' : (data.status || ''))));
   const note = data.phase_note || '';
   const errMsg = (data.status === 'error') ? (data.error_message || '') : '';
   const rawTail = lastMeaningfulLines(data.log || '', 3);
   renderPhase(phase, note || errMsg, rawTail);
   setStatus(data.status);
   updateProgress(data.status, data.log || '', data);
-  if ((data.type === 'spotify' || data.type === 'apple_music') && data.total_items > 0) {
+  if (data.total_items > 0) {
     const done = data.current_index || 0;
     const tot = data.total_items;
     const n = (data.output_paths || []).length;
@@ -3074,13 +3663,13 @@ async function poll() {
     document.getElementById('cancelBtn').style.display = 'none';
     showDlModal(data);
     setTimeout(resetUI, 1500);
-    return;
+    return true;
   }
   if (data.status === 'error' || data.status === 'cancelled') {
     document.getElementById('cancelBtn').style.display = 'none';
-    return;
+    return true;
   }
-  setTimeout(poll, 700);
+  return false;
 }
 
 function extractPercent(log) {
@@ -3098,7 +3687,13 @@ function updateProgress(status, log, data) {
   const bar = document.getElementById('progressBar');
   const text = document.getElementById('progressText');
   const label = document.getElementById('progressLabel');
-  if (status === 'queued') {
+  if (status === 'resolving') {
+    wrap.style.display = 'block';
+    bar.className = 'indeterminate';
+    bar.style.width = '';
+    label.textContent = '';
+    text.textContent = 'Looking up your link…';
+  } else if (status === 'queued') {
     wrap.style.display = 'block';
     bar.className = 'indeterminate';
     bar.style.width = '';
@@ -3111,7 +3706,7 @@ function updateProgress(status, log, data) {
     text.textContent = qText;
   } else if (status === 'running') {
     wrap.style.display = 'block';
-    if (data && (data.type === 'spotify' || data.type === 'apple_music') && data.total_items > 0) {
+    if (data && data.total_items > 0) {
       const pct = data.progress_pct || 0;
       const cur = (data.current_index || 0) + 1;
       const tot = data.total_items;
@@ -3120,7 +3715,8 @@ function updateProgress(status, log, data) {
       label.textContent = pct > 8 ? Math.round(pct) + '%' : '';
       text.textContent = cur + ' / ' + tot + ' tracks';
     } else {
-      const pct = extractPercent(log);
+      let pct = extractPercent(log);
+      if (pct === null && data.download_pct != null) pct = data.download_pct;
       if (pct !== null) {
         bar.className = '';
         bar.style.width = pct + '%';
@@ -3206,6 +3802,7 @@ function setStatus(status) {
   pill.textContent = status || 'idle';
   const colors = {
     queued:    ['rgba(191,155,58,0.15)',  '#bf9b3a'],
+    resolving: ['rgba(191,155,58,0.15)',  '#bf9b3a'],
     running:   ['rgba(219,82,166,0.15)',  '#db52a6'],
     done:      ['rgba(72,199,142,0.15)',  '#48c78e'],
     error:     ['rgba(255,107,107,0.15)', '#ff6b6b'],
@@ -3224,7 +3821,7 @@ async function cancel() {
     headers: {'Content-Type':'application/json'},
     body: JSON.stringify({job_id: currentJob})
   });
-  poll();
+  if (!_jobStream) poll();
 }
 </script>
 </body>
@@ -3886,7 +4483,8 @@ _DESKTOP_TRIAL_HTML = """<!doctype html>
 """
 
 
-def is_valid_url(url: str) -> bool:
+def _is_http_url(url: str) -> bool:
+    """Syntax-only check (no DNS): an http(s) URL with a hostname."""
     if not url:
         return False
     try:
@@ -3895,18 +4493,13 @@ def is_valid_url(url: str) -> bool:
         return False
     if parsed.scheme not in {"http", "https"} or not parsed.netloc:
         return False
-    hostname = (parsed.hostname or "").strip("[]")
-    if not hostname:
-        return False
-    try:
-        infos = socket.getaddrinfo(hostname, None)
-        for _, _, _, _, sockaddr in infos:
-            ip = ipaddress.ip_address(sockaddr[0])
-            if not ip.is_global:
-                return False
-    except (socket.gaierror, ValueError, OSError):
+    return bool((parsed.hostname or "").strip("[]"))
+
+def is_valid_url(url: str) -> bool:
+    if not _is_http_url(url):
         return False
-    return True
+    hostname = (urlparse(url).hostname or "").strip("[]").lower().rstrip(".")
+    return _host_is_public(hostname)
 
 def detect_soundcloud(url: str) -> bool:
     try:
@@ -3916,153 +4509,859 @@ def detect_soundcloud(url: str) -> bool:
     host = host.lower()
     return "soundcloud.com" in host or "on.soundcloud.com" in host
 
-def prune_jobs():
-    """Remove finished jobs older than TTL to keep memory bounded."""
-    cutoff = datetime.utcnow() - timedelta(seconds=JOB_TTL_SECONDS)
+def queue_position(job_id: str):
+    if ROLE == "web":
+        return _shared_position(job_id)
+    with queue_cv:
+        return job_queue.position(job_id)
+
+def _queued_count() -> int:
+    if ROLE == "web":
+        return _shared_queue_stats()[0]
+    with queue_cv:
+        return len(job_queue)
+
+def _running_count() -> int:
+    if ROLE == "web":
+        return _shared_queue_stats()[1]
     with jobs_lock:
-        old_ids = [
-            jid for jid, meta in jobs.items()
-            if meta.get("finished_at") and meta["finished_at"] < cutoff
-        ]
-        for jid in old_ids:
-            jobs.pop(jid, None)
+        return jobs.count("running")
 
-def queue_position(job_id: str):
+def _try_borrow_slot() -> bool:
+    """Take a spare run slot for an extra track process. Queued jobs always win:
+    nothing is lent out while job_queue (or, for a worker, the shared queue) is non-empty."""
+    global _slots_in_use
+    waiting = ROLE == "worker" and _shared_queue_stats()[0] > 0
     with queue_cv:
-        for idx, jid in enumerate(job_queue):
-            if jid == job_id:
-                return idx
-    return None
+        if waiting or job_queue or _slots_in_use >= MAX_CONCURRENT_JOBS:
+            return False
+        _slots_in_use += 1
+        return True
+
+def _release_slot():
+    """Return a run slot and wake one idle pool worker."""
+    global _slots_in_use
+    with queue_cv:
+        _slots_in_use = max(0, _slots_in_use - 1)
+        queue_cv.notify()
+
+def _release_job_slot(job_id: str):
+    """Return the run slot job_id was started with; a no-op once it has been returned."""
+    global _slots_in_use
+    with queue_cv:
+        if job_id not in _job_slots:
+            return
+        _job_slots.discard(job_id)
+        _slots_in_use = max(0, _slots_in_use - 1)
+        queue_cv.notify()
 
-def dispatcher():
+def _job_worker():
+    """Pool thread: sleeps on queue_cv until a job is queued and a slot is free."""
+    global _slots_in_use
     while True:
         with queue_cv:
-            while not job_queue:
+            while not job_queue or _slots_in_use >= MAX_CONCURRENT_JOBS:
                 queue_cv.wait()
-            job_id = None
-        # wait for available slot
-        if not job_sema.acquire(blocking=False):
-            time.sleep(0.1)
+            job_id = job_queue.popleft()
+            _slots_in_use += 1
+            _job_slots.add(job_id)
+        try:
+            run_job(job_id)
+        except Exception:
+            # Never let one bad job kill the worker, or keep its slot if run_job
+            # failed before handing it back.
+            app.logger.exception("run_job failed for job %s", job_id)
+            _release_job_slot(job_id)
+
+def _wait_stats() -> dict:
+    """Average / p95 queue wait over the most recent jobs, for /health."""
+    with queue_cv:
+        samples = sorted(_wait_samples)
+    if not samples:
+        return {"wait_avg_seconds": None, "wait_p95_seconds": None}
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return {
+        "wait_avg_seconds": round(sum(samples) / len(samples), 3),
+        "wait_p95_seconds": round(p95, 3),
+    }
+
+# ---- Expiry scheduler ----
+# Every job that gets a finished_at is put on a min-heap twice: its files are due
+# FILE_TTL_DAYS later and its record JOB_TTL_SECONDS later. One thread sleeps
+# until the earliest entry is due and handles exactly those. Entries are only
+# hints: when one fires, the job's current finished_at decides, so a job that
+# was re-finished or removed in the meantime is handled correctly. Files whose
+# job record expires first are re-queued by path. A job that was cancelled or
+# failed has its partial downloads (.part/.ytdl files and fragments of every
+# destination yt-dlp announced, kept in partial_paths) removed on the same
+# schedule as a finished job's outputs. A full DOWNLOAD_DIR walk for
+# true orphans (files no job knows about) runs only every
+# EXPIRY_RECONCILE_SECONDS.
+EXPIRY_RECONCILE_SECONDS = float(os.environ.get("YT_UI_EXPIRY_RECONCILE_SECONDS", str(6 * 3600)))
+_expiry_heap = []  # (due_ts, seq, kind, key); kind is "files"/"job" (key job_id) or "path"
+_expiry_seq = 0
+_expiry_cv = threading.Condition()
+
+
+def _utc_ts(dt: datetime) -> float:
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _expiry_push(due: float, kind: str, key: str):
+    global _expiry_seq
+    with _expiry_cv:
+        _expiry_seq += 1
+        heapq.heappush(_expiry_heap, (due, _expiry_seq, kind, key))
+        if _expiry_heap[0][1] == _expiry_seq:
+            _expiry_cv.notify()  # new earliest entry: re-arm the sleeper
+
+
+def _schedule_job_expiry(job_id: str, finished_at):
+    if not isinstance(finished_at, datetime):
+        return
+    ts = _utc_ts(finished_at)
+    if FILE_TTL_DAYS > 0:
+        _expiry_push(ts + FILE_TTL_DAYS * 86400, "files", job_id)
+    _expiry_push(ts + JOB_TTL_SECONDS, "job", job_id)
+
+
+if ROLE != "worker":
+    jobs.on_finished = _schedule_job_expiry
+
+
+def _remove_expired_file(path: str):
+    """Delete an expired download, then any directories it leaves empty."""
+    if not path or not _remove_download(path):
+        return
+    root = os.path.realpath(DOWNLOAD_DIR)
+    parent = os.path.dirname(os.path.realpath(path))
+    while parent != root and os.path.commonpath([parent, root]) == root:
+        try:
+            os.rmdir(parent)  # fails (and stops the climb) once a directory isn't empty
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+
+
+def _note_destination(job: dict, line: str):
+    """Remember a file yt-dlp announced it is writing, so a cancelled or failed
+    job's leftovers can be expired. Caller holds jobs_lock."""
+    if "Destination:" not in line:
+        return
+    dest = line.split("Destination:", 1)[-1].strip()
+    if os.path.isabs(dest) and dest not in job.get("partial_paths", ()):
+        job["partial_paths"] = job.get("partial_paths", []) + [dest]
+
+
+def _job_files(job: dict) -> list:
+    """Paths to delete when a job's files expire: its outputs, plus whatever a
+    cancelled or failed run (or failed collection track) left behind for each
+    announced destination."""
+    paths = [p for p in (job.get("output_paths") or [job.get("output_path")]) if p]
+    if job.get("status") != "done" or job.get("failures"):
+        for dest in job.get("partial_paths") or ():
+            paths.extend(p for p in glob.glob(glob.escape(dest) + "*") if p not in paths)
+    return paths
+
+
+def _paths_in_use(now: float) -> set:
+    """Output paths still owned by a live job whose files haven't expired yet
+    (single-flight followers share their leader's files). Caller holds jobs_lock."""
+    keep = set()
+    for job in jobs.values():
+        finished = job.get("finished_at")
+        if isinstance(finished, datetime) and _utc_ts(finished) + FILE_TTL_DAYS * 86400 <= now:
             continue
-        with queue_cv:
-            if job_queue:
-                job_id = job_queue.popleft()
-            else:
-                job_sema.release()
+        keep.update(p for p in (job.get("output_paths") or [job.get("output_path")]) if p)
+    return keep
+
+
+def _run_expiry(due_entries: list):
+    now = time.time()
+    expired_jobs, files = [], []
+    with jobs_lock:
+        for _due, _seq, kind, key in due_entries:
+            if kind == "path":
+                files.append(key)
+                continue
+            job = jobs.get(key)
+            finished = job.get("finished_at") if job else None
+            if not isinstance(finished, datetime):
                 continue
-        threading.Thread(target=run_job, args=(job_id,), daemon=True).start()
+            paths = _job_files(job)
+            if kind == "files":
+                due = _utc_ts(finished) + FILE_TTL_DAYS * 86400
+                if due > now:
+                    _expiry_push(due, kind, key)  # finished again since this was queued
+                else:
+                    files.extend(paths)
+            else:
+                due = _utc_ts(finished) + JOB_TTL_SECONDS
+                if due > now:
+                    _expiry_push(due, kind, key)
+                    continue
+                jobs.pop(key, None)
+                expired_jobs.append(key)
+                files_due = _utc_ts(finished) + FILE_TTL_DAYS * 86400
+                if FILE_TTL_DAYS > 0 and files_due > now:
+                    for p in paths:
+                        _expiry_push(files_due, "path", p)
+        if files:
+            keep = _paths_in_use(now)
+            files = [p for p in files if p not in keep]
+    for p in files:
+        _remove_expired_file(p)
+    for jid in expired_jobs:
+        try:
+            job_log_path(jid).unlink(missing_ok=True)
+        except Exception:
+            pass
+    if expired_jobs:
+        save_jobs()
 
-def cleanup_worker():
-    while True:
-        time.sleep(30)
 
-        # File TTL: delete downloaded files first so job metadata still points at them
-        if FILE_TTL_DAYS > 0:
-            file_cutoff = datetime.utcnow() - timedelta(days=FILE_TTL_DAYS)
-            with jobs_lock:
-                snapshot = list(jobs.values())
-            for job in snapshot:
-                finished = job.get("finished_at")
-                if finished and finished < file_cutoff:
-                    for p in (job.get("output_paths") or [job.get("output_path")]):
-                        if p and os.path.exists(p):
-                            try:
-                                os.remove(p)
-                            except OSError:
-                                pass
+def _expiry_worker():
+    while True:
+        with _expiry_cv:
+            while not _expiry_heap or _expiry_heap[0][0] > time.time():
+                _expiry_cv.wait(_expiry_heap[0][0] - time.time() if _expiry_heap else None)
+            now = time.time()
+            due_entries = []
+            while _expiry_heap and _expiry_heap[0][0] <= now:
+                due_entries.append(heapq.heappop(_expiry_heap))
+        try:
+            _run_expiry(due_entries)
+        except Exception:
+            pass
 
-            # Orphan sweep: any file in DOWNLOAD_DIR older than TTL, regardless of jobs state
-            ttl_seconds = FILE_TTL_DAYS * 86400
-            now_ts = time.time()
-            for root, _dirs, files in os.walk(DOWNLOAD_DIR):
-                for name in files:
-                    fp = os.path.join(root, name)
-                    try:
-                        if now_ts - os.path.getmtime(fp) > ttl_seconds:
-                            os.remove(fp)
-                    except OSError:
-                        pass
 
-        # Job TTL: prune expired job records
-        cutoff = datetime.utcnow() - timedelta(seconds=JOB_TTL_SECONDS)
-        removed = False
-        with jobs_lock:
-            expired = [jid for jid, meta in jobs.items() if meta.get("finished_at") and meta["finished_at"] < cutoff]
-            for jid in expired:
-                jobs.pop(jid, None)
-                removed = True
-        for jid in expired:
+def _reconcile_expired_files():
+    """Slow safety net: remove files older than the TTL that no schedule covered
+    (left over from before a restart, or written outside any job), and empty
+    directories."""
+    if FILE_TTL_DAYS <= 0:
+        return
+    ttl_seconds = FILE_TTL_DAYS * 86400
+    now_ts = time.time()
+    for root, _dirs, files in os.walk(DOWNLOAD_DIR, topdown=False):
+        for name in files:
+            fp = os.path.join(root, name)
             try:
-                job_log_path(jid).unlink(missing_ok=True)
-            except Exception:
+                if now_ts - os.path.getmtime(fp) > ttl_seconds:
+                    _remove_download(fp)
+            except OSError:
                 pass
-        if removed:
-            save_jobs()
+        if root != DOWNLOAD_DIR:
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+        time.sleep(0.001)  # stay in the background next to request threads
+
+
+def cleanup_worker():
+    last_reconcile = 0.0
+    while True:
+        time.sleep(30)
+
+        if time.time() - last_reconcile >= EXPIRY_RECONCILE_SECONDS:
+            last_reconcile = time.time()
+            _reconcile_expired_files()
+
+        if time.time() - _disk_reconciled_at >= DISK_RECONCILE_SECONDS:
+            _disk_reconcile()
 
         # Sweep stale IP tracking entries (#14)
         with _ip_lock:
-            stale_ips = [ip for ip, ts in _ip_recent.items() if not ts or ts[-1] < time.time() - 3600]
-            for ip in stale_ips:
-                _ip_recent.pop(ip, None)
+            # Safety net for a leaked active count: drop it once the IP has
+            # admitted or finished nothing for an hour.
+            hour_ago = time.time() - 3600
+            for ip in [ip for ip in _ip_jobs_active if _ip_last_seen.get(ip, 0) < hour_ago]:
                 _ip_jobs_active.pop(ip, None)
-        with _global_rate_lock:
-            stale_gr = [ip for ip, ts in _global_rate.items() if not ts or ts[-1] < time.time() - 120]
-            for ip in stale_gr:
-                _global_rate.pop(ip, None)
-
-        # Clean empty subdirectories (#15)
-        if FILE_TTL_DAYS > 0:
-            for root, dirs, files in os.walk(DOWNLOAD_DIR, topdown=False):
-                if root != DOWNLOAD_DIR and not os.listdir(root):
-                    try:
-                        os.rmdir(root)
-                    except OSError:
-                        pass
+                _ip_last_seen.pop(ip, None)
+        try:
+            _rate_store.prune(time.time())
+        except Exception:
+            pass
 
-        # Drop page-view rows past the retention window
+        # Drop page-view and history rows past the retention window
         _prune_pageviews()
+        _prune_history()
+
+# Finished-job history: append-only rows in history.db. type and final_status
+# are columns so /history can filter and page (keyset on id) through indexes
+# without reading the whole table. Retention is HISTORY_RETENTION_DAYS /
+# HISTORY_MAX_ROWS, enforced by cleanup_worker.
+def _history_conn():
+    return sqlite3.connect(HISTORY_DB, timeout=5)
+
+def _init_history_db():
+    with history_lock, _history_conn() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT, type TEXT, "
+            "final_status TEXT, created_at INTEGER NOT NULL, record TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_type ON history(type, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_status ON history(final_status, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_created ON history(created_at)")
+        # One-time import of the old history.json (oldest first, so ids keep its order).
+        if HISTORY_PATH.exists() and not conn.execute("SELECT 1 FROM history LIMIT 1").fetchone():
+            try:
+                with HISTORY_PATH.open("r", encoding="utf-8") as f:
+                    legacy = json.load(f)
+                conn.executemany(
+                    "INSERT INTO history (job_id, type, final_status, created_at, record) VALUES (?, ?, ?, ?, ?)",
+                    [_history_row(r) for r in legacy if isinstance(r, dict)],
+                )
+                HISTORY_PATH.rename(HISTORY_PATH.with_suffix(".json.migrated"))
+            except Exception:
+                pass
 
-def load_history() -> list:
-    if not HISTORY_PATH.exists():
-        return []
+def _history_row(record: dict) -> tuple:
+    ts = _parse_dt(record.get("timestamp"))
+    created = int(ts.replace(tzinfo=timezone.utc).timestamp()) if ts else int(time.time())
+    return (record.get("job_id"), record.get("type"), record.get("final_status"), created, json.dumps(record))
+
+def append_history(record: dict):
     try:
-        with HISTORY_PATH.open("r", encoding="utf-8") as f:
-            return json.load(f)
+        with history_lock, _history_conn() as conn:
+            conn.execute(
+                "INSERT INTO history (job_id, type, final_status, created_at, record) VALUES (?, ?, ?, ?, ?)",
+                _history_row(record),
+            )
     except Exception:
-        return []
+        pass
 
-def append_history(record: dict):
-    with history_lock:
-        items = load_history()
-        items.append(record)
-        # cap to last 500
-        items = items[-500:]
+def query_history(limit: int = 10, before: int = None, job_type: str = None, final_status: str = None):
+    """Newest-first history records, plus the cursor for the next (older) page."""
+    where, args = [], []
+    if before:
+        where.append("id < ?")
+        args.append(before)
+    if job_type:
+        where.append("type = ?")
+        args.append(job_type)
+    if final_status:
+        where.append("final_status = ?")
+        args.append(final_status)
+    sql = "SELECT id, record FROM history"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    args.append(limit)
+    try:
+        conn = _history_conn()
         try:
-            with HISTORY_PATH.open("w", encoding="utf-8") as f:
-                json.dump(items, f, indent=2)
-        except Exception:
+            rows = conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+    except Exception:
+        return [], None
+    items = []
+    for _id, raw in rows:
+        try:
+            items.append(json.loads(raw))
+        except ValueError:
             pass
+    next_before = rows[-1][0] if len(rows) == limit else None
+    return items, next_before
 
-def load_jobs() -> dict:
-    if not JOBS_PATH.exists():
-        return {}
+def _history_counts() -> dict:
+    out = {"total": 0, "by_status": {}, "by_type": {}}
     try:
-        with JOBS_PATH.open("r", encoding="utf-8") as f:
-            return json.load(f)
+        conn = _history_conn()
+        try:
+            out["total"] = conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+            out["by_status"] = dict(conn.execute(
+                "SELECT COALESCE(final_status, 'unknown'), COUNT(*) FROM history GROUP BY final_status"
+            ).fetchall())
+            out["by_type"] = dict(conn.execute(
+                "SELECT COALESCE(type, 'unknown'), COUNT(*) FROM history GROUP BY type"
+            ).fetchall())
+        finally:
+            conn.close()
     except Exception:
-        return {}
+        pass
+    return out
 
-def save_jobs():
-    with jobs_lock:
-        meta = {jid: {k: v for k, v in data.items() if k != "log"} for jid, data in jobs.items()}
+def _prune_history():
     try:
-        with JOBS_PATH.open("w", encoding="utf-8") as f:
-            json.dump(meta, f, indent=2, default=str)
+        with history_lock, _history_conn() as conn:
+            if HISTORY_RETENTION_DAYS > 0:
+                cutoff = int(time.time() - HISTORY_RETENTION_DAYS * 86400)
+                conn.execute("DELETE FROM history WHERE created_at < ?", (cutoff,))
+            if HISTORY_MAX_ROWS > 0:
+                conn.execute(
+                    "DELETE FROM history WHERE id <= "
+                    "(SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (HISTORY_MAX_ROWS,),
+                )
     except Exception:
         pass
 
-def job_log_path(job_id: str) -> Path:
-    return LOG_DIR / f"{job_id}.log"
+# Job records live in a WAL-mode SQLite table, one row per job with the fields
+# as a JSON object. save_jobs() writes only the jobs (and, via json_set, only
+# the top-level fields) that changed since the last call, so its cost no longer
+# grows with the number of retained jobs, and a crash can't leave a half-written
+# file. finished_at is mirrored into an indexed column so a restart reads only
+# the jobs still inside JOB_TTL_SECONDS.
+_jobs_db_lock = threading.Lock()
+_jobs_writer = None  # long-lived connection for save_jobs, used under _jobs_db_lock
+_JOB_UNSAVED_FIELDS = ("log", "process", "processes")
+
+def _jobs_conn():
+    conn = sqlite3.connect(JOBS_DB, timeout=5)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _init_jobs_db():
+    with _jobs_db_lock, _jobs_conn() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT, data TEXT NOT NULL, finished_at REAL)"
+        )
+        backfill = False
+        if "finished_at" not in [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]:
+            conn.execute("ALTER TABLE jobs ADD COLUMN finished_at REAL")
+            backfill = True
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            "job_id TEXT PRIMARY KEY, seq INTEGER NOT NULL, client_ip TEXT, owner TEXT, "
+            "lease_until REAL NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, "
+            "cancel INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_seq ON queue(seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_ip ON queue(client_ip)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS disk_files (path TEXT PRIMARY KEY, size INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        # One-time import of the old jobs.json.
+        if JOBS_PATH.exists() and not conn.execute("SELECT 1 FROM jobs LIMIT 1").fetchone():
+            try:
+                with JOBS_PATH.open("r", encoding="utf-8") as f:
+                    legacy = json.load(f)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO jobs (job_id, status, data) VALUES (?, ?, ?)",
+                    [(jid, meta.get("status"), json.dumps(meta, default=str)) for jid, meta in legacy.items()],
+                )
+                JOBS_PATH.rename(JOBS_PATH.with_suffix(".json.migrated"))
+                backfill = True
+            except Exception:
+                pass
+        if backfill:
+            # Stored datetimes are naive UTC strings, which strftime reads as UTC.
+            conn.execute(
+                "UPDATE jobs SET finished_at = CAST(strftime('%s', json_extract(data, '$.finished_at')) AS REAL) "
+                "WHERE finished_at IS NULL AND json_extract(data, '$.finished_at') IS NOT NULL"
+            )
+
+_init_jobs_db()
+
+def _job_upsert(conn, job_id: str, status, patch: dict):
+    """Insert a job row, or set just the patch's top-level fields on an existing one.
+    A nested value (a list, or a dict like spotify_info) replaces the stored one
+    whole, and None is stored as null rather than deleting the field."""
+    finished = patch.get("finished_at")
+    if isinstance(finished, str):
+        finished = _parse_dt(finished)
+    finished_ts = _utc_ts(finished) if isinstance(finished, datetime) else None
+    paths, values = [], []
+    for key, value in patch.items():
+        paths.append(f"'$.\"{key}\"', json(?)")
+        values.append(json.dumps(value, default=str))
+    conn.execute(
+        "INSERT INTO jobs (job_id, status, data, finished_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(job_id) DO UPDATE SET status = excluded.status, "
+        f"data = json_set(jobs.data, {', '.join(paths)}), "
+        "finished_at = CASE WHEN ? THEN excluded.finished_at ELSE jobs.finished_at END",
+        (job_id, status, json.dumps(patch, default=str), finished_ts, *values, "finished_at" in patch),
+    )
+
+def load_jobs() -> dict:
+    """Jobs still inside JOB_TTL_SECONDS (or unfinished), read through the
+    finished_at index; older rows would only be expired again, so they're deleted."""
+    cutoff = time.time() - JOB_TTL_SECONDS
+    try:
+        with _jobs_db_lock, _jobs_conn() as conn:
+            conn.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+            rows = conn.execute(
+                "SELECT job_id, data FROM jobs WHERE finished_at IS NULL OR finished_at >= ?", (cutoff,)
+            ).fetchall()
+    except Exception:
+        return {}
+    out = {}
+    for jid, data in rows:
+        try:
+            out[jid] = json.loads(data)
+        except ValueError:
+            pass
+    return out
+
+def save_jobs():
+    """Upsert the changed fields of changed jobs and delete removed ones. Rows are
+    built under jobs_lock; the write happens after it's released."""
+    global _jobs_writer
+    with jobs_lock:
+        rows = []
+        dirty_ids, jobs.dirty_ids = jobs.dirty_ids, set()
+        for jid in dirty_ids:
+            rec = jobs.get(jid)
+            if rec is None:
+                continue
+            changed, rec.dirty = rec.dirty, set()
+            patch = {k: rec.get(k) for k in changed if k not in _JOB_UNSAVED_FIELDS}
+            if patch:
+                # Round-trip to plain JSON so nested values are copied before the lock drops.
+                rows.append((jid, rec.get("status"), json.loads(json.dumps(patch, default=str))))
+        deleted_ids, jobs.deleted_ids = jobs.deleted_ids, set()
+        deleted = [(jid,) for jid in deleted_ids]
+        if not rows and not deleted:
+            return
+        # Taken before jobs_lock is let go, so concurrent flushes land in the
+        # order their snapshots were taken.
+        _jobs_db_lock.acquire()
+    try:
+        if _jobs_writer is None:
+            _jobs_writer = sqlite3.connect(JOBS_DB, timeout=5, check_same_thread=False)
+            _jobs_writer.execute("PRAGMA synchronous=NORMAL")
+        with _jobs_writer:
+            for jid, status, patch in rows:
+                _job_upsert(_jobs_writer, jid, status, patch)
+            _jobs_writer.executemany("DELETE FROM jobs WHERE job_id = ?", deleted)
+    except Exception:
+        pass
+    finally:
+        _jobs_db_lock.release()
+
+def job_log_path(job_id: str) -> Path:
+    return LOG_DIR / f"{job_id}.log"
+
+
+# ---- Shared job queue ----
+# With YT_UI_ROLE=web, HTTP processes (any number of gunicorn workers) admit and
+# resolve jobs, then hand them to the queue table in jobs.db instead of the
+# in-memory job_queue. Download workers run with YT_UI_ROLE=worker
+# (`python app.py`), on this host or any host sharing the state volume, and
+# claim the oldest row with a lease of LEASE_SECONDS. While a job runs its
+# worker renews the lease every LEASE_SECONDS / 3 and flushes the job's changed
+# fields to the jobs table every SHARED_POLL_SECONDS. A row whose lease ran out
+# (the worker died) is claimed again by the next free worker, at most
+# SHARED_MAX_ATTEMPTS times. Web processes read job state back from the jobs
+# table (and the log tail from the shared log file), so /status, /events and
+# /cancel work whichever process admitted or runs a job. /cancel on a running
+# job sets the row's cancel flag, and the owning worker stops the job on its next tick.
+# Disk usage is shared through the disk_files table.
+# What ROLE=web gives up or weakens compared with a single "all" process:
+#   - identical-job sharing (_inflight) is process-local, so it is off; the
+#     media cache still serves repeats once the first job has finished
+#   - rate limits are per process unless YT_UI_RATE_BACKEND=sqlite
+#   - the rendered landing page is per process, so a review approved in one
+#     process shows in the others after LANDING_TTL_SECONDS
+#   - /health "resolving" and the SSE_MAX_STREAMS cap count this process only
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+_owned_leases = set()  # worker role: job ids this process holds a lease on
+_lease_lock = threading.Lock()
+
+
+def _queue_conn():
+    conn = sqlite3.connect(JOBS_DB, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _shared_enqueue(job_id: str, client_ip):
+    conn = _queue_conn()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO queue (job_id, seq, client_ip) "
+            "VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM queue), ?)",
+            (job_id, client_ip),
+        )
+    finally:
+        conn.close()
+
+
+def _shared_queue_stats():
+    """(waiting, leased) row counts; rows with a lapsed lease count as waiting."""
+    conn = _queue_conn()
+    try:
+        row = conn.execute(
+            "SELECT COALESCE(SUM(owner IS NULL OR lease_until < ?1), 0), "
+            "COALESCE(SUM(owner IS NOT NULL AND lease_until >= ?1), 0) FROM queue",
+            (time.time(),),
+        ).fetchone()
+    finally:
+        conn.close()
+    return int(row[0]), int(row[1])
+
+
+def _shared_position(job_id: str):
+    now = time.time()
+    conn = _queue_conn()
+    try:
+        row = conn.execute("SELECT seq, owner, lease_until FROM queue WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None or (row[1] is not None and row[2] >= now):
+            return None
+        return conn.execute(
+            "SELECT COUNT(*) FROM queue WHERE seq < ? AND (owner IS NULL OR lease_until < ?)",
+            (row[0], now),
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _shared_ip_active(ip: str) -> int:
+    conn = _queue_conn()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM queue WHERE client_ip = ?", (ip,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _shared_cancel(job_id: str):
+    """Drop a waiting row ("removed"), flag a leased one for its worker
+    ("signalled"), or None if the job isn't in the shared queue."""
+    conn = _queue_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT owner, lease_until FROM queue WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            outcome = None
+        elif row[0] is None or row[1] < time.time():
+            conn.execute("DELETE FROM queue WHERE job_id = ?", (job_id,))
+            outcome = "removed"
+        else:
+            conn.execute("UPDATE queue SET cancel = 1 WHERE job_id = ?", (job_id,))
+            outcome = "signalled"
+        conn.execute("COMMIT")
+        return outcome
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _job_row_data(raw: str) -> dict:
+    data = json.loads(raw)
+    for field in ("created_at", "finished_at"):
+        data[field] = _parse_dt(data.get(field))
+    return data
+
+
+def _sync_shared_jobs(job_ids):
+    """Web role: refresh jobs from the jobs table. Jobs this process's own
+    resolver still holds, and settled ones, are left alone; a job another web
+    process is resolving is refreshed like any other."""
+    if ROLE != "web":
+        return
+    with resolve_cv:
+        resolving_here = [jid for jid in job_ids if jid in _resolving_now or jid in resolve_queue]
+    with jobs_lock:
+        wanted = []
+        for jid in job_ids:
+            job = jobs.get(jid)
+            if jid in resolving_here:
+                continue
+            if job is not None and job.get("status") in _FINAL_STATUSES and job.get("finished_at"):
+                continue
+            wanted.append(jid)
+    if not wanted:
+        return
+    try:
+        with _jobs_conn() as conn:
+            rows = conn.execute(
+                f"SELECT job_id, data FROM jobs WHERE job_id IN ({','.join('?' * len(wanted))})", wanted
+            ).fetchall()
+    except Exception:
+        return
+    for jid, raw in rows:
+        try:
+            data = _job_row_data(raw)
+        except ValueError:
+            continue
+        path = job_log_path(jid)
+        if data.get("status") in ("running",) + _FINAL_STATUSES and path.exists():
+            try:
+                data["log"] = _read_log_tail(path, LOG_TAIL_LINES)[0]
+            except OSError:
+                pass
+        with jobs_lock:
+            job = jobs.get(jid)
+            if job is None:
+                jobs.load(jid, data)
+            else:
+                job.refresh(data)
+
+
+def _shared_sync_worker():
+    """Web role: keep in-flight jobs current even when nobody polls them, so
+    their finish is seen (history view, expiry) without a request."""
+    while True:
+        time.sleep(SHARED_POLL_SECONDS * 5)
+        with jobs_lock:
+            ids = [jid for jid, j in jobs.items() if j.get("status") in ("queued", "running")]
+        for i in range(0, len(ids), 200):
+            _sync_shared_jobs(ids[i:i + 200])
+
+
+def _shared_claim():
+    """Lease the oldest claimable row to this worker. Rows that were cancelled or
+    have used up their attempts while unowned are settled here instead.
+    Returns (job_id, attempts) or None."""
+    now = time.time()
+    conn = _queue_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        claimed = None
+        for job_id, attempts, cancel in conn.execute(
+            "SELECT job_id, attempts, cancel FROM queue "
+            "WHERE owner IS NULL OR lease_until < ? ORDER BY seq LIMIT 20", (now,)
+        ).fetchall():
+            if cancel or attempts >= SHARED_MAX_ATTEMPTS:
+                patch = (
+                    {"status": "cancelled", "log": "Cancelled"} if cancel else
+                    {"status": "error", "phase": "Failed",
+                     "error_message": "The download worker stopped while running this job. Please try again."}
+                )
+                patch["finished_at"] = str(datetime.utcnow())
+                conn.execute("DELETE FROM queue WHERE job_id = ?", (job_id,))
+                _job_upsert(conn, job_id, patch["status"], patch)
+                continue
+            conn.execute(
+                "UPDATE queue SET owner = ?, lease_until = ?, attempts = attempts + 1 WHERE job_id = ?",
+                (WORKER_ID, now + LEASE_SECONDS, job_id),
+            )
+            claimed = (job_id, attempts + 1)
+            break
+        conn.execute("COMMIT")
+        return claimed
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _shared_release(job_id: str):
+    with _lease_lock:
+        _owned_leases.discard(job_id)
+    try:
+        conn = _queue_conn()
+        try:
+            conn.execute("DELETE FROM queue WHERE job_id = ? AND owner = ?", (job_id, WORKER_ID))
+        finally:
+            conn.close()
+    except Exception:
+        pass
+
+
+def _adopt_shared_job(job_id: str, attempts: int) -> bool:
+    """Worker role: load a claimed job into memory, ready for run_job()."""
+    try:
+        with _jobs_conn() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        data = _job_row_data(row[0]) if row else None
+    except Exception:
+        data = None
+    if data is None:
+        _shared_release(job_id)
+        return False
+    with jobs_lock:
+        jobs.load(job_id, data)
+        job = jobs[job_id]
+        job["status"] = "queued"  # a re-claimed job starts over
+        if attempts > 1:
+            job["phase_note"] = "Restarted after the previous download worker stopped"
+    with _lease_lock:
+        _owned_leases.add(job_id)
+    return True
+
+
+def _run_claimed(job_id: str):
+    try:
+        run_job(job_id)
+    except Exception:
+        app.logger.exception("run_job failed for job %s", job_id)
+        _release_job_slot(job_id)
+    finally:
+        save_jobs()
+        _shared_release(job_id)
+        with jobs_lock:
+            jobs.forget(job_id)
+
+
+def _shared_worker_loop():
+    """Worker role: one of MAX_CONCURRENT_JOBS claim loops. Each reserves a run
+    slot, claims a job into it and runs the job on this thread, so a worker
+    process never creates a thread per job."""
+    global _slots_in_use
+    while True:
+        with queue_cv:
+            while _slots_in_use >= MAX_CONCURRENT_JOBS:
+                queue_cv.wait()
+            _slots_in_use += 1
+        try:
+            claimed = _shared_claim()
+        except Exception:
+            claimed = None
+        if not claimed or not _adopt_shared_job(*claimed):
+            _release_slot()
+            time.sleep(SHARED_POLL_SECONDS)
+            continue
+        with queue_cv:
+            _job_slots.add(claimed[0])
+        _run_claimed(claimed[0])
+
+
+def _shared_heartbeat():
+    """Worker role: flush job fields, renew leases, and act on cancel flags.
+    A job whose lease was lost to another worker is stopped and no longer saved."""
+    last_renew = 0.0
+    while True:
+        time.sleep(SHARED_POLL_SECONDS)
+        save_jobs()
+        with _lease_lock:
+            owned = list(_owned_leases)
+        if not owned:
+            continue
+        now = time.time()
+        lost, cancels = [], []
+        try:
+            conn = _queue_conn()
+            try:
+                if now - last_renew >= LEASE_SECONDS / 3:
+                    for jid in owned:
+                        cur = conn.execute(
+                            "UPDATE queue SET lease_until = ? WHERE job_id = ? AND owner = ?",
+                            (now + LEASE_SECONDS, jid, WORKER_ID),
+                        )
+                        if cur.rowcount == 0:
+                            lost.append(jid)
+                    last_renew = now
+                cancels = [r[0] for r in conn.execute(
+                    "SELECT job_id FROM queue WHERE owner = ? AND cancel = 1", (WORKER_ID,)
+                ).fetchall()]
+            finally:
+                conn.close()
+        except Exception:
+            continue
+        for jid in lost:
+            with _lease_lock:
+                if jid not in _owned_leases:
+                    continue  # finished and released since the snapshot
+            with jobs_lock:
+                jobs.detach(jid)
+            _terminate_job(jid)
+        for jid in cancels:
+            _terminate_job(jid)
 
 
 # ---- Phase detection & error classification ----
@@ -4134,13 +5433,14 @@ def _stall_monitor(job_id: str):
             if not job or job.get("status") != "running":
                 return
             last = job.get("last_output_at") or job.get("started_at") or time.time()
-            proc = job.get("process")
+            procs = list(job.get("processes") or [job.get("process")])
         silence = time.time() - last
-        if silence >= STALL_KILL_SECONDS and proc is not None:
-            try:
-                proc.kill()
-            except Exception:
-                pass
+        if silence >= STALL_KILL_SECONDS and any(procs):
+            for proc in procs:
+                try:
+                    proc.kill()
+                except Exception:
+                    pass
             with jobs_lock:
                 j = jobs.get(job_id)
                 if j:
@@ -4153,6 +5453,270 @@ def _stall_monitor(job_id: str):
                 if j and j.get("status") == "running":
                     j["phase_note"] = f"Still working — no output for {int(silence)}s…"
 
+# ---- yt-dlp engines ----
+# "subprocess" (default) forks YT_DLP_BIN for every run. "embedded" keeps a pool
+# of long-lived Python workers with yt_dlp already imported and hands each run
+# to one over a pipe, which skips interpreter start-up and extractor import on
+# every job and every Spotify/Apple Music track. Progress then arrives through
+# yt-dlp's progress/postprocessor hooks instead of parsed stdout lines. Needs
+# the yt_dlp Python package (requirements.txt), not just the standalone binary
+# the Dockerfile downloads; falls back to the subprocess engine without it.
+YTDLP_ENGINE = os.environ.get("YT_UI_ENGINE", "subprocess").strip().lower()
+EMBEDDED_WORKERS = int(os.environ.get("YT_UI_EMBEDDED_WORKERS", str(MAX_CONCURRENT_JOBS)))
+EMBEDDED_MAX_RUNS = int(os.environ.get("YT_UI_EMBEDDED_MAX_RUNS", "100"))  # recycle workers after N runs
+
+# Runs in the worker via `python -c`. Protocol: one JSON request per stdin line
+# ({"argv": [...]}) and JSON messages on the original stdout. yt-dlp's own stdout
+# (e.g. --print after_move:filepath) is forwarded as "line" messages so the
+# caller parses output exactly as it does for the CLI.
+_EMBEDDED_WORKER_SRC = r'''
+import json, os, sys
+_proto = os.fdopen(os.dup(1), "w", encoding="utf-8")
+os.dup2(2, 1)  # ffmpeg & friends inherit fd 1; keep them off the protocol pipe
+
+def send(msg):
+    _proto.write(json.dumps(msg) + "\n")
+    _proto.flush()
+
+class LineWriter:
+    encoding = "utf-8"
+    def __init__(self):
+        self._buf = ""
+    def write(self, s):
+        self._buf += s
+        while "\n" in self._buf:
+            line, self._buf = self._buf.split("\n", 1)
+            send({"t": "line", "v": line})
+        return len(s)
+    def flush(self):
+        pass
+    def isatty(self):
+        return False
+
+sys.stdout = LineWriter()
+import yt_dlp
+from yt_dlp.utils import DownloadError
+
+class Logger:
+    def debug(self, msg):
+        if not msg.startswith("[debug] "):
+            send({"t": "line", "v": msg})
+    def info(self, msg):
+        send({"t": "line", "v": msg})
+    def warning(self, msg):
+        send({"t": "line", "v": "WARNING: " + msg})
+    def error(self, msg):
+        send({"t": "line", "v": msg})
+
+_last = {}
+
+def on_progress(d):
+    status = d.get("status")
+    total = d.get("total_bytes") or d.get("total_bytes_estimate")
+    pct = round((d.get("downloaded_bytes") or 0) * 100.0 / total, 1) if total else None
+    if status == _last.get("status") and pct is not None and _last.get("pct") is not None and abs(pct - _last["pct"]) < 1:
+        return
+    _last.update(status=status, pct=pct)
+    send({"t": "progress", "status": status, "pct": pct})
+
+def on_pp(d):
+    send({"t": "pp", "pp": d.get("postprocessor"), "status": d.get("status")})
+
+send({"t": "ready"})
+for raw in sys.stdin:
+    try:
+        req = json.loads(raw)
+    except ValueError:
+        continue
+    _last.clear()
+    code = 1
+    try:
+        _parser, _opts, urls, ydl_opts = yt_dlp.parse_options(req["argv"])
+        ydl_opts.update(logger=Logger(), progress_hooks=[on_progress],
+                        postprocessor_hooks=[on_pp], noprogress=True)
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            code = ydl.download(urls)
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 2
+    except DownloadError:
+        code = 1  # already reported through the logger
+    except Exception as e:
+        send({"t": "line", "v": "ERROR: %s" % e})
+        code = 1
+    if sys.stdout._buf:
+        sys.stdout.write("\n")
+    send({"t": "exit", "code": code})
+'''
+
+
+class _EmbeddedPool:
+    """Idle embedded yt-dlp workers. A worker is only returned to the pool after a
+    clean "exit" message; killed or recycled workers are simply replaced."""
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _spawn(self):
+        w = subprocess.Popen(
+            [sys.executable, "-u", "-c", _EMBEDDED_WORKER_SRC],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", bufsize=1,
+        )
+        w.runs = 0
+        return w
+
+    def acquire(self):
+        with self._lock:
+            while self._idle:
+                w = self._idle.pop()
+                if w.poll() is None:
+                    return w
+        return self._spawn()
+
+    def release(self, w):
+        w.runs += 1
+        with self._lock:
+            if w.poll() is None and w.runs < EMBEDDED_MAX_RUNS and len(self._idle) < self.size:
+                self._idle.append(w)
+                return
+        try:
+            w.kill()
+            w.wait(timeout=5)
+        except Exception:
+            pass
+
+    def prewarm(self):
+        for _ in range(self.size):
+            try:
+                w = self._spawn()
+                w.runs = -1  # the release below doesn't count as a run
+                self.release(w)
+            except Exception:
+                return
+
+
+class _EmbeddedRun:
+    """Popen look-alike for one run on an embedded worker: iterate .stdout for log
+    lines, and poll/wait/terminate/kill behave like the subprocess engine so
+    run_job, /cancel and the stall monitor don't care which engine is active."""
+
+    def __init__(self, worker, argv: list, on_progress=None):
+        self._worker = worker
+        self._on_progress = on_progress
+        self._killed = False
+        self._done = threading.Event()
+        self.returncode = None
+        worker.stdin.write(json.dumps({"argv": argv}) + "\n")
+        worker.stdin.flush()
+        self.stdout = self._lines()
+
+    def _lines(self):
+        clean = False
+        try:
+            for raw in self._worker.stdout:
+                try:
+                    msg = json.loads(raw)
+                except ValueError:
+                    continue
+                kind = msg.get("t")
+                if kind == "line":
+                    yield (msg.get("v") or "") + "\n"
+                elif kind == "exit":
+                    self.returncode = int(msg.get("code") or 0)
+                    clean = not self._killed
+                    break
+                elif kind in ("progress", "pp") and self._on_progress:
+                    try:
+                        self._on_progress(msg)
+                    except Exception:
+                        pass
+        finally:
+            if self.returncode is None:
+                self.returncode = -9 if self._killed else 1
+            self._done.set()
+            if clean:
+                _embedded_pool.release(self._worker)
+            else:
+                try:
+                    self._worker.kill()
+                except Exception:
+                    pass
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """Without a timeout, drain .stdout to the end. With one, wait for the
+        thread reading .stdout to reach the exit message, raising
+        subprocess.TimeoutExpired like Popen.wait if it doesn't in time."""
+        if timeout is None:
+            for _ in self.stdout:
+                pass
+        elif not self._done.wait(timeout):
+            raise subprocess.TimeoutExpired("yt-dlp (embedded)", timeout)
+        return self.returncode
+
+    def terminate(self):
+        self._killed = True
+        try:
+            self._worker.kill()
+        except Exception:
+            pass
+
+    kill = terminate
+
+
+def _embedded_available() -> bool:
+    if YTDLP_ENGINE != "embedded" or getattr(sys, "frozen", False):
+        return False
+    try:
+        return importlib.util.find_spec("yt_dlp") is not None
+    except Exception:
+        return False
+
+_embedded_pool = _EmbeddedPool(EMBEDDED_WORKERS) if _embedded_available() else None
+
+
+def _spawn_ytdlp(cmd: list, on_progress=None):
+    """Start one yt-dlp run. cmd is the full CLI argv (YT_DLP_BIN first); returns a
+    Popen-like object whose stdout yields merged output lines."""
+    if _embedded_pool is not None:
+        try:
+            return _EmbeddedRun(_embedded_pool.acquire(), cmd[1:], on_progress)
+        except Exception:
+            pass  # broken worker — fall back to a plain process for this run
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+_PP_PHASES = {
+    "FFmpegMerger": "Merging video + audio",
+    "FFmpegExtractAudio": "Converting audio",
+    "EmbedThumbnail": "Finalizing",
+    "FFmpegMetadata": "Finalizing",
+    "FFmpegThumbnailsConvertor": "Finalizing",
+}
+
+def _ytdlp_progress(job_id: str, set_phase: bool = True):
+    """Hook-event handler for the embedded engine: keeps last_output_at fresh for
+    the stall monitor and mirrors download % / post-processing into the job."""
+    def on_progress(msg):
+        with jobs_lock:
+            job = jobs.get(job_id)
+            if not job:
+                return
+            job["last_output_at"] = time.time()
+            job.pop("phase_note", None)
+            if msg.get("t") == "progress":
+                if msg.get("status") == "downloading" and msg.get("pct") is not None:
+                    job["download_pct"] = msg["pct"]
+                if set_phase:
+                    job["phase"] = "Downloading"
+            elif set_phase and msg.get("status") == "started" and msg.get("pp") in _PP_PHASES:
+                job["phase"] = _PP_PHASES[msg["pp"]]
+    return on_progress
+
 def _parse_dt(val):
     if isinstance(val, datetime):
         return val
@@ -4184,6 +5748,251 @@ def detect_apple_music(url: str) -> bool:
     return "music.apple.com" in host.lower()
 
 
+# ---- Upstream metadata clients ----
+# Admission resolves every Spotify/Apple Music link, so the upstream calls are
+# made cheap: results are cached per entity id (TTL + LRU), the Spotify
+# client-credentials token is reused until shortly before it expires, and HTTP
+# connections are kept alive between requests instead of re-handshaking TLS.
+METADATA_CACHE_TTL = float(os.environ.get("YT_UI_METADATA_TTL", "3600"))
+METADATA_CACHE_SIZE = int(os.environ.get("YT_UI_METADATA_CACHE_SIZE", "512"))
+
+
+class _TTLCache:
+    """Thread-safe LRU map whose entries also expire after ttl seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            if hit[0] < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._data[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class _HttpPool:
+    """Keep-alive HTTP(S) connections, pooled per host. request() returns the body
+    bytes and raises urllib.error.HTTPError for 4xx/5xx, like urlopen does. A request
+    that fails on a reused socket is redialled once only if it is safe to repeat
+    (GET/HEAD by default, or retry=True): a dropped POST may already have run."""
+
+    def __init__(self, max_idle_per_host: int = 4):
+        self.max_idle = max_idle_per_host
+        self._idle = {}  # (scheme, netloc) -> [connection]
+        self._lock = threading.Lock()
+
+    def _checkout(self, scheme: str, netloc: str, timeout: float):
+        with self._lock:
+            conns = self._idle.get((scheme, netloc))
+            conn = conns.pop() if conns else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(netloc, timeout=timeout), False
+
+    def _checkin(self, scheme: str, netloc: str, conn):
+        with self._lock:
+            conns = self._idle.setdefault((scheme, netloc), [])
+            if len(conns) < self.max_idle:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def request(self, method: str, url: str, headers: dict = None, body: bytes = None,
+                timeout: float = 10, retry: bool = None) -> bytes:
+        if retry is None:
+            retry = method in ("GET", "HEAD")
+        parsed = urlparse(url)
+        path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        for attempt in range(2):
+            conn, reused = self._checkout(parsed.scheme, parsed.netloc, timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionError):
+                conn.close()
+                if reused and retry and attempt == 0:
+                    continue  # the server dropped an idle keep-alive socket; redial once
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(parsed.scheme, parsed.netloc, conn)
+            if resp.status >= 400:
+                raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+            return data
+
+    def get_json(self, url: str, headers: dict = None, timeout: float = 10):
+        return json.loads(self.request("GET", url, headers=headers, timeout=timeout))
+
+
+_metadata_http = _HttpPool()
+_metadata_cache = _TTLCache(METADATA_CACHE_SIZE, METADATA_CACHE_TTL)
+
+
+# ---- Payment-app token API ----
+# Token checks and uses share one keep-alive pool to PAYMENT_APP_URL. After
+# TOKEN_BREAKER_FAILURES consecutive transport errors or 5xx answers the breaker
+# opens and calls fail immediately for TOKEN_BREAKER_COOLDOWN seconds, then a
+# single probe decides whether it closes again. "Not valid" check answers are
+# remembered for TOKEN_NEGATIVE_TTL, and concurrent checks of the same token
+# share one upstream request.
+TOKEN_API_TIMEOUT = float(os.environ.get("YT_UI_TOKEN_API_TIMEOUT", "3"))
+TOKEN_BREAKER_FAILURES = int(os.environ.get("YT_UI_TOKEN_BREAKER_FAILURES", "5"))
+TOKEN_BREAKER_COOLDOWN = float(os.environ.get("YT_UI_TOKEN_BREAKER_COOLDOWN", "15"))
+TOKEN_NEGATIVE_TTL = float(os.environ.get("YT_UI_TOKEN_NEGATIVE_TTL", "5"))
+
+
+class _CircuitOpen(Exception):
+    pass
+
+
+class _CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open (fail fast) -> half-open (one probe)."""
+
+    def __init__(self, failures: int, cooldown: float):
+        self.threshold = max(1, failures)
+        self.cooldown = cooldown
+        self._failures = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._failures < self.threshold:
+                return "closed"
+            return "open" if time.time() < self._open_until else "half-open"
+
+    def before(self):
+        """Raise _CircuitOpen unless the caller may go upstream."""
+        with self._lock:
+            if self._failures < self.threshold:
+                return
+            if time.time() < self._open_until or self._probing:
+                raise _CircuitOpen()
+            self._probing = True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.threshold:
+                self._open_until = time.time() + self.cooldown
+
+
+class _SingleFlight:
+    """Collapse concurrent calls for the same key into one; the others wait and
+    get the same result (or exception)."""
+
+    def __init__(self):
+        self._calls = {}  # key -> [done Event, result, exception]
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+        try:
+            call[1] = fn()
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call[0].set()
+
+
+_token_http = _HttpPool(max_idle_per_host=16)
+_token_breaker = _CircuitBreaker(TOKEN_BREAKER_FAILURES, TOKEN_BREAKER_COOLDOWN)
+_token_flights = _SingleFlight()
+_invalid_token_cache = _TTLCache(4096, TOKEN_NEGATIVE_TTL)
+
+
+def _token_api(action: str, token: str) -> dict:
+    """POST a token to the payment app's internal token/<action> endpoint. Raises on
+    transport and HTTP errors, and _CircuitOpen while the upstream is considered down."""
+    _token_breaker.before()
+    try:
+        data = _token_http.request(
+            "POST",
+            f"{PAYMENT_APP_URL}/payment/api/access/internal/token/{action}",
+            headers={
+                "Content-Type": "application/json",
+                "x-internal-secret": TOKEN_INTERNAL_SECRET,
+                "x-forwarded-proto": "https",
+            },
+            body=json.dumps({"token": token}).encode(),
+            timeout=TOKEN_API_TIMEOUT,
+            retry=action == "check",  # a "use" that reached the server must not be spent twice
+        )
+    except urllib.error.HTTPError as e:
+        # A 4xx still proves the payment app is up.
+        (_token_breaker.failure if e.code >= 500 else _token_breaker.success)()
+        raise
+    except Exception:
+        _token_breaker.failure()
+        raise
+    _token_breaker.success()
+    result = json.loads(data)
+    return result if isinstance(result, dict) else {}
+
+
+def _token_check(token: str) -> dict:
+    cached = _invalid_token_cache.get(token)
+    if cached is not None:
+        return dict(cached)
+
+    def check():
+        result = _token_api("check", token)
+        if not result.get("valid"):
+            _invalid_token_cache.set(token, result)
+        return result
+
+    return dict(_token_flights.do(token, check))
+
+
 def _apple_music_fetch_metadata(url: str) -> dict:
     """Fetch Apple Music track/album metadata via iTunes Lookup API. No credentials needed."""
     try:
@@ -4223,6 +6032,17 @@ def _apple_music_fetch_metadata(url: str) -> dict:
             "Make sure you copied the full link."
         )
 
+    cache_key = ("apple_music", country.lower(), kind, entity_id, track_id)
+    cached = _metadata_cache.get(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+    info = _apple_music_lookup(country, kind, entity_id, track_id)
+    _metadata_cache.set(cache_key, info)
+    return copy.deepcopy(info)
+
+
+def _apple_music_lookup(country: str, kind: str, entity_id: str, track_id) -> dict:
+    """iTunes Lookup API calls behind _apple_music_fetch_metadata (uncached)."""
     def itunes_lookup(lookup_id, entity=None):
         params = f"id={lookup_id}&country={country}"
         if entity:
@@ -4230,12 +6050,11 @@ def _apple_music_fetch_metadata(url: str) -> dict:
         last_exc = None
         for attempt in range(2):  # single retry for transient failures
             try:
-                req = urllib.request.Request(
+                return _metadata_http.get_json(
                     f"https://itunes.apple.com/lookup?{params}",
                     headers={"User-Agent": "Mozilla/5.0"},
+                    timeout=10,
                 )
-                with urllib.request.urlopen(req, timeout=10) as resp:
-                    return json.loads(resp.read())
             except Exception as e:
                 last_exc = e
                 time.sleep(0.5)
@@ -4277,9 +6096,7 @@ _EMBED_HEADERS = {
 def _spotify_embed_fetch(kind: str, entity_id: str) -> dict:
     """Fetch __NEXT_DATA__ from Spotify embed page. No auth required."""
     embed_url = f"https://open.spotify.com/embed/{kind}/{entity_id}"
-    req = urllib.request.Request(embed_url, headers=_EMBED_HEADERS)
-    with urllib.request.urlopen(req, timeout=15) as resp:
-        html = resp.read().decode("utf-8", errors="replace")
+    html = _metadata_http.request("GET", embed_url, headers=_EMBED_HEADERS, timeout=15).decode("utf-8", errors="replace")
     m = re.search(r'id="__NEXT_DATA__"[^>]*>(.*?)</script>', html, re.DOTALL)
     if not m:
         raise ValueError(f"Could not parse Spotify embed page for {kind}/{entity_id}")
@@ -4297,7 +6114,38 @@ def _spotify_fetch_metadata(url: str) -> dict:
         raise ValueError(f"Unrecognized Spotify URL: {url}")
     if kind not in {"track", "playlist", "album"}:
         raise ValueError(f"Unsupported Spotify entity type: {kind}")
+    cache_key = ("spotify", kind, entity_id)
+    cached = _metadata_cache.get(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+    info = _spotify_lookup(kind, entity_id)
+    _metadata_cache.set(cache_key, info)
+    return copy.deepcopy(info)
+
+
+def _spotify_access_token() -> str:
+    """Client-credentials token, reused until a minute before it expires."""
+    with _spotify_token_lock:
+        cached = _spotify_token_cache.get("token")
+        if cached and _spotify_token_cache.get("expires_at", 0) > time.time() + 60:
+            return cached
+        creds = base64.b64encode(
+            f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()
+        ).decode()
+        body = _metadata_http.request(
+            "POST", "https://accounts.spotify.com/api/token",
+            headers={"Authorization": f"Basic {creds}", "Content-Type": "application/x-www-form-urlencoded"},
+            body=b"grant_type=client_credentials",
+            timeout=10,
+        )
+        data = json.loads(body)
+        _spotify_token_cache["token"] = data["access_token"]
+        _spotify_token_cache["expires_at"] = time.time() + float(data.get("expires_in") or 3600)
+        return data["access_token"]
 
+
+def _spotify_lookup(kind: str, entity_id: str) -> dict:
+    """Embed-page / Web API calls behind _spotify_fetch_metadata (uncached)."""
     if kind == "track":
         data = _spotify_embed_fetch("track", entity_id)
         entity = data["props"]["pageProps"]["state"]["data"]["entity"]
@@ -4323,73 +6171,810 @@ def _spotify_fetch_metadata(url: str) -> dict:
                 "Playlist metadata requires SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET env vars. "
                 "Track and album URLs work without credentials."
             )
-        creds = base64.b64encode(
-            f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()
-        ).decode()
-        token_req = urllib.request.Request(
-            "https://accounts.spotify.com/api/token",
-            data=b"grant_type=client_credentials",
-            headers={"Authorization": f"Basic {creds}", "Content-Type": "application/x-www-form-urlencoded"},
-            method="POST",
+        token = _spotify_access_token()
+
+        def api_get(path_or_url):
+            full = path_or_url if path_or_url.startswith("http") else f"https://api.spotify.com/v1/{path_or_url.lstrip('/')}"
+            try:
+                return _metadata_http.get_json(full, headers={"Authorization": f"Bearer {token}"}, timeout=10)
+            except urllib.error.HTTPError as e:
+                if e.code == 401:
+                    _spotify_token_cache.pop("token", None)  # revoked early; next call re-auths
+                raise
+
+        data = api_get(f"playlists/{entity_id}")
+        tdata = data.get("tracks", {})
+        pages = [tdata.get("items", [])]
+        # Once the total is known the remaining pages are independent, so fetch
+        # them in parallel instead of walking the `next` chain one by one.
+        limit = int(tdata.get("limit") or len(pages[0]) or 100)
+        total = int(tdata.get("total") or 0)
+        offsets = list(range(limit, total, limit)) if tdata.get("next") else []
+        # Pages past MAX_PLAYLIST_TRACKS are only fetched when unavailable entries
+        # (null tracks) left the earlier ones at or under the limit; otherwise the
+        # playlist is refused anyway.
+        within = [off for off in offsets if off <= MAX_PLAYLIST_TRACKS]
+        beyond = offsets[len(within):]
+
+        def fetch_pages(offs):
+            if not offs:
+                return []
+            with ThreadPoolExecutor(max_workers=min(4, len(offs))) as pool:
+                return [
+                    page.get("items", [])
+                    for page in pool.map(lambda off: api_get(f"playlists/{entity_id}/tracks?offset={off}&limit={limit}"), offs)
+                ]
+
+        def parse(items_pages):
+            out = []
+            for items in items_pages:
+                for item in items:
+                    t = item.get("track") if item else None
+                    if t and t.get("name"):
+                        artist = ", ".join(a["name"] for a in t.get("artists", []))
+                        out.append({"title": t["name"], "artist": artist})
+            return out
+
+        tracks = parse(pages + fetch_pages(within))
+        info = {"kind": "playlist", "name": data.get("name", "playlist"), "tracks": tracks}
+        if beyond and len(tracks) <= MAX_PLAYLIST_TRACKS:
+            tracks += parse(fetch_pages(beyond))
+        elif beyond:
+            info["track_total"] = total  # tracks stops short; this is the playlist's size
+        return info
+
+
+# ---- Collection sources ----
+# Spotify and Apple Music share one "track-list source -> YouTube match ->
+# download" pipeline. A source adapter only knows how to detect its URLs and turn
+# one into {"kind", "name", "tracks": [{"title", "artist"}]}; search, download,
+# tagging and progress accounting are shared (see _run_collection_job), so a new
+# track-list service is just another entry here.
+_COLLECTION_SOURCES = {
+    "spotify": {
+        "label": "Spotify",
+        "detect": detect_spotify,
+        "fetch": _spotify_fetch_metadata,
+        "info_field": "spotify_info",
+        "root_dir": SPOTIFY_DIR,
+        "tracks_dir": SPOTIFY_TRACKS_DIR,
+        "default_name": "spotify_download",
+        "default_dir": "playlist",
+        "error_prefix": "Spotify API error",
+    },
+    "apple_music": {
+        "label": "Apple Music",
+        "detect": detect_apple_music,
+        "fetch": _apple_music_fetch_metadata,
+        "info_field": "apple_music_info",
+        "root_dir": APPLE_MUSIC_DIR,
+        "tracks_dir": APPLE_MUSIC_TRACKS_DIR,
+        "default_name": "apple_music_download",
+        "default_dir": "album",
+        "error_prefix": "Apple Music error",
+    },
+}
+_COLLECTION_INFO_FIELDS = tuple(src["info_field"] for src in _COLLECTION_SOURCES.values())
+
+
+def _collection_source_for(url: str):
+    """Job type of the collection source that owns this URL, or None."""
+    for job_type, src in _COLLECTION_SOURCES.items():
+        if src["detect"](url):
+            return job_type
+    return None
+
+
+# ---- Media cache ----
+# Finished downloads are kept in a content-addressed cache keyed by (extractor,
+# media id, job type, quality), so the same viral video pasted by ten people
+# runs yt-dlp (and the paid proxy) once. Entries are hard links (reflink or copy
+# across filesystems) living outside DOWNLOAD_DIR, so the user-facing file TTL
+# never touches them; the cache has its own size cap with LRU eviction.
+# YT_UI_CACHE_MAX_GB=0 (the default) disables it.
+CACHE_DIR = Path(os.environ.get("YT_UI_CACHE_DIR") or (_data_dir / "media-cache"))
+CACHE_MAX_GB = float(os.environ.get("YT_UI_CACHE_MAX_GB", "0"))
+_cache_lock = threading.Lock()
+_YOUTUBE_HOSTS = {"youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com"}
+_FICLONE = 0x40049409  # Linux ioctl: share extents copy-on-write (btrfs/xfs)
+
+def _cache_conn():
+    return sqlite3.connect(CACHE_DIR / "index.db", timeout=5)
+
+def _init_cache_db():
+    if CACHE_MAX_GB <= 0:
+        return
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with _cache_lock, _cache_conn() as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS media_cache ("
+            "key TEXT PRIMARY KEY, files TEXT NOT NULL, meta TEXT, "
+            "size INTEGER NOT NULL, created_at INTEGER NOT NULL, last_used INTEGER NOT NULL)"
         )
-        with urllib.request.urlopen(token_req, timeout=10) as resp:
-            token = json.loads(resp.read())["access_token"]
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_media_cache_used ON media_cache(last_used)")
+
+_init_cache_db()
+
+def _media_identity(url: str):
+    """(extractor, media id) for URLs we can identify without running yt-dlp, else None."""
+    try:
+        parsed = urlparse(url)
+    except Exception:
+        return None
+    host = (parsed.hostname or "").lower()
+    parts = [p for p in parsed.path.split("/") if p]
+    qs = parse_qs(parsed.query)
+    if host in _YOUTUBE_HOSTS:
+        # watch?v=…&list=… downloads the whole playlist, so the list wins.
+        if qs.get("list"):
+            return ("youtube:playlist", qs["list"][0])
+        if qs.get("v"):
+            return ("youtube", qs["v"][0])
+        if len(parts) >= 2 and parts[0] in ("shorts", "live", "embed"):
+            return ("youtube", parts[1])
+        return None
+    if host == "youtu.be" and parts:
+        return ("youtube:playlist", qs["list"][0]) if qs.get("list") else ("youtube", parts[0])
+    if host in ("soundcloud.com", "www.soundcloud.com", "m.soundcloud.com") and parts:
+        return ("soundcloud", "/".join(parts).lower())
+    if detect_spotify(url) and len(parts) >= 2:
+        return ("spotify", f"{parts[0]}/{parts[1]}")
+    if detect_apple_music(url) and parts:
+        return ("apple_music", qs.get("i", [parts[-1]])[0])
+    return None
+
+def _media_key(url: str, job_type: str, sc_quality: str, sc_playlist: bool):
+    """"extractor|id|type|quality" for identifiable media, else None."""
+    ident = _media_identity(url)
+    if not ident:
+        return None
+    quality = f"{sc_quality}:{'list' if sc_playlist else 'single'}" if job_type == "soundcloud" else ""
+    return f"{ident[0]}|{ident[1]}|{job_type}|{quality}"
+
+def _cache_key(url: str, job_type: str, sc_quality: str, sc_playlist: bool):
+    if CACHE_MAX_GB <= 0:
+        return None
+    raw = _media_key(url, job_type, sc_quality, sc_playlist)
+    return hashlib.sha256(raw.encode()).hexdigest() if raw else None
+
+def _link_or_copy(src: str, dst: str):
+    """Hard-link src to dst; reflink or copy when they're on different filesystems."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        try:
+            with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except Exception:
+            shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+def _cache_lookup(key: str):
+    """Cached entry for key as {"files": [(cache_path, rel_path)], "meta": {...}}, or None.
+    Entries whose files have gone missing are dropped."""
+    if not key:
+        return None
+    try:
+        with _cache_lock, _cache_conn() as conn:
+            row = conn.execute("SELECT files, meta FROM media_cache WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            rels = json.loads(row[0])
+            files = [(str(CACHE_DIR / key / rel), rel) for rel in rels]
+            if not files or not all(os.path.isfile(fp) for fp, _ in files):
+                conn.execute("DELETE FROM media_cache WHERE key = ?", (key,))
+                shutil.rmtree(CACHE_DIR / key, ignore_errors=True)
+                return None
+            conn.execute("UPDATE media_cache SET last_used = ? WHERE key = ?", (int(time.time()), key))
+        return {"files": files, "meta": json.loads(row[1] or "{}")}
+    except Exception:
+        return None
+
+def _cache_materialize(entry: dict, job_id: str) -> list:
+    """Link a cached entry's files into DOWNLOAD_DIR/<job_id>/ and return their paths.
+    Each hit gets its own copy, so one job's file expiry never deletes another's."""
+    out = []
+    for cache_path, rel in entry["files"]:
+        target = os.path.join(DOWNLOAD_DIR, job_id, rel)
+        _link_or_copy(cache_path, target)
+        _disk_track_paths([target])
+        os.utime(target)  # fresh mtime so the file TTL counts from now
+        out.append(target)
+    return out
+
+def _cache_store(key: str, output_paths: list, meta: dict):
+    """Add a finished job's files to the cache, then evict LRU entries over the cap."""
+    rels = []
+    for p in output_paths:
+        rel = os.path.relpath(p, DOWNLOAD_DIR)
+        if rel.startswith("..") or not os.path.isfile(p):
+            return
+        rels.append(rel)
+    if not key or not rels:
+        return
+    entry_dir = CACHE_DIR / key
+    try:
+        size = 0
+        for p, rel in zip(output_paths, rels):
+            _link_or_copy(p, str(entry_dir / rel))
+            size += os.path.getsize(p)
+        now = int(time.time())
+        with _cache_lock, _cache_conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO media_cache (key, files, meta, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(rels), json.dumps(meta), size, now, now),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM media_cache").fetchone()[0]
+            cap = int(CACHE_MAX_GB * 1024 ** 3)
+            if total > cap:
+                for old_key, old_size in conn.execute(
+                    "SELECT key, size FROM media_cache ORDER BY last_used ASC"
+                ).fetchall():
+                    if total <= cap:
+                        break
+                    conn.execute("DELETE FROM media_cache WHERE key = ?", (old_key,))
+                    shutil.rmtree(CACHE_DIR / old_key, ignore_errors=True)
+                    total -= old_size
+    except Exception:
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+# ---- In-flight coalescing ----
+# A /start for the same media (same key as the cache, or the normalized URL for
+# sites we can't identify) and the same type/quality while a matching job is
+# still queued or running doesn't start another yt-dlp run. The new job becomes
+# a follower: it mirrors the leader's progress in /status and gets the leader's
+# outcome under its own job id when the leader finishes. Per-IP limits are still
+# charged to every requester.
+_inflight: dict = {}  # flight key -> leader job_id; guarded by jobs_lock
+# Fields a follower shows live from its leader, and takes over when it finishes.
+_FOLLOW_FIELDS = ("status", "phase", "phase_note", "log", "progress_pct", "current_index",
+                  "total_items", "download_pct", "started_at")
+_SETTLE_FIELDS = ("status", "phase", "error_message", "log", "file", "output_path", "output_paths",
+                  "failures", "current_index", "total_items", "progress_pct")
+
+def _flight_key(url: str, job_type: str, sc_quality: str, sc_playlist: bool) -> str:
+    ident = _media_key(url, job_type, sc_quality, sc_playlist)
+    if ident:
+        return ident
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower() + (f":{parsed.port}" if parsed.port else "")
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return f"url|{parsed.scheme}://{host}{parsed.path.rstrip('/')}?{query}|{job_type}|{sc_quality if job_type == 'soundcloud' else ''}"
+
+def _settle_followers(leader_id: str):
+    """Hand a finished leader's outcome to the jobs following it. If the leader was
+    cancelled by its own requester, the first follower is promoted to leader and
+    re-queued at the front so the rest keep waiting on a real run."""
+    promoted = None
+    finished = []
+    with jobs_lock:
+        leader = jobs.get(leader_id)
+        if not leader:
+            return
+        key = leader.get("flight_key")
+        if key and _inflight.get(key) == leader_id:
+            _inflight.pop(key, None)
+        followers = [jid for jid in leader.pop("followers", [])
+                     if jid in jobs and jobs[jid].get("follows") == leader_id]
+        if not followers:
+            return
+        if leader.get("status") == "cancelled":
+            promoted, rest = followers[0], followers[1:]
+            pj = jobs[promoted]
+            pj.pop("follows", None)
+            pj["status"] = "queued"
+            pj["log"] = "Queued…"
+            pj["flight_key"] = key
+            pj["followers"] = rest
+            for jid in rest:
+                jobs[jid]["follows"] = promoted
+            if key:
+                _inflight[key] = promoted
+        else:
+            now = datetime.utcnow()
+            for jid in followers:
+                fj = jobs[jid]
+                fj.pop("follows", None)
+                fj["log_job_id"] = leader_id  # the output lives in the leader's log file
+                for k in _SETTLE_FIELDS:
+                    if k in leader:
+                        v = leader[k]
+                        fj[k] = list(v) if isinstance(v, list) else v
+                fj["finished_at"] = now
+                finished.append((jid, dict(fj)))
+    save_jobs()
+    if promoted:
+        with queue_cv:
+            job_queue.appendleft(promoted)
+            queue_cv.notify()
+    for jid, snap in finished:
+        _release_ip(snap.get("client_ip"))
+        append_history(_job_history_record(jid, snap))
+
+
+# ---- Admission resolver ----
+# /start only does cheap checks and returns a job id straight away; the job sits
+# in "resolving" while a resolver thread does the slow part of admission (DNS /
+# SSRF check, Spotify/iTunes metadata, disk cap) and then moves it to "queued".
+# Rejections land on the job as status "error" with error_message.
+RESOLVE_WORKERS = max(1, int(os.environ.get("YT_UI_RESOLVE_WORKERS", "4")))
+resolve_queue: deque = deque()
+resolve_cv = threading.Condition()
+_resolving_now = set()  # ids a resolver thread has taken off resolve_queue and not finished
+
+# SSRF check for is_valid_url. Hosts of the big extractors are known public and
+# skip DNS; IP literals are checked directly; anything else is resolved with a
+# deadline (getaddrinfo itself has none) and the per-host verdict is cached.
+# Lookups that time out or fail are rejected but not cached.
+DNS_TIMEOUT = float(os.environ.get("YT_UI_DNS_TIMEOUT", "3"))
+DNS_VERDICT_TTL = float(os.environ.get("YT_UI_DNS_TTL", "300"))
+_KNOWN_PUBLIC_DOMAINS = (
+    "youtube.com", "youtu.be", "youtube-nocookie.com", "soundcloud.com",
+    "spotify.com", "music.apple.com", "vimeo.com", "dailymotion.com",
+    "tiktok.com", "instagram.com", "twitter.com", "x.com", "twitch.tv",
+    "bandcamp.com", "reddit.com", "facebook.com",
+)
+_host_verdicts = _TTLCache(2048, DNS_VERDICT_TTL)
+_dns_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="dns")
+
+
+def _addrs_all_global(hostname: str) -> bool:
+    infos = socket.getaddrinfo(hostname, None)
+    return bool(infos) and all(ipaddress.ip_address(sa[0].split("%", 1)[0]).is_global
+                               for _, _, _, _, sa in infos)
+
+
+def _host_is_public(hostname: str) -> bool:
+    """True when every address the host resolves to is globally routable."""
+    if not hostname:
+        return False
+    if any(hostname == d or hostname.endswith("." + d) for d in _KNOWN_PUBLIC_DOMAINS):
+        return True
+    try:
+        return ipaddress.ip_address(hostname).is_global
+    except ValueError:
+        pass
+    verdict = _host_verdicts.get(hostname)
+    if verdict is not None:
+        return verdict
+    try:
+        verdict = _dns_pool.submit(_addrs_all_global, hostname).result(timeout=DNS_TIMEOUT)
+    except Exception:
+        return False
+    _host_verdicts.set(hostname, verdict)
+    return verdict
+
+
+def _fail_resolving(job_id: str, message: str):
+    """Reject a job that's still resolving; no-op if it was cancelled meanwhile."""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if not job or job.get("status") != "resolving":
+            return
+        job["status"] = "error"
+        job["phase"] = "Failed"
+        job["error_message"] = message
+        job["log"] = message
+        job["finished_at"] = datetime.utcnow()
+        ip = job.get("client_ip")
+    save_jobs()
+    _release_ip(ip)
+
+
+def _resolve_job(job_id: str):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if not job or job.get("status") != "resolving":
+            return
+        url = job.get("url")
+        source = _COLLECTION_SOURCES.get(job.get("type"))
+    if not is_valid_url(url):
+        return _fail_resolving(job_id, "Invalid URL")
+
+    info = None
+    if source:
+        with jobs_lock:
+            jobs[job_id]["phase"] = f"Fetching {source['label']} details"
+        try:
+            info = source["fetch"](url)
+        except Exception as e:
+            return _fail_resolving(job_id, f"{source['error_prefix']}: {e}")
+        if not info.get("tracks"):
+            return _fail_resolving(job_id, f"No tracks found in {source['label']} URL.")
+        track_count = max(len(info["tracks"]), info.get("track_total") or 0)
+        if track_count > MAX_PLAYLIST_TRACKS:
+            return _fail_resolving(job_id, f"Playlist too large ({track_count} tracks). Limit is {MAX_PLAYLIST_TRACKS}.")
+
+    if DISK_CAP_GB > 0:
+        try:
+            if _disk_used_gb() >= DISK_CAP_GB:
+                return _fail_resolving(job_id, "Server storage is full. Try again later.")
+        except Exception:
+            pass
+
+    with queue_cv:
+        with jobs_lock:
+            job = jobs.get(job_id)
+            if not job or job.get("status") != "resolving":
+                return
+            if source:
+                job[source["info_field"]] = info
+                job["total_items"] = len(info["tracks"])
+            # An identical job may have been queued while this one resolved.
+            key = job.get("flight_key")
+            leader_id = None if SHARED_QUEUE else _inflight.get(key)
+            leader = jobs.get(leader_id) if leader_id else None
+            if leader is not None and leader.get("status") in ("queued", "running") and not leader.get("cancel_requested"):
+                job["status"] = "following"
+                job["follows"] = leader_id
+                job["log"] = "Queued…"
+                job.pop("phase", None)
+                job["cache_key"] = leader.get("cache_key")
+                leader["followers"] = leader.get("followers", []) + [job_id]
+                save_jobs()
+                return
+            if SHARED_QUEUE:
+                full = None  # handed over below, outside the locks
+            elif len(job_queue) >= MAX_QUEUE_DEPTH:
+                full = True
+            else:
+                full = False
+                job["status"] = "queued"
+                job["log"] = "Queued…"
+                job.pop("phase", None)
+                _inflight[key] = job_id
+                save_jobs()
+                job_queue.append(job_id)
+                queue_cv.notify()
+    if full is None:
+        return _shared_handoff(job_id)
+    if full:
+        _fail_resolving(job_id, "Queue is full. Try again later.")
+
+
+def _shared_handoff(job_id: str):
+    """Web role: persist a resolved job and put it on the shared queue. From
+    here on the queue row, not this process, counts toward the IP's active jobs."""
+    if _shared_queue_stats()[0] >= MAX_QUEUE_DEPTH:
+        return _fail_resolving(job_id, "Queue is full. Try again later.")
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if not job or job.get("status") != "resolving":
+            return
+        job["status"] = "queued"
+        job["log"] = "Queued…"
+        job.pop("phase", None)
+        ip = job.get("client_ip")
+    save_jobs()
+    _shared_enqueue(job_id, ip)
+    _release_ip(ip)
+
+
+def _resolver_worker():
+    """Resolver thread: takes "resolving" jobs off resolve_queue one at a time."""
+    while True:
+        with resolve_cv:
+            while not resolve_queue:
+                resolve_cv.wait()
+            job_id = resolve_queue.popleft()
+            _resolving_now.add(job_id)
+        try:
+            _resolve_job(job_id)
+        except Exception as e:
+            _fail_resolving(job_id, f"Couldn't start this download: {e}")
+        finally:
+            with resolve_cv:
+                _resolving_now.discard(job_id)
+
+
+def restore_jobs_from_disk():
+    data = load_jobs()
+    now = datetime.utcnow()
+    with jobs_lock:
+        for jid, meta in data.items():
+            # Re-hydrate datetime fields that were serialized as strings
+            for field in ("created_at", "finished_at"):
+                meta[field] = _parse_dt(meta.get(field))
+            jobs.load(jid, meta)
+            meta = jobs[jid]  # changes below are marked dirty and written back
+            status = meta.get("status", "unknown")
+            created = meta.get("created_at")
+            if SHARED_QUEUE and status in ("queued", "running"):
+                pass  # owned by the shared queue; a lapsed lease gets it re-run
+            elif SHARED_QUEUE and status in ("resolving", "following") and not (
+                    isinstance(created, datetime) and (now - created).total_seconds() > SHARED_RESOLVE_STALE_SECONDS):
+                pass  # a sibling web process may be resolving it right now
+            elif status == "running":
+                meta["status"] = "error"
+                meta["phase"] = "Failed"
+                meta["error_message"] = "The server restarted while this job was running. Please try again."
+                meta["log"] = "Server restarted during download"
+                meta["finished_at"] = now
+            elif status in ("resolving", "queued", "following"):
+                meta["status"] = "cancelled"
+                meta["phase"] = "Cancelled"
+                meta["log"] = "Cancelled after restart"
+                meta["finished_at"] = now
+            meta.setdefault("log", "")
+            meta.setdefault("output_paths", [])
+            meta.setdefault("sc_quality", "m4a")
+            meta.setdefault("sc_playlist", True)
+            for field in _COLLECTION_INFO_FIELDS:
+                meta.setdefault(field, None)
+            meta.setdefault("current_index", 0)
+            meta.setdefault("total_items", 0)
+            meta.setdefault("progress_pct", 0)
+            meta.setdefault("failures", [])
+    save_jobs()
+
+# Spotify/Apple Music collections download up to TRACK_FANOUT tracks at once.
+# The job's own run slot covers the first; every extra track process borrows a
+# spare slot (_try_borrow_slot), so YT_UI_MAX_CONCURRENT still caps the total
+# number of yt-dlp processes across all jobs.
+TRACK_FANOUT = max(1, int(os.environ.get("YT_UI_TRACK_FANOUT", "3")))
+_IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+
+
+def _track_search_query(track_meta: dict) -> str:
+    """Search stage: the YouTube query a track is matched with."""
+    return f"ytsearch1:{track_meta.get('artist', '')} - {track_meta.get('title', '')}"
+
+
+def _track_tag_args(track_meta: dict) -> str:
+    """Tagging stage: ffmpeg args that stamp the source's title/artist on the MP3."""
+    safe_title  = _sanitize_metadata(track_meta.get("title", ""))
+    safe_artist = _sanitize_metadata(track_meta.get("artist", ""))
+    return f'ffmpeg:-metadata title="{safe_title}" -metadata artist="{safe_artist}"'
+
+
+def _download_collection_track(job_id: str, idx: int, total: int, track_meta: dict, out_dir: str,
+                               extra_args: list, ctx: dict) -> bool:
+    """Match one track on YouTube and download it as tagged MP3. Returns True on
+    success and False otherwise; a track cut short by cancellation returns False
+    without being recorded as a failure."""
+    title = track_meta.get("title", "")
+    artist = track_meta.get("artist", "")
+    with jobs_lock:
+        jobs[job_id]["last_output_at"] = time.time()
+        jobs[job_id].pop("phase_note", None)
+        _log_append(jobs[job_id], f"[{idx+1}/{total}] {artist} - {title}")
+    safe_base = re.sub(r'[\\/:*?"<>|]', "_", f"{artist} - {title}")[:160]
+    out_template = os.path.join(out_dir, safe_base + ".%(ext)s")
+    track_cmd = [
+        YT_DLP_BIN,
+        "--ffmpeg-location", FFMPEG_BIN,
+        "--js-runtimes", "node",
+        _track_search_query(track_meta),
+        "--extract-audio", "--audio-format", "mp3", "--audio-quality", "0",
+        "--add-metadata",
+        "--postprocessor-args", _track_tag_args(track_meta),
+        "--no-playlist",
+        "--print", "after_move:filepath",
+        "-o", out_template,
+    ]
+    track_cmd = track_cmd[:1] + extra_args + track_cmd[1:]
+    lock = ctx["lock"]
+    p = None
+    try:
+        p = _spawn_ytdlp(track_cmd, _ytdlp_progress(job_id, set_phase=False))
+        with jobs_lock:
+            jobs[job_id]["process"] = p
+            jobs[job_id].setdefault("processes", []).append(p)
+        track_out = None
+        for raw_line in p.stdout:
+            line = raw_line.rstrip()
+            with lock:
+                try:
+                    ctx["log_file"].write(line + "\n")
+                except Exception:
+                    pass
+                paths = None
+                if os.path.isabs(line) and os.path.splitext(line)[1].lower() not in _IMAGE_EXTS:
+                    track_out = line
+                    ctx["outputs"].setdefault(idx, []).append(line)
+                    paths = [fp for i in sorted(ctx["outputs"]) for fp in ctx["outputs"][i]]
+            with jobs_lock:
+                _log_append(jobs[job_id], line)
+                _note_destination(jobs[job_id], line)
+                jobs[job_id]["last_output_at"] = time.time()
+                jobs[job_id].pop("phase_note", None)
+                if paths is not None:
+                    jobs[job_id]["output_paths"] = paths
+                if jobs[job_id].get("cancel_requested"):
+                    try: p.terminate()
+                    except Exception: pass
+                    break
+        track_code = p.wait()
+        with jobs_lock:
+            if jobs[job_id].get("cancel_requested"):
+                return False
+        if track_code == 0 and track_out:
+            return True
+    except Exception as ex:
+        with jobs_lock:
+            _log_append(jobs[job_id], f"Error: {ex}")
+    finally:
+        if p is not None:
+            with jobs_lock:
+                procs = jobs[job_id].get("processes") or []
+                if p in procs:
+                    procs.remove(p)
+    with lock:
+        ctx["failures"][idx] = f"{artist} - {title}"
+        failures = [ctx["failures"][i] for i in sorted(ctx["failures"])]
+    with jobs_lock:
+        jobs[job_id]["failures"] = failures
+    return False
+
+
+def _run_collection_tracks(job_id: str, tracks: list, out_dir: str, extra_args: list, log_file) -> dict:
+    """Download every track of a collection with up to TRACK_FANOUT in flight.
+
+    Tracks finish out of order, so current_index/progress_pct count completed
+    tracks, and output_paths/failures are kept in track order. Returns
+    {"output_paths": [...], "failures": [...]}.
+    """
+    total = len(tracks)
+    ctx = {"lock": threading.Lock(), "outputs": {}, "failures": {}, "log_file": log_file,
+           "next": 0, "done": 0, "helpers": 0}
+    lock = ctx["lock"]
 
-        def api_get(path_or_url):
-            full = path_or_url if path_or_url.startswith("http") else f"https://api.spotify.com/v1/{path_or_url.lstrip('/')}"
-            r = urllib.request.Request(full, headers={"Authorization": f"Bearer {token}"})
-            with urllib.request.urlopen(r, timeout=10) as resp:
-                return json.loads(resp.read())
+    def take():
+        with jobs_lock:
+            if jobs[job_id].get("cancel_requested"):
+                return None
+        with lock:
+            if ctx["next"] >= total:
+                return None
+            ctx["next"] += 1
+            return ctx["next"] - 1
+
+    def run(idx):
+        ok = _download_collection_track(job_id, idx, total, tracks[idx], out_dir, extra_args, ctx)
+        with jobs_lock:
+            if not ok and jobs[job_id].get("cancel_requested"):
+                return
+        with lock:
+            ctx["done"] += 1
+            done = ctx["done"]
+        with jobs_lock:
+            jobs[job_id]["current_index"] = done
+            jobs[job_id]["progress_pct"] = int((done / total) * 100) if total > 0 else 0
+            jobs[job_id]["phase"] = f"Downloading track {min(done + 1, total)}/{total}"
 
-        data = api_get(f"playlists/{entity_id}")
-        tdata = data.get("tracks", {})
-        tracks = []
-        items, next_url = tdata.get("items", []), tdata.get("next")
+    def helper():
+        try:
+            while True:
+                with queue_cv:
+                    if job_queue:
+                        break  # hand the borrowed slot to a job that's waiting for one
+                idx = take()
+                if idx is None:
+                    break
+                run(idx)
+        finally:
+            with lock:
+                ctx["helpers"] -= 1
+            _release_slot()
+
+    with jobs_lock:
+        jobs[job_id]["phase"] = f"Downloading track 1/{total}"
+    threads = []
+    while True:
         while True:
-            for item in items:
-                t = item.get("track") if item else None
-                if t and t.get("name"):
-                    artist = ", ".join(a["name"] for a in t.get("artists", []))
-                    tracks.append({"title": t["name"], "artist": artist})
-            if not next_url:
+            with lock:
+                want = ctx["helpers"] < TRACK_FANOUT - 1 and total - ctx["next"] > 1
+            if not want or not _try_borrow_slot():
                 break
-            page = api_get(next_url)
-            items, next_url = page.get("items", []), page.get("next")
-        return {"kind": "playlist", "name": data.get("name", "playlist"), "tracks": tracks}
+            with lock:
+                ctx["helpers"] += 1
+            t = threading.Thread(target=helper, daemon=True)
+            t.start()
+            threads.append(t)
+        idx = take()
+        if idx is None:
+            break
+        run(idx)
+    for t in threads:
+        t.join()
+    with lock:
+        return {
+            "output_paths": [fp for i in sorted(ctx["outputs"]) for fp in ctx["outputs"][i]],
+            "failures": [ctx["failures"][i] for i in sorted(ctx["failures"])],
+        }
 
 
-def restore_jobs_from_disk():
-    data = load_jobs()
-    now = datetime.utcnow()
+def _job_history_record(job_id: str, job: dict) -> dict:
+    """history.json entry for a finished job (job is a snapshot of its record)."""
+    job_type = job.get("type", "video")
+    file_val = job.get("file")
+    output_val = job.get("output_path")
+    record = {
+        "job_id": job_id,
+        "timestamp": datetime.utcnow().isoformat(),
+        "url": job.get("url"),
+        "type": job_type,
+        "final_status": job.get("status"),
+        "output_path": output_val or (os.path.join(DOWNLOAD_DIR, file_val) if file_val else None),
+        "output_paths": job.get("output_paths", []),
+        "sc_quality": job.get("sc_quality", "m4a") if job_type == "soundcloud" else None,
+        "sc_playlist": job.get("sc_playlist", True) if job_type == "soundcloud" else None,
+        "failures": job.get("failures", []) if job_type in _COLLECTION_SOURCES else [],
+        "wait_seconds": job.get("wait_seconds"),
+        "cache_hit": bool(job.get("cache_hit")),
+        "title": None,
+        "id": None,
+    }
+    file_for_meta = os.path.basename(record["output_path"]) if record["output_path"] else file_val
+    if file_for_meta and "[" in file_for_meta and "]" in file_for_meta:
+        try:
+            title_part, _, rest = file_for_meta.rpartition(" [")
+            record["title"] = title_part.strip()
+            record["id"] = rest.split("]", 1)[0]
+        except Exception:
+            pass
+    return record
+
+
+def _run_collection_job(job_id: str, job_type: str, info: dict, extra_args: list, log_file):
+    """Run a collection job end to end: prepare the output dir, download every
+    track, then settle the final status. Shared by all _COLLECTION_SOURCES."""
+    source = _COLLECTION_SOURCES[job_type]
+    tracks = info.get("tracks", [])
+    kind = info.get("kind", "track")
+    coll_name = info.get("name", source["default_name"])
+    safe_coll = re.sub(r'[\\/:*?"<>|]', "_", coll_name)[:80].strip()
+    out_dir = source["tracks_dir"] if kind == "track" else os.path.join(source["root_dir"], safe_coll or source["default_dir"])
+    os.makedirs(out_dir, exist_ok=True)
+    total = len(tracks)
     with jobs_lock:
-        for jid, meta in data.items():
-            # Re-hydrate datetime fields that were serialized as strings
-            for field in ("created_at", "finished_at"):
-                meta[field] = _parse_dt(meta.get(field))
-            status = meta.get("status", "unknown")
-            if status == "running":
-                meta["status"] = "error"
-                meta["phase"] = "Failed"
-                meta["error_message"] = "The server restarted while this job was running. Please try again."
-                meta["log"] = "Server restarted during download"
-                meta["finished_at"] = now
-            elif status == "queued":
-                meta["status"] = "cancelled"
-                meta["phase"] = "Cancelled"
-                meta["log"] = "Cancelled after restart"
-                meta["finished_at"] = now
-            meta.setdefault("log", "")
-            meta.setdefault("output_paths", [])
-            meta.setdefault("sc_quality", "m4a")
-            meta.setdefault("sc_playlist", True)
-            meta.setdefault("spotify_info", None)
-            meta.setdefault("apple_music_info", None)
-            meta.setdefault("current_index", 0)
-            meta.setdefault("total_items", 0)
-            meta.setdefault("progress_pct", 0)
-            meta.setdefault("failures", [])
-            jobs[jid] = meta
-    save_jobs()
+        jobs[job_id]["started_at"] = time.time()
+        jobs[job_id]["last_output_at"] = time.time()
+        jobs[job_id]["phase"] = f"Preparing {source['label']} tracks"
+    threading.Thread(target=_stall_monitor, args=(job_id,), daemon=True).start()
+
+    outcome = _run_collection_tracks(job_id, tracks, out_dir, extra_args, log_file)
+    output_paths = outcome["output_paths"]
+    output_path = output_paths[-1] if output_paths else None
+    failures_list = outcome["failures"]
+
+    # Final status
+    with jobs_lock:
+        cancelled = jobs[job_id].get("cancel_requested")
+    if cancelled:
+        with jobs_lock:
+            jobs[job_id]["status"] = "cancelled"
+            jobs[job_id]["phase"] = "Cancelled"
+            jobs[job_id].pop("phase_note", None)
+            _log_append(jobs[job_id], "Cancelled by user")
+        save_jobs()
+    elif failures_list and len(failures_list) == total:
+        with jobs_lock:
+            jobs[job_id]["status"] = "error"
+            jobs[job_id]["phase"] = "Failed"
+            jobs[job_id].pop("phase_note", None)
+            jobs[job_id]["error_message"] = f"All {total} tracks failed to match on YouTube."
+            _log_append(jobs[job_id], f"All {total} tracks failed.")
+        save_jobs()
+    else:
+        with jobs_lock:
+            jobs[job_id]["status"] = "done"
+            jobs[job_id]["phase"] = "Complete"
+            jobs[job_id].pop("phase_note", None)
+            jobs[job_id]["progress_pct"] = 100
+            jobs[job_id]["current_index"] = total
+            jobs[job_id]["output_paths"] = list(output_paths)
+            if output_path:
+                jobs[job_id]["output_path"] = output_path
+                jobs[job_id]["file"] = os.path.basename(output_path)
+            if failures_list:
+                _log_append(jobs[job_id], f"{len(failures_list)} failed: {', '.join(failures_list[:5])}")
+        save_jobs()
+
 
 def run_job(job_id: str):
     with jobs_lock:
@@ -4397,23 +6982,29 @@ def run_job(job_id: str):
         if not job or job.get("status") != "queued":
             if job:
                 _release_ip(job.get("client_ip"))
-            job_sema.release()
+            _release_job_slot(job_id)
             return
         job["status"] = "running"
+        job["started_at"] = time.time()
+        created = job.get("created_at")
+        if isinstance(created, datetime):  # the whole wait the user saw: resolving + queue
+            job["wait_seconds"] = round(max(0.0, (datetime.utcnow() - created).total_seconds()), 3)
+            with queue_cv:
+                _wait_samples.append(job["wait_seconds"])
         job_type = job.get("type", "video")
         url = job.get("url")
         sc_quality = job.get("sc_quality", "m4a")
         sc_playlist = job.get("sc_playlist", True)
-        spotify_info = job.get("spotify_info") or {}
-        apple_music_info = job.get("apple_music_info") or {}
+        source = _COLLECTION_SOURCES.get(job_type)
+        collection_info = (job.get(source["info_field"]) if source else None) or {}
         client_ip_val = job.get("client_ip")
-        save_jobs()
+    save_jobs()
     if not url:
         with jobs_lock:
             jobs[job_id]["status"] = "error"
             jobs[job_id]["log"] = "Missing URL"
         _release_ip(client_ip_val)
-        job_sema.release()
+        _release_job_slot(job_id)
         return
 
     cookies_args = []
@@ -4476,301 +7067,53 @@ def run_job(job_id: str):
         ]
 
     output_paths = []   # all non-thumbnail absolute paths printed by yt-dlp
-    _IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
     output_path = None  # backward-compat: last detected path
     last_file = None
     log_file = None
     cmd = cmd[:1] + cookies_args + proxy_args + cmd[1:]
 
     try:
-        log_file = job_log_path(job_id).open("a", encoding="utf-8")
-
-        if job_type == "spotify":
-            tracks = spotify_info.get("tracks", [])
-            kind = spotify_info.get("kind", "track")
-            coll_name = spotify_info.get("name", "spotify_download")
-            safe_coll = re.sub(r'[\\/:*?"<>|]', "_", coll_name)[:80].strip()
-            out_dir = SPOTIFY_TRACKS_DIR if kind == "track" else os.path.join(SPOTIFY_DIR, safe_coll or "playlist")
-            os.makedirs(out_dir, exist_ok=True)
-            total = len(tracks)
-            failures_list = []
-            with jobs_lock:
-                jobs[job_id]["started_at"] = time.time()
-                jobs[job_id]["last_output_at"] = time.time()
-                jobs[job_id]["phase"] = "Preparing Spotify tracks"
-            threading.Thread(target=_stall_monitor, args=(job_id,), daemon=True).start()
+        log_file = job_log_path(job_id).open("a", encoding="utf-8", buffering=1)  # line-buffered for ?follow
 
-            for idx, track_meta in enumerate(tracks):
-                with jobs_lock:
-                    if jobs[job_id].get("cancel_requested"):
-                        break
-                title = track_meta.get("title", "")
-                artist = track_meta.get("artist", "")
-                # Update per-track progress
-                pct = int((idx / total) * 100) if total > 0 else 0
-                with jobs_lock:
-                    jobs[job_id]["current_index"] = idx
-                    jobs[job_id]["progress_pct"] = pct
-                    jobs[job_id]["last_output_at"] = time.time()
-                    jobs[job_id]["phase"] = f"Downloading track {idx+1}/{total}"
-                    jobs[job_id].pop("phase_note", None)
-                    old_log = jobs[job_id].get("log", "")
-                    jobs[job_id]["log"] = "\n".join(
-                        (old_log + f"\n[{idx+1}/{total}] {artist} - {title}").splitlines()[-120:]
-                    )
-                # Build yt-dlp ytsearch command
-                safe_title  = _sanitize_metadata(title)
-                safe_artist = _sanitize_metadata(artist)
-                safe_base = re.sub(r'[\\/:*?"<>|]', "_", f"{artist} - {title}")[:160]
-                out_template = os.path.join(out_dir, safe_base + ".%(ext)s")
-                ppa = f'ffmpeg:-metadata title="{safe_title}" -metadata artist="{safe_artist}"'
-                track_cmd = [
-                    YT_DLP_BIN,
-                    "--ffmpeg-location", FFMPEG_BIN,
-                    "--js-runtimes", "node",
-                    f"ytsearch1:{artist} - {title}",
-                    "--extract-audio", "--audio-format", "mp3", "--audio-quality", "0",
-                    "--add-metadata",
-                    "--postprocessor-args", ppa,
-                    "--no-playlist",
-                    "--print", "after_move:filepath",
-                    "-o", out_template,
-                ]
-                track_cmd = track_cmd[:1] + cookies_args + proxy_args + track_cmd[1:]
-                try:
-                    p = subprocess.Popen(track_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-                    with jobs_lock:
-                        jobs[job_id]["process"] = p
-                    track_out = None
-                    for raw_line in p.stdout:
-                        line = raw_line.rstrip()
-                        try:
-                            log_file.write(line + "\n")
-                        except Exception:
-                            pass
-                        if os.path.isabs(line) and os.path.splitext(line)[1].lower() not in _IMAGE_EXTS:
-                            track_out = line
-                            output_path = line
-                            output_paths.append(line)
-                        with jobs_lock:
-                            jobs[job_id]["log"] = "\n".join(
-                                (jobs[job_id].get("log", "") + "\n" + line).splitlines()[-120:]
-                            )
-                            jobs[job_id]["last_output_at"] = time.time()
-                            jobs[job_id].pop("phase_note", None)
-                            jobs[job_id]["output_paths"] = list(output_paths)
-                        with jobs_lock:
-                            if jobs[job_id].get("cancel_requested"):
-                                try: p.terminate()
-                                except Exception: pass
-                                break
-                    track_code = p.wait()
-                    with jobs_lock:
-                        if jobs[job_id].get("cancel_requested"):
-                            break
-                    if track_code != 0 or not track_out:
-                        failures_list.append(f"{artist} - {title}")
-                        with jobs_lock:
-                            jobs[job_id]["failures"] = list(failures_list)
-                except Exception as ex:
-                    failures_list.append(f"{artist} - {title}")
-                    with jobs_lock:
-                        jobs[job_id]["failures"] = list(failures_list)
-                        jobs[job_id]["log"] += f"\nError: {ex}"
-
-            # Final status
-            with jobs_lock:
-                cancelled = jobs[job_id].get("cancel_requested")
-            if cancelled:
-                with jobs_lock:
-                    jobs[job_id]["status"] = "cancelled"
-                    jobs[job_id]["phase"] = "Cancelled"
-                    jobs[job_id].pop("phase_note", None)
-                    jobs[job_id]["log"] += "\nCancelled by user"
-                    save_jobs()
-            elif failures_list and len(failures_list) == total:
-                with jobs_lock:
-                    jobs[job_id]["status"] = "error"
-                    jobs[job_id]["phase"] = "Failed"
-                    jobs[job_id].pop("phase_note", None)
-                    jobs[job_id]["error_message"] = f"All {total} tracks failed to match on YouTube."
-                    jobs[job_id]["log"] += f"\nAll {total} tracks failed."
-                    save_jobs()
-            else:
-                with jobs_lock:
-                    jobs[job_id]["status"] = "done"
-                    jobs[job_id]["phase"] = "Complete"
-                    jobs[job_id].pop("phase_note", None)
-                    jobs[job_id]["progress_pct"] = 100
-                    jobs[job_id]["current_index"] = total
-                    jobs[job_id]["output_paths"] = list(output_paths)
-                    if output_path:
-                        jobs[job_id]["output_path"] = output_path
-                        jobs[job_id]["file"] = os.path.basename(output_path)
-                    if failures_list:
-                        jobs[job_id]["log"] += f"\n{len(failures_list)} failed: {', '.join(failures_list[:5])}"
-                    save_jobs()
-            return  # finally block still fires
-        # --- END SPOTIFY BRANCH ---
-
-        if job_type == "apple_music":
-            tracks = apple_music_info.get("tracks", [])
-            kind = apple_music_info.get("kind", "track")
-            coll_name = apple_music_info.get("name", "apple_music_download")
-            safe_coll = re.sub(r'[\\/:*?"<>|]', "_", coll_name)[:80].strip()
-            out_dir = APPLE_MUSIC_TRACKS_DIR if kind == "track" else os.path.join(APPLE_MUSIC_DIR, safe_coll or "album")
-            os.makedirs(out_dir, exist_ok=True)
-            total = len(tracks)
-            failures_list = []
-            with jobs_lock:
-                jobs[job_id]["started_at"] = time.time()
-                jobs[job_id]["last_output_at"] = time.time()
-                jobs[job_id]["phase"] = "Preparing Apple Music tracks"
-            threading.Thread(target=_stall_monitor, args=(job_id,), daemon=True).start()
-
-            for idx, track_meta in enumerate(tracks):
-                with jobs_lock:
-                    if jobs[job_id].get("cancel_requested"):
-                        break
-                title = track_meta.get("title", "")
-                artist = track_meta.get("artist", "")
-                # Update per-track progress
-                pct = int((idx / total) * 100) if total > 0 else 0
-                with jobs_lock:
-                    jobs[job_id]["current_index"] = idx
-                    jobs[job_id]["progress_pct"] = pct
-                    jobs[job_id]["last_output_at"] = time.time()
-                    jobs[job_id]["phase"] = f"Downloading track {idx+1}/{total}"
-                    jobs[job_id].pop("phase_note", None)
-                    old_log = jobs[job_id].get("log", "")
-                    jobs[job_id]["log"] = "\n".join(
-                        (old_log + f"\n[{idx+1}/{total}] {artist} - {title}").splitlines()[-120:]
-                    )
-                # Build yt-dlp ytsearch command
-                safe_title  = _sanitize_metadata(title)
-                safe_artist = _sanitize_metadata(artist)
-                safe_base = re.sub(r'[\\/:*?"<>|]', "_", f"{artist} - {title}")[:160]
-                out_template = os.path.join(out_dir, safe_base + ".%(ext)s")
-                ppa = f'ffmpeg:-metadata title="{safe_title}" -metadata artist="{safe_artist}"'
-                track_cmd = [
-                    YT_DLP_BIN,
-                    "--ffmpeg-location", FFMPEG_BIN,
-                    "--js-runtimes", "node",
-                    f"ytsearch1:{artist} - {title}",
-                    "--extract-audio", "--audio-format", "mp3", "--audio-quality", "0",
-                    "--add-metadata",
-                    "--postprocessor-args", ppa,
-                    "--no-playlist",
-                    "--print", "after_move:filepath",
-                    "-o", out_template,
-                ]
-                track_cmd = track_cmd[:1] + cookies_args + proxy_args + track_cmd[1:]
-                try:
-                    p = subprocess.Popen(track_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-                    with jobs_lock:
-                        jobs[job_id]["process"] = p
-                    track_out = None
-                    for raw_line in p.stdout:
-                        line = raw_line.rstrip()
-                        try:
-                            log_file.write(line + "\n")
-                        except Exception:
-                            pass
-                        if os.path.isabs(line) and os.path.splitext(line)[1].lower() not in _IMAGE_EXTS:
-                            track_out = line
-                            output_path = line
-                            output_paths.append(line)
-                        with jobs_lock:
-                            jobs[job_id]["log"] = "\n".join(
-                                (jobs[job_id].get("log", "") + "\n" + line).splitlines()[-120:]
-                            )
-                            jobs[job_id]["last_output_at"] = time.time()
-                            jobs[job_id].pop("phase_note", None)
-                            jobs[job_id]["output_paths"] = list(output_paths)
-                        with jobs_lock:
-                            if jobs[job_id].get("cancel_requested"):
-                                try: p.terminate()
-                                except Exception: pass
-                                break
-                    track_code = p.wait()
-                    with jobs_lock:
-                        if jobs[job_id].get("cancel_requested"):
-                            break
-                    if track_code != 0 or not track_out:
-                        failures_list.append(f"{artist} - {title}")
-                        with jobs_lock:
-                            jobs[job_id]["failures"] = list(failures_list)
-                except Exception as ex:
-                    failures_list.append(f"{artist} - {title}")
-                    with jobs_lock:
-                        jobs[job_id]["failures"] = list(failures_list)
-                        jobs[job_id]["log"] += f"\nError: {ex}"
-
-            # Final status
-            with jobs_lock:
-                cancelled = jobs[job_id].get("cancel_requested")
-            if cancelled:
-                with jobs_lock:
-                    jobs[job_id]["status"] = "cancelled"
-                    jobs[job_id]["phase"] = "Cancelled"
-                    jobs[job_id].pop("phase_note", None)
-                    jobs[job_id]["log"] += "\nCancelled by user"
-                    save_jobs()
-            elif failures_list and len(failures_list) == total:
-                with jobs_lock:
-                    jobs[job_id]["status"] = "error"
-                    jobs[job_id]["phase"] = "Failed"
-                    jobs[job_id].pop("phase_note", None)
-                    jobs[job_id]["error_message"] = f"All {total} tracks failed to match on YouTube."
-                    jobs[job_id]["log"] += f"\nAll {total} tracks failed."
-                    save_jobs()
-            else:
-                with jobs_lock:
-                    jobs[job_id]["status"] = "done"
-                    jobs[job_id]["phase"] = "Complete"
-                    jobs[job_id].pop("phase_note", None)
-                    jobs[job_id]["progress_pct"] = 100
-                    jobs[job_id]["current_index"] = total
-                    jobs[job_id]["output_paths"] = list(output_paths)
-                    if output_path:
-                        jobs[job_id]["output_path"] = output_path
-                        jobs[job_id]["file"] = os.path.basename(output_path)
-                    if failures_list:
-                        jobs[job_id]["log"] += f"\n{len(failures_list)} failed: {', '.join(failures_list[:5])}"
-                    save_jobs()
+        if job_type in _COLLECTION_SOURCES:
+            _run_collection_job(job_id, job_type, collection_info, cookies_args + proxy_args, log_file)
             return  # finally block still fires
-        # --- END APPLE MUSIC BRANCH ---
 
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        p = _spawn_ytdlp(cmd, _ytdlp_progress(job_id))
         with jobs_lock:
             jobs[job_id]["process"] = p
             jobs[job_id]["started_at"] = time.time()
             jobs[job_id]["last_output_at"] = time.time()
             jobs[job_id]["phase"] = "Resolving URL"
+            jobs[job_id]["log"] = _JobLog()
         threading.Thread(target=_stall_monitor, args=(job_id,), daemon=True).start()
-        log_lines = []
+        COOKIE_EXPIRED_SIGNAL = "The provided YouTube account cookies are no longer valid"
+        cookies_expired = False
         for raw_line in p.stdout:
             line = raw_line.rstrip()
-            log_lines.append(line)
+            cookies_expired = cookies_expired or COOKIE_EXPIRED_SIGNAL in line
             try:
                 log_file.write(line + "\n")
             except Exception:
                 pass
             # Detect printed final path
+            new_path = False
             if os.path.isabs(line):
                 if os.path.splitext(line)[1].lower() not in _IMAGE_EXTS:
                     output_paths.append(line)
                     output_path = line
+                    new_path = True
             if "Destination:" in line and not output_path:
                 last_file = line.split("Destination:", 1)[-1].strip()
             new_phase = _detect_phase(line)
             with jobs_lock:
-                jobs[job_id]["log"] = "\n".join(log_lines[-120:])
+                _log_append(jobs[job_id], line)
+                _note_destination(jobs[job_id], line)
                 jobs[job_id]["last_output_at"] = time.time()
                 jobs[job_id].pop("phase_note", None)
                 if new_phase:
                     jobs[job_id]["phase"] = new_phase
-                if output_path:
+                if new_path:
                     jobs[job_id]["output_path"] = output_path
                     jobs[job_id]["output_paths"] = list(output_paths)
             # stop early if cancel requested
@@ -4788,8 +7131,8 @@ def run_job(job_id: str):
                 jobs[job_id]["status"] = "cancelled"
                 jobs[job_id]["phase"] = "Cancelled"
                 jobs[job_id].pop("phase_note", None)
-                jobs[job_id]["log"] = jobs[job_id].get("log", "") + "\nCancelled by user"
-                save_jobs()
+                _log_append(jobs[job_id], "Cancelled by user")
+            save_jobs()
         elif code == 0:
             with jobs_lock:
                 jobs[job_id]["status"] = "done"
@@ -4800,43 +7143,42 @@ def run_job(job_id: str):
                 if final_path:
                     jobs[job_id]["file"] = os.path.basename(final_path)
                     jobs[job_id]["output_path"] = final_path if os.path.isabs(final_path) else os.path.join(DOWNLOAD_DIR, final_path)
-                save_jobs()
+            save_jobs()
         else:
-            COOKIE_EXPIRED_SIGNAL = "The provided YouTube account cookies are no longer valid"
-            captured_output = "\n".join(log_lines)
-            if cookies_args and COOKIE_EXPIRED_SIGNAL in captured_output:
+            if cookies_args and cookies_expired:
                 with jobs_lock:
-                    jobs[job_id]["log"] = jobs[job_id].get("log", "") + "\n[auto-retry] Cookies expired — retrying without authentication...\n"
+                    _log_append(jobs[job_id], "[auto-retry] Cookies expired — retrying without authentication...")
                     jobs[job_id]["status"] = "running"
 
                 cmd_no_cookies = [cmd[0]] + [a for a in cmd[1:] if a not in ("--cookies", COOKIES_PATH)]
 
-                p2 = subprocess.Popen(cmd_no_cookies, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                p2 = _spawn_ytdlp(cmd_no_cookies, _ytdlp_progress(job_id))
                 with jobs_lock:
                     jobs[job_id]["process"] = p2
                     jobs[job_id]["last_output_at"] = time.time()
-                log_lines = []
                 for raw_line in p2.stdout:
                     line = raw_line.rstrip()
-                    log_lines.append(line)
                     try:
                         log_file.write(line + "\n")
                     except Exception:
                         pass
+                    new_path = False
                     if os.path.isabs(line):
                         if os.path.splitext(line)[1].lower() not in _IMAGE_EXTS:
                             output_paths.append(line)
                             output_path = line
+                            new_path = True
                     if "Destination:" in line and not output_path:
                         last_file = line.split("Destination:", 1)[-1].strip()
                     new_phase = _detect_phase(line)
                     with jobs_lock:
-                        jobs[job_id]["log"] = "\n".join(log_lines[-120:])
+                        _log_append(jobs[job_id], line)
+                        _note_destination(jobs[job_id], line)
                         jobs[job_id]["last_output_at"] = time.time()
                         jobs[job_id].pop("phase_note", None)
                         if new_phase:
                             jobs[job_id]["phase"] = new_phase
-                        if output_path:
+                        if new_path:
                             jobs[job_id]["output_path"] = output_path
                             jobs[job_id]["output_paths"] = list(output_paths)
                     with jobs_lock:
@@ -4857,7 +7199,7 @@ def run_job(job_id: str):
                     if final_path:
                         jobs[job_id]["file"] = os.path.basename(final_path)
                         jobs[job_id]["output_path"] = final_path if os.path.isabs(final_path) else os.path.join(DOWNLOAD_DIR, final_path)
-                    save_jobs()
+                save_jobs()
             else:
                 with jobs_lock:
                     j = jobs[job_id]
@@ -4867,10 +7209,10 @@ def run_job(job_id: str):
                     if j.get("stall_killed"):
                         j["error_message"] = "Timed out — the source stopped responding."
                     else:
-                        friendly = _classify_error(j.get("log", ""))
+                        friendly = _classify_error(_log_text(j))
                         if friendly:
                             j["error_message"] = friendly
-                    save_jobs()
+                save_jobs()
     except Exception as e:
         with jobs_lock:
             jobs[job_id]["status"] = "error"
@@ -4878,7 +7220,7 @@ def run_job(job_id: str):
             jobs[job_id].pop("phase_note", None)
             jobs[job_id]["error_message"] = "Unexpected server error — please try again."
             jobs[job_id]["log"] = f"Exception: {e}"
-            save_jobs()
+        save_jobs()
     finally:
         try:
             log_file.close()
@@ -4887,62 +7229,147 @@ def run_job(job_id: str):
         with jobs_lock:
             jobs[job_id]["finished_at"] = datetime.utcnow()
             jobs[job_id]["opened_folder"] = jobs[job_id].get("opened_folder", False)
-            job_type = jobs[job_id].get("type", "video")
-            url_val = jobs[job_id].get("url", url)
-            status_val = jobs[job_id]["status"]
-            file_val = jobs[job_id].get("file")
-            output_val = jobs[job_id].get("output_path")
-            output_paths_val = jobs[job_id].get("output_paths", [])
-            sc_quality_val = jobs[job_id].get("sc_quality", "m4a")
-            sc_playlist_val = jobs[job_id].get("sc_playlist", True)
-            failures_val = jobs[job_id].get("failures", [])
-            ip_val = jobs[job_id].get("client_ip")
             jobs[job_id].pop("process", None)
+            jobs[job_id].pop("processes", None)
             jobs[job_id].pop("cancel_requested", None)
-            save_jobs()
-        job_sema.release()
-        _release_ip(ip_val)
-        if status_val == "error":
-            with jobs_lock:
-                final_log = jobs[job_id].get("log", "")
-            _check_cookie_alert(final_log)
-        # history record
-        record = {
-            "job_id": job_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            "url": url_val,
-            "type": job_type,
-            "final_status": status_val,
-            "output_path": output_val or (os.path.join(DOWNLOAD_DIR, file_val) if file_val else None),
-            "output_paths": output_paths_val,
-            "sc_quality": sc_quality_val if job_type == "soundcloud" else None,
-            "sc_playlist": sc_playlist_val if job_type == "soundcloud" else None,
-            "failures": failures_val if job_type in ("spotify", "apple_music") else [],
-            "title": None,
-            "id": None,
-        }
-        file_for_meta = os.path.basename(record["output_path"]) if record["output_path"] else file_val
-        if file_for_meta and "[" in file_for_meta and "]" in file_for_meta:
-            try:
-                title_part, _, rest = file_for_meta.rpartition(" [")
-                record["title"] = title_part.strip()
-                record["id"] = rest.split("]", 1)[0]
-            except Exception:
-                pass
-        append_history(record)
+            jobs[job_id]["log"] = _log_text(jobs[job_id])  # finished: freeze the tail as text
+            snapshot = dict(jobs[job_id])
+        save_jobs()
+        _release_job_slot(job_id)
+        _release_ip(snapshot.get("client_ip"))
+        _disk_track_paths(snapshot.get("output_paths") or [snapshot.get("output_path")])
+        if snapshot["status"] == "error":
+            _check_cookie_alert(snapshot.get("log", ""))
+        append_history(_job_history_record(job_id, snapshot))
+        _settle_followers(job_id)
+        # After settling, so followers never wait on the cache copy.
+        if snapshot["status"] == "done" and snapshot.get("cache_key") and not snapshot.get("failures"):
+            _cache_store(snapshot["cache_key"], snapshot.get("output_paths") or [],
+                         {"total_items": snapshot.get("total_items", 0)})
+
+# ---- Compressed page responses ----
+# Landing, legal and crawler-facing text bodies are compressed once per distinct
+# body (gzip, plus brotli when the module is installed) and served with a
+# strong per-encoding ETag, so repeat visitors and Cloudflare revalidations get
+# a 304 and everyone else gets the smallest encoding they accept.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_PAGE_MIN_COMPRESS = 1024
+
+
+class _PageBody:
+    __slots__ = ("tag", "modified", "variants")
+
+    def __init__(self, text: str):
+        raw = text.encode("utf-8")
+        self.tag = hashlib.sha1(raw).hexdigest()[:20]
+        self.modified = int(time.time())
+        self.variants = {"identity": raw}
+        if len(raw) >= _PAGE_MIN_COMPRESS:
+            self.variants["gzip"] = gzip.compress(raw, 9, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(raw, quality=11)
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.tag}"' if encoding == "identity" else f'"{self.tag}-{encoding}"'
+
+
+_page_bodies = _TTLCache(maxsize=64, ttl=24 * 3600)
+
+
+def _page_response(text: str, mimetype: str = "text/html", max_age: int = 0) -> Response:
+    body = _page_bodies.get(text)
+    if body is None:
+        body = _PageBody(text)
+        _page_bodies.set(text, body)
+    encoding = "identity"
+    for enc in ("br", "gzip"):
+        if enc in body.variants and request.accept_encodings[enc] > 0:
+            encoding = enc
+            break
+    etag = body.etag(encoding)
+    cache_control = f"public, max-age={max_age}" if max_age else "public, no-cache"
+    inm = request.headers.get("If-None-Match", "")
+    if inm:
+        # Weak comparison, and any encoding of the same body counts as a match.
+        tags = {t.strip().removeprefix("W/").strip('"').split("-")[0] for t in inm.split(",")}
+        fresh = body.tag in tags or "*" in tags
+    else:
+        fresh = bool(request.if_modified_since) and request.if_modified_since.timestamp() >= body.modified
+    if fresh:
+        resp = Response(status=304)
+    else:
+        resp = Response(body.variants[encoding], mimetype=mimetype)
+        if encoding != "identity":
+            resp.headers["Content-Encoding"] = encoding
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = cache_control
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.last_modified = body.modified
+    return resp
+
+
+# ---- Templates ----
+# render_template_string recompiles its source on every call; the page templates
+# here are compiled once (warmed at startup) and rendered through the same Jinja
+# environment and context processors. The landing page output only depends on
+# the approved reviews, so it is rendered once and kept until
+# set_review_status() changes that set, or for at most LANDING_TTL_SECONDS: a
+# review approved through another gunicorn worker or web process only
+# invalidates that process's copy.
+LANDING_TTL_SECONDS = float(os.environ.get("YT_UI_LANDING_TTL_SECONDS", "30"))
+_compiled_templates = {}
+_landing_lock = threading.Lock()
+_landing_html = None
+_landing_built_at = 0.0
+
+
+def _template(source: str):
+    tmpl = _compiled_templates.get(source)
+    if tmpl is None:
+        tmpl = _compiled_templates[source] = app.jinja_env.from_string(source)
+    return tmpl
+
+
+def _render(source: str, **context) -> str:
+    """Drop-in for render_template_string() using the compiled template."""
+    app.update_template_context(context)
+    return _template(source).render(context)
+
+
+def _invalidate_landing():
+    global _landing_html
+    with _landing_lock:
+        _landing_html = None
+
+
+def _landing_page() -> str:
+    global _landing_html, _landing_built_at
+    page = _landing_html
+    if page is not None and time.time() - _landing_built_at < LANDING_TTL_SECONDS:
+        return page
+    with _landing_lock:
+        if _landing_html is None or time.time() - _landing_built_at >= LANDING_TTL_SECONDS:
+            agg = review_aggregate()
+            cnt, avg = agg["count"], agg["avg"]
+            filled = int(round(avg)) if cnt else 0
+            _landing_html = _render(
+                HTML,
+                review_count=cnt,
+                avg_rating=avg,
+                avg_stars=("★" * filled + "☆" * (5 - filled)),
+                reviews_html=_render_reviews_html(approved_reviews(limit=24)),
+            )
+            _landing_built_at = time.time()
+        return _landing_html
+
 
 @app.get("/")
 def index():
-    agg = review_aggregate()
-    cnt, avg = agg["count"], agg["avg"]
-    filled = int(round(avg)) if cnt else 0
-    return render_template_string(
-        HTML,
-        review_count=cnt,
-        avg_rating=avg,
-        avg_stars=("★" * filled + "☆" * (5 - filled)),
-        reviews_html=_render_reviews_html(approved_reviews(limit=24)),
-    )
+    return _page_response(_landing_page())
 
 # ── SEO: robots + sitemap ────────────────────────────────────────────
 _SITE_ORIGIN = "https://digitaldownloads.space"
@@ -4962,7 +7389,7 @@ def robots_txt():
         "\n"
         f"Sitemap: {_SITE_ORIGIN}/sitemap.xml\n"
     )
-    return Response(body, mimetype="text/plain")
+    return _page_response(body, "text/plain", max_age=3600)
 
 @app.get("/sitemap.xml")
 def sitemap_xml():
@@ -4988,7 +7415,7 @@ def sitemap_xml():
         f"{urls}"
         "</urlset>\n"
     )
-    return Response(xml, mimetype="application/xml")
+    return _page_response(xml, "application/xml", max_age=3600)
 
 # llms.txt — a markdown summary for AI crawlers/agents (llmstxt.org proposal).
 # Plain-text, content-only; no ranking guarantees, just an accurate brief so
@@ -5023,7 +7450,7 @@ _LLMS_TXT = """# +downloads
 
 @app.get("/llms.txt")
 def llms_txt():
-    return Response(_LLMS_TXT, mimetype="text/plain")
+    return _page_response(_LLMS_TXT, "text/plain", max_age=3600)
 
 # Google Search Console — HTML-file ownership verification. Served at the site
 # root so the URL-prefix property https://digitaldownloads.space/ verifies.
@@ -5036,36 +7463,36 @@ def google_site_verification():
 
 @app.get("/privacy")
 def privacy():
-    return render_template_string(
+    return _page_response(_render(
         _LEGAL_PAGE_TEMPLATE,
         page_title="Privacy Policy",
         updated=_LEGAL_LAST_UPDATED,
         body=_PRIVACY_BODY,
         canonical="https://digitaldownloads.space/privacy",
         meta_desc="How +downloads handles your data: no third-party analytics, no tracking SDKs, no IP logging. The desktop app runs entirely on your machine.",
-    )
+    ), max_age=3600)
 
 @app.get("/terms")
 def terms():
-    return render_template_string(
+    return _page_response(_render(
         _LEGAL_PAGE_TEMPLATE,
         page_title="Terms of Service",
         updated=_LEGAL_LAST_UPDATED,
         body=_TERMS_BODY,
         canonical="https://digitaldownloads.space/terms",
         meta_desc="The terms of service for +downloads — acceptable use, your responsibility for downloaded content, and third-party platform trademark notes.",
-    )
+    ), max_age=3600)
 
 @app.get("/troubleshooting")
 def troubleshooting():
-    return render_template_string(
+    return _page_response(_render(
         _LEGAL_PAGE_TEMPLATE,
         page_title="Troubleshooting",
         updated=_TROUBLESHOOTING_LAST_UPDATED,
         body=_TROUBLESHOOTING_BODY,
         canonical="https://digitaldownloads.space/troubleshooting",
         meta_desc="Help with +downloads: switching from the free trial to the full version, the macOS keychain &ldquo;security&rdquo; prompt about Chrome Safe Storage, and other common questions. Plain-language steps for Mac, Windows and Linux.",
-    )
+    ), max_age=3600)
 
 @app.get("/desktop/buy")
 def desktop_buy():
@@ -5107,7 +7534,7 @@ def desktop_redeem():
     state, message = _desktop_redeem_state(token)
     detected = _detect_os(request.headers.get("User-Agent", ""))
     builds = _redeem_build_options(detected) if state == "confirmed" else []
-    return render_template_string(
+    return _render(
         _DESKTOP_REDEEM_HTML,
         state=state,
         message=message,
@@ -5143,7 +7570,7 @@ def desktop_redeem_download():
     used = _consume_token(token)
     if not used.get("valid"):
         return redirect(f"/desktop/redeem?token={quote(token)}", code=302)
-    return send_file(path, as_attachment=True, download_name=fn)
+    return _send_download(path, fn)
 
 
 @app.get("/desktop/update")
@@ -5158,9 +7585,9 @@ def desktop_update():
         path = DESKTOP_BUILDS_DIR / fn if fn else None
         if not fn or not path.exists():
             abort(404)
-        return send_file(path, as_attachment=True, download_name=fn)
+        return _send_download(path, fn)
     detected = _detect_os(request.headers.get("User-Agent", ""))
-    return render_template_string(
+    return _render(
         _DESKTOP_REDEEM_HTML,
         state="update",
         message="",
@@ -5200,9 +7627,9 @@ def desktop_trial():
         path = DESKTOP_BUILDS_TRIAL_DIR / fn if fn else None
         if not fn or not path.exists():
             abort(404)
-        return send_file(path, as_attachment=True, download_name=fn)
+        return _send_download(path, fn)
     detected = _detect_os(request.headers.get("User-Agent", ""))
-    return render_template_string(
+    return _render(
         _DESKTOP_TRIAL_HTML,
         builds=_redeem_build_options(detected, DESKTOP_BUILDS_TRIAL_DIR),
         detected_os=detected,
@@ -5321,7 +7748,7 @@ _REVIEW_HTML = r"""<!doctype html>
 
 @app.get("/review")
 def review_page():
-    return render_template_string(
+    return _render(
         _REVIEW_HTML,
         thanks=request.args.get("thanks") == "1",
         error=request.args.get("e") == "1",
@@ -5368,7 +7795,7 @@ def start():
         if not (client_token and _is_token_valid(client_token)):
             return jsonify({"error": "paused", "paused": True}), 503
         paused_bypass = True
-    if not is_valid_url(url):
+    if not _is_http_url(url):
         return jsonify({"error": "Invalid URL"}), 400
     _BLOCKED_DOMAINS = {
         "pornhub", "xvideos", "xnxx", "xhamster", "redtube", "youporn",
@@ -5387,59 +7814,126 @@ def start():
         return jsonify({"error": "Adult content is not supported."}), 400
     if detect_soundcloud(url) and job_type in {"", "auto", "video", "audio"}:
         job_type = "soundcloud"
-    if detect_spotify(url):
-        job_type = "spotify"
-    if detect_apple_music(url):
-        job_type = "apple_music"
-    if job_type not in {"video", "audio", "soundcloud", "spotify", "apple_music"}:
-        return jsonify({"error": "Invalid type; must be video, audio, soundcloud, spotify, or apple_music"}), 400
+    job_type = _collection_source_for(url) or job_type
+    valid_types = ["video", "audio", "soundcloud", *_COLLECTION_SOURCES]
+    if job_type not in valid_types:
+        return jsonify({"error": f"Invalid type; must be {', '.join(valid_types[:-1])}, or {valid_types[-1]}"}), 400
 
     sc_quality = (data.get("sc_quality") or "m4a").strip().lower()
     if sc_quality not in {"m4a", "mp3"}:
         sc_quality = "m4a"
     sc_playlist = bool(data.get("sc_playlist", True))
 
-    spotify_info = None
-    if job_type == "spotify":
+    def admitted(job_id: str, status_val: str):
+        resp = {"job_id": job_id, "status": status_val}
+        if paused_bypass and client_token:
+            consumed = _consume_token(client_token)
+            if consumed.get("valid"):
+                resp["token_remaining"] = consumed.get("remaining")
+        return jsonify(resp)
+
+    # Cache hit: the job completes instantly with links to the cached files.
+    cache_key = _cache_key(url, job_type, sc_quality, sc_playlist)
+    cached = _cache_lookup(cache_key)
+    if cached:
+        # Limits first, so a refused request never links or copies anything.
+        ip = _client_ip()
+        err, code = _check_ip_limits(ip)
+        if err:
+            return jsonify({"error": err}), code
+        _release_ip(ip)
+        job_id = str(uuid.uuid4())
         try:
-            spotify_info = _spotify_fetch_metadata(url)
-        except Exception as e:
-            return jsonify({"error": f"Spotify API error: {e}"}), 400
-        if not spotify_info.get("tracks"):
-            return jsonify({"error": "No tracks found in Spotify URL."}), 400
-
-    apple_music_info = None
-    if job_type == "apple_music":
-        try:
-            apple_music_info = _apple_music_fetch_metadata(url)
-        except Exception as e:
-            return jsonify({"error": f"Apple Music error: {e}"}), 400
-        if not apple_music_info.get("tracks"):
-            return jsonify({"error": "No tracks found in Apple Music URL."}), 400
+            cached_paths = _cache_materialize(cached, job_id)
+        except OSError:
+            shutil.rmtree(os.path.join(DOWNLOAD_DIR, job_id), ignore_errors=True)
+            cached_paths = []  # fall through to a normal download
+        if cached_paths:
+            total = int(cached["meta"].get("total_items") or 0)
+            now = datetime.utcnow()
+            with jobs_lock:
+                jobs[job_id] = {
+                    "status": "done",
+                    "phase": "Complete",
+                    "log": "Served from cache",
+                    "created_at": now,
+                    "finished_at": now,
+                    "file": os.path.basename(cached_paths[-1]),
+                    "output_path": cached_paths[-1],
+                    "output_paths": cached_paths,
+                    "opened_folder": False,
+                    "type": job_type,
+                    "url": url,
+                    "sc_quality": sc_quality,
+                    "sc_playlist": sc_playlist,
+                    **{field: None for field in _COLLECTION_INFO_FIELDS},
+                    "current_index": total,
+                    "total_items": total,
+                    "progress_pct": 100,
+                    "failures": [],
+                    "wait_seconds": 0.0,
+                    "cache_hit": True,
+                    "client_ip": ip,
+                }
+                snapshot = dict(jobs[job_id])
+            save_jobs()
+            append_history(_job_history_record(job_id, snapshot))
+            return admitted(job_id, "done")
 
-    track_count = len((spotify_info or apple_music_info or {}).get("tracks", []))
-    if track_count > MAX_PLAYLIST_TRACKS:
-        return jsonify({"error": f"Playlist too large ({track_count} tracks). Limit is {MAX_PLAYLIST_TRACKS}."}), 400
+    # Single-flight: attach to an identical job that's already queued or running.
+    flight_key = _flight_key(url, job_type, sc_quality, sc_playlist)
+    follower_id = None
+    with jobs_lock:
+        leader_id = _inflight.get(flight_key)
+        leader = jobs.get(leader_id) if leader_id else None
+        if leader is not None and leader.get("status") in ("queued", "running") and not leader.get("cancel_requested"):
+            ip = _client_ip()
+            err, code = _check_ip_limits(ip)
+            if err:
+                return jsonify({"error": err}), code
+            follower_id = str(uuid.uuid4())
+            jobs[follower_id] = {
+                "status": "following",
+                "follows": leader_id,
+                "log": "Queued…",
+                "created_at": datetime.utcnow(),
+                "file": None,
+                "finished_at": None,
+                "opened_folder": False,
+                "type": job_type,
+                "url": url,
+                "sc_quality": sc_quality,
+                "sc_playlist": sc_playlist,
+                "output_paths": [],
+                **{field: leader.get(field) for field in _COLLECTION_INFO_FIELDS},
+                "current_index": 0,
+                "total_items": leader.get("total_items", 0),
+                "progress_pct": 0,
+                "failures": [],
+                "client_ip": ip,
+                "cache_key": leader.get("cache_key"),
+            }
+            leader["followers"] = leader.get("followers", []) + [follower_id]
+            save_jobs()
+    if follower_id:
+        return admitted(follower_id, "queued")
 
-    if DISK_CAP_GB > 0:
-        try:
-            used_gb = _disk_usage_gb(DOWNLOAD_DIR)
-            if used_gb >= DISK_CAP_GB:
-                return jsonify({"error": "Server storage is full. Try again later."}), 503
-        except Exception:
-            pass
+    if _queued_count() >= MAX_QUEUE_DEPTH:
+        return jsonify({"error": "Queue is full. Try again later."}), 429
 
     ip = _client_ip()
     err, code = _check_ip_limits(ip)
     if err:
         return jsonify({"error": err}), code
 
-    prune_jobs()
+    # Everything slow (DNS check, collection metadata, disk cap) happens in the
+    # resolver; the client gets its job id now and follows along on /status.
     job_id = str(uuid.uuid4())
     with jobs_lock:
         jobs[job_id] = {
-            "status": "queued",
-            "log": "Queued\u2026",
+            "status": "resolving",
+            "phase": "Checking link",
+            "log": "Checking link\u2026",
             "created_at": datetime.utcnow(),
             "file": None,
             "finished_at": None,
@@ -5449,48 +7943,317 @@ def start():
             "sc_quality": sc_quality,
             "sc_playlist": sc_playlist,
             "output_paths": [],
-            "spotify_info": spotify_info,
-            "apple_music_info": apple_music_info,
+            **{field: None for field in _COLLECTION_INFO_FIELDS},
             "current_index": 0,
-            "total_items": track_count,
+            "total_items": 0,
             "progress_pct": 0,
             "failures": [],
             "client_ip": ip,
+            "cache_key": cache_key,
+            "flight_key": flight_key,
         }
-        save_jobs()
-    with queue_cv:
-        if len(job_queue) >= MAX_QUEUE_DEPTH:
-            with jobs_lock:
-                jobs.pop(job_id, None)
-            _release_ip(ip)
-            return jsonify({"error": "Queue is full. Try again later."}), 429
-        job_queue.append(job_id)
-        queue_cv.notify()
-    resp = {"job_id": job_id, "status": "queued"}
-    if paused_bypass and client_token:
-        consumed = _consume_token(client_token)
-        if consumed.get("valid"):
-            resp["token_remaining"] = consumed.get("remaining")
-    return jsonify(resp)
-
-@app.get("/status/<job_id>")
-def status(job_id):
+    save_jobs()
+    with resolve_cv:
+        resolve_queue.append(job_id)
+        resolve_cv.notify()
+    return admitted(job_id, "resolving")
+
+_STATUS_HIDDEN_FIELDS = ("process", "processes", "cancel_requested", "client_ip", "cache_key",
+                         "flight_key", "followers", "follows", "log_job_id", *_COLLECTION_INFO_FIELDS)
+
+def _status_payload(job_id: str, with_log: bool = True):
+    """What /status reports for a job (None if unknown). /events sends the same
+    fields, minus the log, which it streams line by line instead."""
+    _sync_shared_jobs([job_id])
     with jobs_lock:
         job = jobs.get(job_id)
         if not job:
-            return jsonify({"status": "unknown", "log": "No such job"})
+            return None
         # return a shallow copy, excluding non-serializable internals
-        payload = {k: v for k, v in job.items() if k not in ("process", "cancel_requested", "spotify_info", "apple_music_info", "client_ip")}
-        payload["log"] = job.get("log", "")
-    payload["queue_position"] = queue_position(job_id)
-    with queue_cv:
-        payload["queue_length"] = len(job_queue)
-    with jobs_lock:
-        payload["active_count"] = sum(1 for j in jobs.values() if j.get("status") == "running")
+        payload = {k: v for k, v in job.items() if k not in _STATUS_HIDDEN_FIELDS and k != "log"}
+        if with_log:
+            payload["log"] = _log_text(job)
+        position_of = job_id
+        leader = jobs.get(job.get("follows")) if job.get("follows") else None
+        if leader is not None:
+            # Followers show the shared run's live progress under their own id.
+            for k in _FOLLOW_FIELDS:
+                if k == "log":
+                    if with_log:
+                        payload["log"] = _log_text(leader)
+                elif k in leader:
+                    payload[k] = leader[k]
+            if leader.get("status") == "cancelled":
+                payload["status"] = "queued"  # about to be promoted to leader
+            elif leader.get("status") in ("done", "error"):
+                # Not final until _settle_followers hands over the outcome and files.
+                payload["status"] = "running"
+                payload["phase"] = "Finishing up"
+            position_of = job["follows"]
+    payload["queue_position"] = queue_position(position_of)
+    payload["queue_length"] = _queued_count()
+    payload["active_count"] = _running_count()
+    return payload
+
+@app.get("/status/<job_id>")
+def status(job_id):
+    payload = _status_payload(job_id)
+    if payload is None:
+        return jsonify({"status": "unknown", "log": "No such job"})
     return jsonify(payload)
 
+# ---- Job event stream ----
+# /events/<job_id> is a Server-Sent Events alternative to polling /status. The
+# stream sleeps until _job_watchers reports that its record (or its leader's)
+# changed, its log grew, or, while it waits in the queue, a status changed; it
+# then sends an "update" event with just the fields that changed and a "log"
+# event with just the new lines, so an idle stream costs nothing between
+# keepalives. Each open stream still holds a server thread (gunicorn gthread),
+# so at most SSE_MAX_STREAMS are served at once; past that the client gets a
+# 503 and falls back to polling /status. /job-log?follow=1 tails a file, which
+# nothing notifies about, so it still checks every SSE_TICK seconds.
+SSE_MAX_STREAMS = int(os.environ.get("YT_UI_SSE_MAX_STREAMS", "200"))
+SSE_TICK = float(os.environ.get("YT_UI_SSE_TICK", "0.5"))
+SSE_KEEPALIVE = 15.0
+_FINAL_STATUSES = ("done", "error", "cancelled")
+_sse_lock = threading.Lock()
+_sse_streams = 0
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+_MISSING = object()
+
+
+def _job_event_stream(job_id: str):
+    """Sleeps on _job_watchers between events: it wakes when the job, its leader
+    or (while it waits in the queue) any job's status changes, and otherwise
+    only to send a keepalive. Web processes also wake every SHARED_POLL_SECONDS,
+    since download workers change jobs through the database."""
+    sent = {}
+    log_ref, log_seen = None, 0
+    last_key = None
+    last_write = last_sync = 0.0
+    watched = ()
+    try:
+        while True:
+            if ROLE == "web" and time.time() - last_sync >= SHARED_POLL_SECONDS:
+                last_sync = time.time()
+                _sync_shared_jobs([job_id])
+            with jobs_lock:
+                job = jobs.get(job_id)
+                leader_id = job.get("follows") if job is not None else None
+            want = (job_id, leader_id or job_id, _JobWatchers.QUEUE_KEY)
+            if want != watched:
+                for j in want:
+                    _job_watchers.watch(j)
+                for j in watched:
+                    _job_watchers.unwatch(j)
+                watched = want
+            # Taken before the job is read, so any later change ends the wait below.
+            seen = _job_watchers.ticks(watched)
+            with jobs_lock:
+                job = jobs.get(job_id)
+                if job is None:
+                    yield _sse("update", {"status": "unknown"})
+                    return
+                leader = jobs.get(job.get("follows")) if job.get("follows") else None
+                src = leader if leader is not None else job
+                log = src.get("log")
+                key = (job.version, leader.version if leader is not None else None)
+                new_lines, full_log = None, None
+                if log is not log_ref:
+                    full_log = _log_text(src)  # new or replaced log: send the whole tail once
+                elif isinstance(log, _JobLog) and log.appended > log_seen:
+                    new_lines = list(log)[-min(log.appended - log_seen, len(log)):]
+                log_ref, log_seen = log, getattr(log, "appended", 0)
+            chunks = []
+            waiting = sent.get("status") in ("resolving", "queued")  # queue position moves on its own
+            if key != last_key or waiting or full_log is not None:
+                last_key = key
+                payload = _status_payload(job_id, with_log=False)
+                if payload is None:
+                    yield _sse("update", {"status": "unknown"})
+                    return
+                if full_log is not None:
+                    payload["log"] = full_log
+                changed = {k: v for k, v in payload.items() if sent.get(k, _MISSING) != v}
+                if changed:
+                    sent.update(changed)
+                    chunks.append(_sse("update", changed))
+            if new_lines:
+                chunks.append(_sse("log", {"lines": new_lines}))
+            now = time.time()
+            if chunks:
+                yield "".join(chunks)
+                last_write = now
+            elif now - last_write >= SSE_KEEPALIVE:
+                yield ": keepalive\n\n"
+                last_write = now
+            if sent.get("status") in _FINAL_STATUSES:
+                return
+            timeout = max(0.0, last_write + SSE_KEEPALIVE - time.time())
+            if ROLE == "web":
+                timeout = min(timeout, max(0.0, last_sync + SHARED_POLL_SECONDS - time.time()))
+            wait_on = watched if sent.get("status") in ("resolving", "queued") else watched[:2]
+            _job_watchers.wait(wait_on, seen[:len(wait_on)], timeout)
+    finally:
+        for j in watched:
+            _job_watchers.unwatch(j)
+
+
+def _release_stream():
+    global _sse_streams
+    with _sse_lock:
+        _sse_streams = max(0, _sse_streams - 1)
+
+
+@app.get("/events/<job_id>")
+def job_events(job_id):
+    global _sse_streams
+    _sync_shared_jobs([job_id])
+    with jobs_lock:
+        if job_id not in jobs:
+            abort(404)
+    with _sse_lock:
+        if _sse_streams >= SSE_MAX_STREAMS:
+            return jsonify({"error": "Too many open streams; poll /status instead."}), 503
+        _sse_streams += 1
+    resp = Response(_job_event_stream(job_id), mimetype="text/event-stream")
+    resp.call_on_close(_release_stream)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # nginx: flush each event as it's written
+    return resp
+
+# ---- File delivery ----
+# With YT_UI_DELIVERY=nginx, download routes only authorise the request and hand
+# the transfer to nginx with X-Accel-Redirect, pointing at an internal location
+# per served directory (see nginx.conf), so no app thread is held while a large
+# file goes out. Otherwise files are sent from here with Range support; under
+# gunicorn they go through wsgi.file_wrapper, which it serves with sendfile().
+DELIVERY_MODE = os.environ.get("YT_UI_DELIVERY", "app").strip().lower()
+ACCEL_PREFIX = os.environ.get("YT_UI_ACCEL_PREFIX", "/_protected").rstrip("/")
+_ACCEL_ROOTS = (
+    (DOWNLOAD_DIR, "downloads"),
+    (str(DESKTOP_BUILDS_DIR), "builds"),
+    (str(DESKTOP_BUILDS_TRIAL_DIR), "builds-trial"),
+)
+
+
+def _accel_uri(path: str):
+    real = os.path.realpath(path)
+    for root, name in _ACCEL_ROOTS:
+        root = os.path.realpath(root)
+        if os.path.commonpath([real, root]) == root:
+            return f"{ACCEL_PREFIX}/{name}/" + quote(os.path.relpath(real, root).replace(os.sep, "/"))
+    return None
+
+
+def _set_attachment(resp, name: str):
+    """Content-Disposition: attachment for name, encoded the way send_file does:
+    a non-ASCII name gets an ASCII fallback plus an RFC 5987 filename*, since
+    gunicorn rejects header values it can't encode as latin-1."""
+    try:
+        name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+        names = {"filename": simple, "filename*": "UTF-8''" + quote(name, safe="!#$&+-.^_`|~")}
+    else:
+        names = {"filename": name}
+    resp.headers.set("Content-Disposition", "attachment", **names)
+
+
+def _sendfile_response(path: str, name: str, wrapper):
+    """Single-range capable response whose body is a wsgi.file_wrapper positioned
+    at the range start; Content-Length bounds what the server sends."""
+    st = os.stat(path)
+    size = st.st_size
+    etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+    start, length, status = 0, size, 200
+    rng = request.range
+    if_range = request.headers.get("If-Range")
+    if rng is not None and rng.units == "bytes" and len(rng.ranges) == 1 and (not if_range or if_range == etag):
+        bounds = rng.range_for_length(size)
+        if bounds is None:
+            return Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+        start, stop = bounds
+        length, status = stop - start, 206
+    f = open(path, "rb")
+    f.seek(start)
+    resp = Response(wrapper(f, 1024 * 1024), status=status, direct_passthrough=True,
+                    mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream")
+    resp.headers["Content-Length"] = str(length)
+    resp.headers["Accept-Ranges"] = "bytes"
+    resp.headers["ETag"] = etag
+    resp.last_modified = st.st_mtime
+    if status == 206:
+        resp.headers["Content-Range"] = f"bytes {start}-{start + length - 1}/{size}"
+    _set_attachment(resp, name)
+    return resp
+
+
+def _send_download(path, download_name: str = None):
+    """Send a file the caller has already authorised, as an attachment."""
+    path = str(path)
+    name = download_name or os.path.basename(path)
+    if DELIVERY_MODE == "nginx":
+        uri = _accel_uri(path)
+        if uri:
+            resp = Response(mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream")
+            resp.headers["X-Accel-Redirect"] = uri
+            _set_attachment(resp, name)
+            return resp
+    wrapper = request.environ.get("wsgi.file_wrapper")
+    if wrapper is not None:
+        return _sendfile_response(path, name, wrapper)
+    return send_file(path, as_attachment=True, download_name=name, conditional=True)
+
+
+class _ZipSink:
+    """Write-only stream for zipfile. It has no tell/seek, so zipfile writes in
+    streaming mode (data descriptors after each entry); drain() hands back
+    whatever has been written since the last call."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def _stream_zip(paths: list, chunk_size: int = 1024 * 1024):
+    """Yield a ZIP_STORED archive of paths as it's built: nothing is staged on
+    disk, and entries or archives past 4 GiB get ZIP64 records automatically."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for fpath in paths:
+            zinfo = zipfile.ZipInfo.from_file(fpath, os.path.basename(fpath))
+            zinfo.compress_type = zipfile.ZIP_STORED
+            with open(fpath, "rb") as src, zf.open(zinfo, "w") as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()  # central directory
+
+
 @app.get("/download/<job_id>")
 def download(job_id):
+    _sync_shared_jobs([job_id])
     with jobs_lock:
         job = jobs.get(job_id)
     if not job:
@@ -5500,45 +8263,28 @@ def download(job_id):
     existing = [p for p in output_paths if p and os.path.exists(p) and _is_safe_path(p)]
 
     if len(existing) > 1:
-        total_size = sum(os.path.getsize(p) for p in existing)
-        if total_size > 2 * 1024 * 1024 * 1024:
-            abort(413)
         first_dir = os.path.dirname(existing[0])
         zip_name = (os.path.basename(first_dir) or "soundcloud_download") + ".zip"
-        tmp_dir = tempfile.mkdtemp()
-        zip_path = os.path.join(tmp_dir, zip_name)
-        try:
-            with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
-                for fpath in existing:
-                    zf.write(fpath, os.path.basename(fpath))
-        except Exception:
-            shutil.rmtree(tmp_dir, ignore_errors=True)
-            abort(500)
-
-        @after_this_request
-        def cleanup(response):
-            try:
-                shutil.rmtree(tmp_dir, ignore_errors=True)
-            except Exception:
-                pass
-            return response
-
-        return send_file(zip_path, as_attachment=True, download_name=zip_name)
+        resp = Response(_stream_zip(existing), mimetype="application/zip")
+        _set_attachment(resp, zip_name)
+        resp.headers["X-Accel-Buffering"] = "no"
+        return resp
 
     # Single-file fallback (existing behavior)
     if not job.get("file") and not job.get("output_path"):
         abort(404)
     target_path = job.get("output_path") or os.path.join(DOWNLOAD_DIR, job["file"])
     if target_path and os.path.exists(target_path) and _is_safe_path(target_path):
-        return send_from_directory(os.path.dirname(target_path), os.path.basename(target_path), as_attachment=True)
+        return _send_download(target_path)
     if job.get("file"):
         candidate = os.path.join(DOWNLOAD_DIR, os.path.basename(job["file"]))
         if os.path.exists(candidate) and _is_safe_path(candidate):
-            return send_from_directory(DOWNLOAD_DIR, os.path.basename(job["file"]), as_attachment=True)
+            return _send_download(candidate)
     abort(404)
 
 @app.get("/file/<job_id>")
 def download_single(job_id):
+    _sync_shared_jobs([job_id])
     with jobs_lock:
         job = jobs.get(job_id)
     if not job:
@@ -5546,21 +8292,42 @@ def download_single(job_id):
     path = job.get("output_path") or (job.get("output_paths") or [None])[0]
     if not path or not os.path.exists(path) or not _is_safe_path(path):
         abort(404)
-    return send_file(path, as_attachment=True)
+    return _send_download(path)
 
 @app.get("/history")
 def history():
     try:
-        limit = int(request.args.get("limit", "10"))
+        limit = max(1, min(int(request.args.get("limit", "10")), 200))
     except ValueError:
         limit = 10
-    items = load_history()[-limit:]
+    try:
+        before = int(request.args.get("before") or 0) or None
+    except ValueError:
+        before = None
+    items, next_before = query_history(
+        limit, before,
+        job_type=(request.args.get("type") or "").strip() or None,
+        final_status=(request.args.get("final_status") or "").strip() or None,
+    )
     for item in items:
         if item.get("output_path"):
             item["output_path"] = os.path.basename(item["output_path"])
         if item.get("output_paths"):
             item["output_paths"] = [os.path.basename(p) for p in item["output_paths"] if p]
-    return jsonify({"items": items[::-1]})
+    return jsonify({"items": items, "next_before": next_before})
+
+def _terminate_job(job_id: str):
+    """Cancel a running job in this process: flag it and stop its processes."""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if not job or job.get("status") != "running":
+            return
+        job["cancel_requested"] = True
+        job["status"] = "cancelled"
+        for proc in list(job.get("processes") or [job.get("process")]):
+            if proc and proc.poll() is None:
+                proc.terminate()
+
 
 @app.post("/cancel")
 def cancel():
@@ -5568,13 +8335,24 @@ def cancel():
     job_id = (data.get("job_id") or "").strip()
     if not job_id:
         return jsonify({"error": "job_id required"}), 400
+    if SHARED_QUEUE:
+        _sync_shared_jobs([job_id])
+        outcome = _shared_cancel(job_id)
+        if outcome:
+            with jobs_lock:
+                job = jobs.get(job_id)
+                if job is not None:
+                    job["status"] = "cancelled"
+                    if outcome == "removed":
+                        job["log"] = "Cancelled before start"
+                        job["finished_at"] = datetime.utcnow()
+            save_jobs()
+            return jsonify({"status": "cancelled"})
     removed = False
     with queue_cv:
-        for idx, jid in enumerate(list(job_queue)):
-            if jid == job_id:
-                job_queue.remove(jid)
-                removed = True
-                break
+        if job_id in job_queue:
+            job_queue.remove(job_id)
+            removed = True
     with jobs_lock:
         job = jobs.get(job_id)
         if not job:
@@ -5583,47 +8361,165 @@ def cancel():
             job["status"] = "cancelled"
             job["log"] = "Cancelled before start"
             _release_ip(job.get("client_ip"))
-        elif job.get("status") == "running":
-            proc = job.get("process")
-            job["cancel_requested"] = True
+        elif job.get("follows"):
+            # Detach only this requester; the shared run carries on for the others.
+            leader = jobs.get(job.pop("follows"))
+            if leader and job_id in leader.get("followers", []):
+                leader["followers"] = [f for f in leader["followers"] if f != job_id]
             job["status"] = "cancelled"
-            if proc and proc.poll() is None:
-                proc.terminate()
+            job["log"] = "Cancelled before start"
+            job["finished_at"] = datetime.utcnow()
+            _release_ip(job.get("client_ip"))
+        elif job.get("status") == "resolving":
+            # The resolver checks the status before queueing, so it just drops it.
+            job["status"] = "cancelled"
+            job["log"] = "Cancelled before start"
+            job["finished_at"] = datetime.utcnow()
+            _release_ip(job.get("client_ip"))
+        elif job.get("status") == "running":
+            _terminate_job(job_id)
         else:
             return jsonify({"error": "Job not cancellable"}), 400
     save_jobs()
+    if removed:
+        _settle_followers(job_id)
     return jsonify({"status": "cancelled"})
 
+# ---- Job log files ----
+# Log files are append-only, so readers work in byte offsets: a tail reads blocks
+# backwards from the end until it has enough lines, ?since=<offset> returns only
+# what was appended after an earlier response's "offset", and ?follow=1 streams
+# new lines as server-sent events whose ids are offsets (so a reconnecting
+# EventSource resumes where it left off).
+LOG_READ_BLOCK = 64 * 1024
+LOG_SINCE_MAX_BYTES = 1024 * 1024  # per ?since response; the client asks again from "offset"
+DEBUG_LOG_TAIL = 2000
+
+
+def _read_log_tail(path, n: int):
+    """Return (last n lines joined, end offset); n <= 0 means the whole file."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        if n <= 0:
+            f.seek(0)
+            return f.read(end).decode("utf-8", "replace").rstrip("\n"), end
+        pos, chunks, newlines = end, [], 0
+        # n lines need n+1 newlines in view (the last line normally ends with one).
+        while pos > 0 and newlines <= n:
+            step = min(LOG_READ_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            newlines += chunk.count(b"\n")
+    lines = b"".join(reversed(chunks)).decode("utf-8", "replace").splitlines()
+    return "\n".join(lines[-n:]), end
+
+
+def _read_log_since(path, offset: int, limit: int = LOG_SINCE_MAX_BYTES):
+    """Return (complete lines appended after offset, new offset). A trailing
+    partial line is left for the next read."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        if offset > end:
+            offset = 0  # file was replaced; start over
+        f.seek(offset)
+        data = f.read(min(limit, end - offset))
+    cut = data.rfind(b"\n") + 1
+    if cut == 0 and len(data) < limit:
+        return "", offset
+    if cut:
+        data = data[:cut]
+    return data.decode("utf-8", "replace").rstrip("\n"), offset + len(data)
+
+
+def _log_follow_stream(job_id: str, path, offset: int):
+    last_write = time.time()
+    while True:
+        with jobs_lock:
+            job = jobs.get(job_id)
+            finished = job is None or job.get("status") in _FINAL_STATUSES
+        try:
+            text, new_offset = _read_log_since(path, offset)
+        except OSError:
+            text, new_offset = "", offset
+        now = time.time()
+        if new_offset != offset:
+            offset = new_offset
+            data = json.dumps({"lines": text.split("\n")})
+            yield f"id: {offset}\nevent: log\ndata: {data}\n\n"
+            last_write = now
+            continue  # drain a large backlog before sleeping
+        if finished:
+            yield f"id: {offset}\nevent: end\ndata: {{}}\n\n"
+            return
+        if now - last_write >= SSE_KEEPALIVE:
+            yield ": keepalive\n\n"
+            last_write = now
+        time.sleep(SSE_TICK)
+
+
+def _log_owner(job_id: str) -> str:
+    """Id of the job whose log file holds job_id's output: a follower's leader."""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return job_id
+        return job.get("follows") or job.get("log_job_id") or job_id
+
+
 @app.get("/job-log/<job_id>")
 def job_log(job_id):
+    global _sse_streams
     if not re.fullmatch(r'[0-9a-f\-]{36}', job_id):
         abort(400)
     tail = request.args.get("tail", "200")
-    path = job_log_path(job_id)
+    path = job_log_path(_log_owner(job_id))
     if not path.exists():
         return jsonify({"error": "log not found"}), 404
     try:
         tail_n = int(tail)
     except ValueError:
         tail_n = 200
-    lines = path.read_text(encoding="utf-8").splitlines()
-    if tail_n > 0:
-        lines = lines[-tail_n:]
-    return jsonify({"log": "\n".join(lines)})
+    since = request.args.get("since") or request.headers.get("Last-Event-ID")
+    try:
+        since = max(0, int(since)) if since is not None else None
+    except ValueError:
+        since = None
+    if request.args.get("follow") == "1":
+        if since is None:
+            since = os.path.getsize(path)
+        with _sse_lock:
+            if _sse_streams >= SSE_MAX_STREAMS:
+                return jsonify({"error": "Too many open streams; use ?since= instead."}), 503
+            _sse_streams += 1
+        resp = Response(_log_follow_stream(job_id, path, since), mimetype="text/event-stream")
+        resp.call_on_close(_release_stream)
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Accel-Buffering"] = "no"
+        return resp
+    if since is not None:
+        text, offset = _read_log_since(path, since)
+    else:
+        text, offset = _read_log_tail(path, tail_n)
+    return jsonify({"log": text, "offset": offset})
 
 @app.get("/health")
 def health():
-    with jobs_lock:
-        running = sum(1 for j in jobs.values() if j.get("status") == "running")
-    with queue_cv:
-        qlen = len(job_queue)
-    return jsonify({"queue_length": qlen, "running": running, "version": VERSION})
+    running = _running_count()
+    qlen = _queued_count()
+    with resolve_cv:
+        resolving = len(resolve_queue) + len(_resolving_now)
+    return jsonify({"queue_length": qlen, "running": running, "resolving": resolving,
+                    "disk_used_gb": round(_disk_used_gb(), 3), "disk_cap_gb": DISK_CAP_GB,
+                    "token_api": _token_breaker.state, "role": ROLE,
+                    "version": VERSION, **_wait_stats()})
 
 @app.get("/admin")
 def admin_page():
     if not COOKIES_PASSWORD:
         abort(503)
-    return render_template_string(ADMIN_HTML)
+    return _render(ADMIN_HTML)
 
 
 @app.post("/upload-cookies")
@@ -5701,16 +8597,10 @@ def admin_stats():
     data = request.get_json(silent=True) or {}
     if not hmac.compare_digest(data.get("password", ""), COOKIES_PASSWORD):
         return jsonify({"error": "Invalid password"}), 403
-    history = load_history()
-    by_status: dict = {}
-    by_type: dict = {}
-    for item in history:
-        s = item.get("final_status", "unknown")
-        t = item.get("type", "unknown")
-        by_status[s] = by_status.get(s, 0) + 1
-        by_type[t] = by_type.get(t, 0) + 1
+    counts = _history_counts()
+    recent, _ = query_history(50)
     with jobs_lock:
-        running = sum(1 for j in jobs.values() if j.get("status") == "running")
+        running = jobs.count("running")
         active_jobs = [
             {
                 "job_id": jid,
@@ -5721,18 +8611,17 @@ def admin_stats():
                 "created_at": str(j.get("created_at", "")),
             }
             for jid, j in jobs.items()
-            if j.get("status") in ("running", "queued")
+            if j.get("status") in ("running", "queued", "resolving")
         ]
-    with queue_cv:
-        qlen = len(job_queue)
+    qlen = _queued_count()
     return jsonify({
         "version": VERSION,
         "running": running,
         "queue_length": qlen,
-        "total_history": len(history),
-        "by_status": by_status,
-        "by_type": by_type,
-        "recent": history[-50:][::-1],
+        "total_history": counts["total"],
+        "by_status": counts["by_status"],
+        "by_type": counts["by_type"],
+        "recent": recent,
         "active_jobs": active_jobs,
         "pageviews": _pageview_analytics(),
         "builds": _list_desktop_builds(),
@@ -5750,8 +8639,8 @@ def admin_clear_history():
     data = request.get_json(silent=True) or {}
     if not hmac.compare_digest(data.get("password", ""), COOKIES_PASSWORD):
         return jsonify({"error": "Invalid password"}), 403
-    with open(HISTORY_PATH, "w", encoding="utf-8") as f:
-        json.dump([], f)
+    with history_lock, _history_conn() as conn:
+        conn.execute("DELETE FROM history")
     return jsonify({"ok": True, "message": "History cleared"})
 
 
@@ -5767,15 +8656,7 @@ def token_unlock():
     if not token or not TOKEN_INTERNAL_SECRET:
         return jsonify({"valid": False, "reason": "invalid"})
     try:
-        body = json.dumps({"token": token}).encode()
-        req = urllib.request.Request(
-            f"{PAYMENT_APP_URL}/payment/api/access/internal/token/check",
-            data=body,
-            headers={"Content-Type": "application/json", "x-internal-secret": TOKEN_INTERNAL_SECRET, "x-forwarded-proto": "https"},
-            method="POST",
-        )
-        with urllib.request.urlopen(req, timeout=3) as resp:
-            result = json.loads(resp.read())
+        result = _token_check(token)
         if result.get("valid"):
             _remember_valid_token(token)
         return jsonify(result)
@@ -5794,12 +8675,14 @@ def admin_debug_job(job_id):
         abort(400)
     with jobs_lock:
         job = jobs.get(job_id)
+        if job:
+            job = {**job, "log": _log_text(job)}
     if not job:
         return jsonify({"error": "Unknown job"}), 404
     # Sanitize internal fields that aren't JSON-serializable.
     sanitized = {}
     for k, v in job.items():
-        if k in ("process", "cancel_requested"):
+        if k in ("process", "processes", "cancel_requested"):
             continue
         try:
             json.dumps(v, default=str)
@@ -5810,7 +8693,7 @@ def admin_debug_job(job_id):
     full_log = ""
     if log_path.exists():
         try:
-            full_log = log_path.read_text(encoding="utf-8", errors="replace")
+            full_log, _ = _read_log_tail(log_path, DEBUG_LOG_TAIL)
         except Exception:
             full_log = ""
     return jsonify({"job": json.loads(json.dumps(sanitized, default=str)), "full_log": full_log})
@@ -5851,18 +8734,13 @@ def admin_review_action(review_id, action):
 
 @app.before_request
 def _global_rate_limit():
-    if request.path.startswith(('/status/', '/health', '/static/')):
+    if request.path.startswith(('/status/', '/events/', '/health', '/static/')):
         return
-    ip = _client_ip()
-    now = time.time()
-    minute_ago = now - 60
-    with _global_rate_lock:
-        timestamps = _global_rate.setdefault(ip, deque())
-        while timestamps and timestamps[0] < minute_ago:
-            timestamps.popleft()
-        if len(timestamps) >= GLOBAL_RATE_PER_MIN:
-            return jsonify({"error": "Too many requests. Slow down."}), 429
-        timestamps.append(now)
+    allowed, retry_after = _global_limiter.allow(_client_ip())
+    if not allowed:
+        resp = jsonify({"error": "Too many requests. Slow down."})
+        resp.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+        return resp, 429
 
 
 @app.after_request
@@ -5893,14 +8771,47 @@ def add_security_headers(response):
     response.headers["Referrer-Policy"] = "no-referrer"
     return response
 
-# restore persisted jobs then kick off background threads
-restore_jobs_from_disk()
-dispatcher_thread = threading.Thread(target=dispatcher, daemon=True)
-dispatcher_thread.start()
-cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
-cleanup_thread.start()
+for _src in (HTML, ADMIN_HTML, _LEGAL_PAGE_TEMPLATE, _DESKTOP_REDEEM_HTML, _DESKTOP_TRIAL_HTML, _REVIEW_HTML):
+    _template(_src)
+
+# restore persisted jobs then kick off background threads for this ROLE
+_init_history_db()
+if ROLE != "worker":
+    restore_jobs_from_disk()
+    _disk_reconcile()  # before any job is admitted, so DISK_CAP_GB holds from the start
+if ROLE == "all":
+    worker_threads = [
+        threading.Thread(target=_job_worker, daemon=True, name=f"job-worker-{i}")
+        for i in range(max(1, MAX_CONCURRENT_JOBS))
+    ]
+    for _t in worker_threads:
+        _t.start()
+if ROLE != "worker":
+    resolver_threads = [
+        threading.Thread(target=_resolver_worker, daemon=True, name=f"resolver-{i}")
+        for i in range(RESOLVE_WORKERS)
+    ]
+    for _t in resolver_threads:
+        _t.start()
+if ROLE != "web" and _embedded_pool is not None:
+    threading.Thread(target=_embedded_pool.prewarm, daemon=True).start()
+if ROLE == "web":
+    threading.Thread(target=_shared_sync_worker, daemon=True, name="shared-sync").start()
+if ROLE == "worker":
+    threading.Thread(target=_shared_heartbeat, daemon=True, name="lease-heartbeat").start()
+else:
+    threading.Thread(target=_pageview_writer, daemon=True, name="pageview-writer").start()
+    atexit.register(_flush_pageviews)
+    threading.Thread(target=_expiry_worker, daemon=True, name="expiry").start()
+    cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
+    cleanup_thread.start()
 
 if __name__ == "__main__":
-    host = os.environ.get("FLASK_HOST", "127.0.0.1")
-    port = int(os.environ.get("PORT", "5055"))
-    app.run(host=host, port=port, debug=False, use_reloader=False)
+    if ROLE == "worker":
+        for _i in range(1, max(1, MAX_CONCURRENT_JOBS)):
+            threading.Thread(target=_shared_worker_loop, daemon=True, name=f"claim-loop-{_i}").start()
+        _shared_worker_loop()
+    else:
+        host = os.environ.get("FLASK_HOST", "127.0.0.1")
+        port = int(os.environ.get("PORT", "5055"))
+        app.run(host=host, port=port, debug=False, use_reloader=False)
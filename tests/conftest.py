@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+
+import pytest
+
+# app.py reads its configuration at import time, so point it at a scratch
+# directory before the first import.
+_root = tempfile.mkdtemp(prefix="yt-ui-tests-")
+os.environ.setdefault("DOWNLOAD_DIR", os.path.join(_root, "downloads"))
+os.environ.setdefault("YT_UI_STATE_DIR", os.path.join(_root, "state"))
+os.environ.setdefault("YT_UI_GLOBAL_RATE_PER_MIN", "100000")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    return app_module
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def done_job():
+    """Register a finished job serving the given files; returns its id."""
+    def make(*paths):
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        with app_module.jobs_lock:
+            app_module.jobs[job_id] = {
+                "status": "done",
+                "created_at": now,
+                "finished_at": now,
+                "file": os.path.basename(paths[-1]),
+                "output_path": paths[-1],
+                "output_paths": list(paths),
+            }
+        return job_id
+    return make
+
+
+FAKE_YTDLP = r'''#!/usr/bin/env python3
+import os, re, sys, time
+args = sys.argv[1:]
+out = args[args.index("-o") + 1]
+print("[download]  50.0% of 1.00MiB", flush=True)
+time.sleep(float(os.environ.get("FAKE_YTDLP_DELAY", "0.3")))
+name = out.replace("%(title).120s", "Title").replace("%(id)s", re.sub(r"\W", "", args[-1])[-11:])
+name = re.sub(r"%\([^)]*\)[0-9.]*s", "x", name.replace("%(ext)s", "mp3"))
+os.makedirs(os.path.dirname(name), exist_ok=True)
+with open(name, "wb") as f:
+    f.write(b"x" * 1000)
+print(os.path.abspath(name), flush=True)
+'''
+
+
+@pytest.fixture
+def fake_ytdlp(tmp_path, monkeypatch):
+    """Stand-in yt-dlp that 'downloads' a 1000-byte file after a short delay."""
+    script = tmp_path / "yt-dlp"
+    script.write_text(FAKE_YTDLP)
+    script.chmod(0o755)
+    monkeypatch.setattr(app_module, "YT_DLP_BIN", str(script))
+    monkeypatch.setattr(app_module, "is_valid_url", lambda url: True)
+    return script
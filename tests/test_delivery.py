@@ -0,0 +1,69 @@
+import os
+from urllib.parse import quote
+
+import pytest
+from werkzeug.wsgi import FileWrapper
+
+NAME = "Björk – 日本 [abc].mp3"
+
+
+def _write(app, *parts, data=b"x" * 1000):
+    path = os.path.join(app.DOWNLOAD_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _assert_rfc5987(disposition: str, name: str):
+    disposition.encode("latin-1")  # what gunicorn requires of every header value
+    assert disposition.startswith("attachment;")
+    assert "filename*=UTF-8''" in disposition
+    assert disposition.endswith(quote(name, safe="!#$&+-.^_`|~"))
+
+
+@pytest.mark.parametrize("wrapper", [None, FileWrapper])
+def test_download_non_ascii_filename(app, client, done_job, wrapper):
+    job_id = done_job(_write(app, NAME))
+    environ = {"wsgi.file_wrapper": wrapper} if wrapper else {}
+    resp = client.get(f"/download/{job_id}", environ_base=environ)
+    assert resp.status_code == 200
+    assert resp.data == b"x" * 1000
+    _assert_rfc5987(resp.headers["Content-Disposition"], NAME)
+    resp.close()
+
+
+def test_download_non_ascii_filename_ranged(app, client, done_job):
+    job_id = done_job(_write(app, "ranged " + NAME))
+    resp = client.get(f"/download/{job_id}", headers={"Range": "bytes=10-19"},
+                      environ_base={"wsgi.file_wrapper": FileWrapper})
+    assert resp.status_code == 206
+    assert resp.headers["Content-Length"] == "10"
+    _assert_rfc5987(resp.headers["Content-Disposition"], "ranged " + NAME)
+    resp.close()
+
+
+def test_download_non_ascii_filename_x_accel(app, client, done_job, monkeypatch):
+    monkeypatch.setattr(app, "DELIVERY_MODE", "nginx")
+    job_id = done_job(_write(app, "accel " + NAME))
+    resp = client.get(f"/download/{job_id}")
+    assert resp.status_code == 200
+    assert resp.headers["X-Accel-Redirect"].startswith("/_protected/downloads/")
+    _assert_rfc5987(resp.headers["Content-Disposition"], "accel " + NAME)
+
+
+def test_download_ascii_filename_unchanged(app, client, done_job):
+    job_id = done_job(_write(app, "plain [abc].mp3"))
+    resp = client.get(f"/download/{job_id}")
+    assert resp.headers["Content-Disposition"] == 'attachment; filename="plain [abc].mp3"'
+    resp.close()
+
+
+def test_zip_non_ascii_directory(app, client, done_job):
+    a = _write(app, "Café 日本", "one.mp3")
+    b = _write(app, "Café 日本", "two.mp3")
+    job_id = done_job(a, b)
+    resp = client.get(f"/download/{job_id}")
+    assert resp.status_code == 200
+    _assert_rfc5987(resp.headers["Content-Disposition"], "Café 日本.zip")
+    assert resp.data[:2] == b"PK"
@@ -0,0 +1,96 @@
+import threading
+import time
+import uuid
+from datetime import datetime
+
+WATCHERS = 300
+
+
+def _running_job(app):
+    job_id = str(uuid.uuid4())
+    with app.jobs_lock:
+        app.jobs[job_id] = {"status": "running", "phase": "Downloading", "progress_pct": 0,
+                            "created_at": datetime.utcnow(), "log": "start"}
+    return job_id
+
+
+def test_hundreds_of_watchers_sleep_until_the_job_changes(app, client, monkeypatch):
+    monkeypatch.setattr(app, "SSE_MAX_STREAMS", WATCHERS + 10)
+    job_id = _running_job(app)
+
+    iterations = [0]
+    real_ticks = app._job_watchers.ticks
+
+    def counting_ticks(job_ids):
+        iterations[0] += 1  # one per stream loop iteration
+        return real_ticks(job_ids)
+
+    monkeypatch.setattr(app._job_watchers, "ticks", counting_ticks)
+
+    started = threading.Barrier(WATCHERS + 1)
+    received = [[] for _ in range(WATCHERS)]
+
+    def watch(i):
+        resp = client.get(f"/events/{job_id}", buffered=False)
+        chunks = iter(resp.response)
+        received[i].append(next(chunks))
+        started.wait()
+        for chunk in chunks:
+            received[i].append(chunk)
+        resp.close()
+
+    threads = [threading.Thread(target=watch, args=(i,), daemon=True) for i in range(WATCHERS)]
+    for t in threads:
+        t.start()
+    started.wait(timeout=30)
+
+    # Idle: no stream should wake while nothing changes.
+    before = iterations[0]
+    time.sleep(1.0)
+    assert iterations[0] - before <= WATCHERS // 10
+
+    with app.jobs_lock:
+        app.jobs[job_id]["progress_pct"] = 50
+        app._log_append(app.jobs[job_id], "halfway")
+    deadline = time.time() + 10
+    while time.time() < deadline and not all(b'"progress_pct": 50' in b"".join(r) for r in received):
+        time.sleep(0.05)
+    assert all(b'"progress_pct": 50' in b"".join(r) for r in received)
+    assert all(b"halfway" in b"".join(r) for r in received)
+
+    with app.jobs_lock:
+        app.jobs[job_id]["status"] = "done"
+    for t in threads:
+        t.join(timeout=10)
+    assert not any(t.is_alive() for t in threads)
+    assert all(b'"status": "done"' in b"".join(r) for r in received)
+    assert app._job_watchers._ticks.get(job_id) is None  # every stream unwatched
+
+
+def test_queued_watcher_wakes_when_queue_moves(app, client):
+    job_id = str(uuid.uuid4())
+    ahead = str(uuid.uuid4())
+    with app.queue_cv, app.jobs_lock:
+        app.jobs[ahead] = {"status": "queued", "created_at": datetime.utcnow()}
+        app.jobs[job_id] = {"status": "queued", "created_at": datetime.utcnow()}
+        app.job_queue.append(ahead)
+        app.job_queue.append(job_id)
+    # Keep the pool from running them while the stream watches.
+    resp = client.get(f"/events/{job_id}", buffered=False)
+    chunks = iter(resp.response)
+    first = next(chunks)
+    assert b'"queue_position"' in first
+
+    def move():
+        time.sleep(0.3)
+        with app.queue_cv, app.jobs_lock:
+            app.job_queue.remove(ahead)
+            app.jobs[ahead]["status"] = "cancelled"
+    threading.Thread(target=move, daemon=True).start()
+    t0 = time.time()
+    second = next(chunks)
+    assert time.time() - t0 < 5
+    assert b'"queue_position"' in second
+    with app.jobs_lock:
+        app.jobs[job_id]["status"] = "cancelled"
+    resp.close()
@@ -0,0 +1,59 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+FAILING_YTDLP = r'''#!/usr/bin/env python3
+import os, sys
+args = sys.argv[1:]
+dest = args[args.index("-o") + 1].replace("%(title).120s", "Broken").replace("%(id)s", "partial01")
+dest = dest.replace("%(ext)s", "f140.m4a")
+os.makedirs(os.path.dirname(dest), exist_ok=True)
+print("[download] Destination: " + dest, flush=True)
+for suffix in (".part", ".part-Frag1", ".ytdl"):
+    with open(dest + suffix, "wb") as f:
+        f.write(b"x" * 10)
+print("ERROR: unable to download video data: HTTP Error 403", flush=True)
+sys.exit(1)
+'''
+
+
+def _wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(0.02)
+    raise AssertionError("timed out")
+
+
+def test_failed_job_partials_expire_with_its_files(app, client, tmp_path, monkeypatch):
+    script = tmp_path / "yt-dlp"
+    script.write_text(FAILING_YTDLP)
+    script.chmod(0o755)
+    monkeypatch.setattr(app, "YT_DLP_BIN", str(script))
+    monkeypatch.setattr(app, "is_valid_url", lambda url: True)
+    monkeypatch.setattr(app, "FILE_TTL_DAYS", 1.0)
+
+    job_id = client.post("/start", json={"url": "https://www.youtube.com/watch?v=partial01", "type": "audio"},
+                         environ_base={"REMOTE_ADDR": "10.7.0.1"}).json["job_id"]
+    job = _wait_for(lambda: (lambda j: j if j and j.get("finished_at") else None)(app.jobs.get(job_id)))
+    assert job["status"] == "error"
+    dest = os.path.join(app.DOWNLOAD_DIR, "Broken [partial01].f140.m4a")
+    assert job["partial_paths"] == [dest]
+    leftovers = [dest + s for s in (".part", ".part-Frag1", ".ytdl")]
+    assert all(os.path.exists(p) for p in leftovers)
+    bystander = os.path.join(app.DOWNLOAD_DIR, "Broken [partial01].mp3")
+    with open(bystander, "wb") as f:
+        f.write(b"y")
+
+    # Not due yet: nothing goes.
+    app._run_expiry([(0, 0, "files", job_id)])
+    assert all(os.path.exists(p) for p in leftovers)
+
+    with app.jobs_lock:
+        app.jobs[job_id]["finished_at"] = datetime.utcnow() - timedelta(days=2)
+    app._run_expiry([(0, 0, "files", job_id)])
+    assert not any(os.path.exists(p) for p in leftovers)
+    assert os.path.exists(bystander)
+    os.remove(bystander)
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def cache_on(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "CACHE_MAX_GB", 1.0)
+    monkeypatch.setattr(app, "CACHE_DIR", tmp_path / "media-cache")
+    app._init_cache_db()
+
+
+def _seed(app, url):
+    key = app._cache_key(url, "audio", "m4a", True)
+    src = os.path.join(app.DOWNLOAD_DIR, "seed", "Title [cachehit].mp3")
+    os.makedirs(os.path.dirname(src), exist_ok=True)
+    with open(src, "wb") as f:
+        f.write(b"x" * 100)
+    app._cache_store(key, [src], {"total_items": 0})
+    return key
+
+
+def test_cache_hit_materializes_per_job(app, client, cache_on):
+    url = "https://www.youtube.com/watch?v=cachehit01"
+    _seed(app, url)
+    first = client.post("/start", json={"url": url, "type": "audio"},
+                        environ_base={"REMOTE_ADDR": "10.5.0.1"}).json
+    second = client.post("/start", json={"url": url, "type": "audio"},
+                         environ_base={"REMOTE_ADDR": "10.5.0.2"}).json
+    assert first["status"] == second["status"] == "done"
+    p1 = app.jobs[first["job_id"]]["output_path"]
+    p2 = app.jobs[second["job_id"]]["output_path"]
+    assert p1 != p2
+    assert p1.startswith(os.path.join(app.DOWNLOAD_DIR, first["job_id"]) + os.sep)
+
+
+def test_rate_limited_cache_hit_touches_nothing(app, client, cache_on, monkeypatch):
+    url = "https://www.youtube.com/watch?v=cachehit02"
+    _seed(app, url)
+    materialized = []
+    monkeypatch.setattr(app, "_check_ip_limits", lambda ip: ("Too many", 429))
+    monkeypatch.setattr(app, "_cache_materialize", lambda *a: materialized.append(a) or [])
+    before = set(os.listdir(app.DOWNLOAD_DIR))
+    resp = client.post("/start", json={"url": url, "type": "audio"},
+                       environ_base={"REMOTE_ADDR": "10.5.0.3"})
+    assert resp.status_code == 429
+    assert not materialized
+    assert set(os.listdir(app.DOWNLOAD_DIR)) == before
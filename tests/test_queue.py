@@ -0,0 +1,16 @@
+import uuid
+from datetime import datetime, timedelta
+
+
+def test_wait_seconds_measured_from_created_at(app, fake_ytdlp, monkeypatch):
+    monkeypatch.setenv("FAKE_YTDLP_DELAY", "0")
+    job_id = str(uuid.uuid4())
+    with app.jobs_lock:
+        app.jobs[job_id] = {"status": "queued", "type": "audio",
+                            "url": "https://www.youtube.com/watch?v=waitfrom01",
+                            "created_at": datetime.utcnow() - timedelta(seconds=5)}
+    app.run_job(job_id)
+    job = app.jobs[job_id]
+    assert job["status"] == "done"
+    assert 5 <= job["wait_seconds"] < 30
+    assert app._wait_samples[-1] == job["wait_seconds"]
@@ -0,0 +1,22 @@
+def _allowed_times(app, monkeypatch, limiter, seconds, step=10):
+    clock = [1_000_000.0]
+    monkeypatch.setattr(app.time, "time", lambda: clock[0])
+    allowed = []
+    for t in range(0, seconds, step):
+        clock[0] = 1_000_000.0 + t
+        while limiter.allow("10.8.0.1")[0]:
+            allowed.append(t)
+    return allowed
+
+
+def test_hourly_limit_never_exceeds_rate_in_any_hour(app, monkeypatch):
+    limiter = app._GCRALimiter(app._MemoryRateStore(), "h", 20, 3600, burst=10)
+    allowed = _allowed_times(app, monkeypatch, limiter, 4 * 3600)
+    assert allowed[:10] == [0] * 10 and allowed[10] > 0
+    assert sum(1 for t in allowed if t < 3600) == 20
+    for start in range(0, 3 * 3600, 10):
+        assert sum(1 for t in allowed if start <= t < start + 3600) <= 20
+
+
+def test_hourly_limiter_uses_configured_burst(app):
+    assert app._hourly_limiter.tolerance == app._hourly_limiter.interval * (app.PER_IP_BURST - 1)
@@ -0,0 +1,43 @@
+import time
+
+
+def _wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(0.02)
+    raise AssertionError("timed out")
+
+
+def test_follower_not_final_before_settle(app, client, fake_ytdlp, monkeypatch):
+    url = "https://www.youtube.com/watch?v=settlewin01"
+    leader = client.post("/start", json={"url": url, "type": "audio"},
+                         environ_base={"REMOTE_ADDR": "10.6.0.1"}).json["job_id"]
+    follower = client.post("/start", json={"url": url, "type": "audio"},
+                           environ_base={"REMOTE_ADDR": "10.6.0.2"}).json["job_id"]
+    _wait_for(lambda: app.jobs.get(follower, {}).get("follows") == leader)
+
+    # append_history runs in the leader's finally after its final status is
+    # published and before _settle_followers: poll the follower right there.
+    seen = {}
+    original = app.append_history
+
+    def spy(record):
+        if record.get("job_id") == leader and "status" not in seen:
+            seen["leader"] = client.get(f"/status/{leader}").json["status"]
+            seen["status"] = client.get(f"/status/{follower}").json["status"]
+        return original(record)
+
+    monkeypatch.setattr(app, "append_history", spy)
+    _wait_for(lambda: "status" in seen)
+    assert seen["leader"] == "done"
+    assert seen["status"] not in ("done", "error", "cancelled")
+
+    final = _wait_for(lambda: (lambda j: j if j["status"] == "done" else None)(
+        client.get(f"/status/{follower}").json))
+    assert final["output_paths"]
+    resp = client.get(f"/download/{follower}")
+    assert resp.status_code == 200
+    resp.close()